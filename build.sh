@@ -6,19 +6,25 @@ echo "========================================="
 echo "Starting Render Build Process"
 echo "========================================="
 
-echo "Step 1/5: Upgrading pip..."
+echo "Step 1/7: Upgrading pip..."
 pip install --upgrade pip
 
-echo "Step 2/5: Installing dependencies..."
+echo "Step 2/7: Installing dependencies..."
 pip install -r requirements.txt
 
-echo "Step 3/5: Collecting static files..."
+echo "Step 3/7: Collecting static files..."
 python manage.py collectstatic --no-input --clear
 
-echo "Step 4/5: Running database migrations..."
+echo "Step 4/7: Running database migrations..."
 python manage.py migrate --no-input
 
-echo "Step 5/5: Creating admin user..."
+echo "Step 5/7: Creating cache table (used when CACHE_URL=db://...)..."
+python manage.py createcachetable
+
+echo "Step 6/7: Checking deployment settings..."
+python manage.py check --deploy
+
+echo "Step 7/7: Creating admin user..."
 python manage.py ensure_admin || echo "Warning: Could not create admin user automatically. You may need to create one manually."
 
 echo "========================================="
@@ -1,16 +1,22 @@
 from django.contrib import admin
 from django.contrib.admin import AdminSite
+from django.contrib.admin.views.main import ChangeList
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.models import User
 from django.utils.html import format_html
 from django.urls import reverse, path
-from django.shortcuts import render
-from django.http import JsonResponse
+from django.shortcuts import get_object_or_404, render
+from django.core.exceptions import PermissionDenied
+from django.http import HttpResponse, JsonResponse
+from django.db.models import Count, Max, Prefetch, Q
 from django.views.decorators.csrf import csrf_exempt
 from django.utils import timezone
-from datetime import timedelta
+from datetime import date, datetime, time, timedelta
 from allauth.socialaccount.models import SocialAccount, SocialApp, SocialToken
-from .models import Entry, SiteConfiguration
+from .models import ActivityRollup, Entry, RequestProfile, SiteConfiguration
+from . import search
+from .metrics import REGISTRY
+from .stats import activity_series, snapshot
 import json
 
 
@@ -28,35 +34,16 @@ class CustomAdminSite(AdminSite):
         # Get site configuration
         site_config = SiteConfiguration.load()
         
-        # Calculate statistics
-        total_users = User.objects.count()
-        total_entries = Entry.objects.count()
-        google_users = SocialAccount.objects.filter(provider='google').values('user').distinct().count()
-        
-        # Today's activity
-        today = timezone.now().date()
-        today_start = timezone.make_aware(timezone.datetime.combine(today, timezone.datetime.min.time()))
-        
-        new_users_today = User.objects.filter(date_joined__gte=today_start).count()
-        entries_today = Entry.objects.filter(created_at__gte=today_start).count()
-        
-        # Active users today (created entries today)
-        active_users_today = Entry.objects.filter(
-            created_at__gte=today_start
-        ).values('user').distinct().count()
+        # Precomputed counters (journal/stats.py), not table scans
+        stats = snapshot()
         
         # Recent entries (last 10)
-        recent_entries = Entry.objects.select_related('user').order_by('-created_at')[:10]
+        recent_entries = Entry.objects.summary().select_related('user').order_by('-created_at')[:10]
         
         # Add to context
         extra_context.update({
             'site_config': site_config,
-            'total_users': total_users,
-            'total_entries': total_entries,
-            'google_users': google_users,
-            'new_users_today': new_users_today,
-            'entries_today': entries_today,
-            'active_users_today': active_users_today,
+            **stats,
             'recent_entries': recent_entries,
         })
         
@@ -68,6 +55,10 @@ class CustomAdminSite(AdminSite):
         custom_urls = [
             path('toggle-maintenance/', self.admin_view(self.toggle_maintenance), name='toggle_maintenance'),
             path('get-stats/', self.admin_view(self.get_stats), name='get_stats'),
+            path('activity/', self.admin_view(self.activity), name='activity'),
+            path('metrics/', self.admin_view(self.metrics), name='metrics'),
+            path('profiles/<int:profile_id>/download/', self.admin_view(self.download_profile),
+                 name='request_profile_download'),
         ]
         return custom_urls + urls
     
@@ -78,8 +69,9 @@ class CustomAdminSite(AdminSite):
                 data = json.loads(request.body)
                 maintenance_mode = data.get('maintenance_mode', False)
                 
-                # Update site configuration
-                config = SiteConfiguration.load()
+                # Update site configuration; save() refreshes the shared
+                # cache so every worker sees the flip within its local TTL.
+                config = SiteConfiguration.load_for_update()
                 config.maintenance_mode = maintenance_mode
                 config.save()
                 
@@ -98,23 +90,106 @@ class CustomAdminSite(AdminSite):
     
     def get_stats(self, request):
         """AJAX endpoint to get updated statistics"""
-        total_users = User.objects.count()
-        total_entries = Entry.objects.count()
-        google_users = SocialAccount.objects.filter(provider='google').values('user').distinct().count()
-        
-        today = timezone.now().date()
-        today_start = timezone.make_aware(timezone.datetime.combine(today, timezone.datetime.min.time()))
-        active_users_today = Entry.objects.filter(
-            created_at__gte=today_start
-        ).values('user').distinct().count()
-        
+        stats = snapshot()
         return JsonResponse({
-            'total_users': total_users,
-            'total_entries': total_entries,
-            'google_users': google_users,
-            'active_users_today': active_users_today,
+            'total_users': stats['total_users'],
+            'total_entries': stats['total_entries'],
+            'google_users': stats['google_users'],
+            'active_users_today': stats['active_users_today'],
         })
 
+    def check_profile_access(self, request):
+        """Performance data is for staff who may view request profiles."""
+        if not self._registry[RequestProfile].has_view_permission(request):
+            raise PermissionDenied
+
+    def metrics(self, request):
+        """Per-view request histograms in the Prometheus text format"""
+        self.check_profile_access(request)
+        return HttpResponse(REGISTRY.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+    def download_profile(self, request, profile_id):
+        """A stored request profile as a .prof file (pstats / snakeviz)"""
+        self.check_profile_access(request)
+        profile = get_object_or_404(RequestProfile, pk=profile_id)
+        response = HttpResponse(bytes(profile.stats), content_type='application/octet-stream')
+        response['Content-Disposition'] = f'attachment; filename="request-{profile.pk}.prof"'
+        return response
+
+
+    # Longest range the activity view will chart in one go
+    ACTIVITY_MAX_BUCKETS = 2000
+    ACTIVITY_METRICS = [
+        ('entries_created', 'Entries Created'),
+        ('active_users', 'Active Users'),
+        ('new_signups', 'New Signups'),
+        ('bytes_written', 'Characters Written'),
+    ]
+
+    def activity(self, request):
+        """Chart hourly/daily activity rollups over an arbitrary date range"""
+        period = request.GET.get('period', ActivityRollup.PERIOD_DAY)
+        today = timezone.localdate()
+        default_days = 2 if period == ActivityRollup.PERIOD_HOUR else 30
+        error = None
+        try:
+            if period not in dict(ActivityRollup.PERIOD_CHOICES):
+                raise ValueError(f"Unknown period '{period}'")
+            end_date = date.fromisoformat(request.GET['end']) if request.GET.get('end') else today
+            start_date = (date.fromisoformat(request.GET['start']) if request.GET.get('start')
+                          else end_date - timedelta(days=default_days - 1))
+            if start_date > end_date:
+                raise ValueError('Start date is after end date')
+            start = timezone.make_aware(datetime.combine(start_date, time.min))
+            end = timezone.make_aware(datetime.combine(end_date + timedelta(days=1), time.min))
+            span = (end - start) / (timedelta(hours=1) if period == ActivityRollup.PERIOD_HOUR else timedelta(days=1))
+            if span > self.ACTIVITY_MAX_BUCKETS:
+                raise ValueError(f'At most {self.ACTIVITY_MAX_BUCKETS} {period}s per chart')
+        except ValueError as e:
+            error = str(e)
+        except OverflowError:  # e.g. the day after 9999-12-31
+            error = 'Date out of range'
+
+        if request.GET.get('format') == 'json':
+            if error:
+                return JsonResponse({'status': 'error', 'message': error}, status=400)
+            return JsonResponse({
+                'period': period,
+                'buckets': [
+                    {'start': r.bucket_start, **{m: getattr(r, m) for m, _ in self.ACTIVITY_METRICS}}
+                    for r in activity_series(period, start, end)
+                ],
+            })
+
+        charts = []
+        if not error:
+            series = activity_series(period, start, end)
+            for metric, label in self.ACTIVITY_METRICS:
+                values = [getattr(r, metric) for r in series]
+                peak = max(values, default=0) or 1
+                charts.append({
+                    'label': label,
+                    'total': sum(values),
+                    'peak': max(values, default=0),
+                    'bars': [
+                        {'start': r.bucket_start, 'value': v, 'height': round(v * 100 / peak, 1)}
+                        for r, v in zip(series, values)
+                    ],
+                })
+
+        context = {
+            **self.each_context(request),
+            'title': 'Activity Trends',
+            'period': period,
+            'periods': ActivityRollup.PERIOD_CHOICES,
+            'start': request.GET.get('start', '') if error else start_date.isoformat(),
+            'end': request.GET.get('end', '') if error else end_date.isoformat(),
+            'charts': charts,
+            'error': error,
+            'last_rollup': ActivityRollup.objects.filter(period=period).aggregate(last=Max('bucket_start'))['last'],
+        }
+        return render(request, 'admin/activity.html', context)
+
 
 # Use custom admin site
 admin_site = CustomAdminSite(name='admin')
@@ -145,10 +220,19 @@ class CustomUserAdmin(BaseUserAdmin):
     ordering = ('-date_joined',)
     inlines = [SocialAccountInline]
     
+    def get_queryset(self, request):
+        """Count entries and load social accounts up front, not once per row"""
+        return super().get_queryset(request).annotate(
+            entry_total=Count('entries', distinct=True),
+        ).prefetch_related(
+            Prefetch('socialaccount_set', queryset=SocialAccount.objects.only('id', 'user_id', 'provider')),
+        )
+    
     def entry_count(self, obj):
         """Display number of journal entries"""
-        return obj.entries.count()
+        return obj.entry_total
     entry_count.short_description = "Journals"
+    entry_count.admin_order_field = 'entry_total'
     
     def get_social_accounts(self, obj):
         """Display linked social accounts with icons"""
@@ -172,11 +256,19 @@ class CustomUserAdmin(BaseUserAdmin):
     get_social_accounts.short_description = "Login Method"
 
 
+class EntryChangeList(ChangeList):
+    def get_queryset(self, request, exclude_parameters=None):
+        # The list shows none of the content; the change form still loads it.
+        return super().get_queryset(request, exclude_parameters).summary()
+
+
 class EntryAdmin(admin.ModelAdmin):
     """Simplified Entry admin with essential info"""
     list_display = ('title', 'user_email', 'created_at', 'ip_address')
     list_filter = ('created_at',)
-    search_fields = ('title', 'content', 'user__email')
+    list_select_related = ('user',)
+    # Title/content go through the full-text index in get_search_results
+    search_fields = ('user__email',)
     readonly_fields = ('created_at', 'updated_at', 'ip_address')
     ordering = ('-created_at',)
     
@@ -189,6 +281,17 @@ class EntryAdmin(admin.ModelAdmin):
         }),
     )
     
+    def get_changelist(self, request, **kwargs):
+        return EntryChangeList
+
+    def get_search_results(self, request, queryset, search_term):
+        """Match title/content via the full-text index instead of ILIKE scans"""
+        if not search_term:
+            return super().get_search_results(request, queryset, search_term)
+        matches = search.filter_entries(Entry.objects.all(), search_term).values('pk')
+        queryset = queryset.filter(Q(pk__in=matches) | Q(user__email__icontains=search_term))
+        return queryset, False
+    
     def user_email(self, obj):
         """Display user's email"""
         return obj.user.email if obj.user else '-'
@@ -200,7 +303,7 @@ admin_site.register(Entry, EntryAdmin)
 
 class SiteConfigurationAdmin(admin.ModelAdmin):
     """Simple site configuration admin"""
-    list_display = ('site_name', 'maintenance_mode', 'allow_registration')
+    list_display = ('site_name', 'maintenance_mode', 'allow_registration', 'profile_sample_rate')
     
     def has_add_permission(self, request):
         # Only allow one instance
@@ -210,6 +313,44 @@ class SiteConfigurationAdmin(admin.ModelAdmin):
 admin_site.register(SiteConfiguration, SiteConfigurationAdmin)
 
 
+class RequestProfileAdmin(admin.ModelAdmin):
+    """Browse and download stored cProfile runs"""
+    list_display = ('created_at', 'method', 'path', 'view_name', 'status_code', 'duration_display', 'trigger', 'user', 'download_link')
+    list_filter = ('trigger', 'method', 'view_name')
+    list_select_related = ('user',)
+    search_fields = ('path', 'view_name')
+    date_hierarchy = 'created_at'
+    fields = ('created_at', 'user', 'method', 'path', 'view_name', 'status_code', 'duration_display', 'trigger', 'download_link', 'summary_display')
+    readonly_fields = fields
+
+    def get_queryset(self, request):
+        # The raw stats can be large; the changelist never needs them.
+        return super().get_queryset(request).defer('stats')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def duration_display(self, obj):
+        return f"{obj.duration_ms:.1f} ms"
+    duration_display.short_description = "Duration"
+    duration_display.admin_order_field = 'duration_ms'
+
+    def download_link(self, obj):
+        url = reverse('admin:request_profile_download', args=[obj.pk])
+        return format_html('<a href="{}">Download .prof</a>', url)
+    download_link.short_description = "Profile"
+
+    def summary_display(self, obj):
+        return format_html('<pre style="white-space: pre; overflow-x: auto;">{}</pre>', obj.summary)
+    summary_display.short_description = "Top functions (cumulative)"
+
+
+admin_site.register(RequestProfile, RequestProfileAdmin)
+
+
 # Register User admin with custom admin site
 admin_site.register(User, CustomUserAdmin)
 
@@ -219,6 +360,7 @@ class CustomSocialAccountAdmin(admin.ModelAdmin):
     """Detailed social account information admin"""
     list_display = ('user_email', 'provider', 'uid', 'get_profile_picture', 'date_joined')
     list_filter = ('provider', 'date_joined')
+    list_select_related = ('user',)
     search_fields = ('user__email', 'uid', 'extra_data')
     readonly_fields = (
         'user', 'provider', 'uid', 'date_joined', 'last_login',
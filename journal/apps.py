@@ -3,3 +3,9 @@ from django.apps import AppConfig
 
 class JournalConfig(AppConfig):
     name = 'journal'
+
+    def ready(self):
+        # Connects the dashboard counters', search index's, journal
+        # versions' and revision history's signal handlers.
+        from . import revisions, search, stats, versions  # noqa: F401
+        from . import checks  # noqa: F401
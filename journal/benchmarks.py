@@ -0,0 +1,369 @@
+"""Helpers shared by the benchmark management commands.
+
+Benchmarks run against a throwaway test database, never the configured one,
+so they are safe to point at a production settings module.
+
+The endpoint suite at the bottom (``SCENARIOS``, ``run_suite``,
+``compare``) backs ``manage.py run_benchmarks``. Every scenario is a
+plain request, so it runs in-process through the test client or over
+HTTP against a local gunicorn.
+"""
+import json
+import math
+import os
+import random
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from urllib.parse import quote
+
+import requests
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils.crypto import get_random_string
+
+from . import versions
+from .models import Entry
+
+WORDS = (
+    "today morning walk coffee friends work meeting idea project family dinner "
+    "book reading music rain sunshine tired happy grateful plan weekend travel "
+    "garden city train notes thought memory dream focus learn write journal"
+).split()
+
+
+@contextmanager
+def benchmark_database(verbosity=0, shared=False):
+    """Create a fresh test database for the duration of the block.
+
+    ``shared`` puts a SQLite test database in a file instead of memory, so
+    another process (gunicorn) can open it too.
+    """
+    old_name = connection.settings_dict['NAME']
+    test_settings = connection.settings_dict.setdefault('TEST', {})
+    old_test_name = test_settings.get('NAME')
+    directory = None
+    if shared and connection.vendor == 'sqlite':
+        directory = tempfile.mkdtemp(prefix='journal-bench-')
+        test_settings['NAME'] = os.path.join(directory, 'bench.sqlite3')
+    connection.creation.create_test_db(verbosity=verbosity, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=verbosity)
+        test_settings['NAME'] = old_test_name
+        if directory:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+def fake_html(size, rng=random):
+    """Editor-like HTML of roughly ``size`` characters."""
+    paragraphs = []
+    length = 0
+    while length < size:
+        words = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(20, 60)))
+        paragraph = f"<p>{words.capitalize()}.</p>" if rng.random() > 0.2 else f"<p><b>{words}</b></p>"
+        paragraphs.append(paragraph)
+        length += len(paragraph)
+    return ''.join(paragraphs)
+
+
+def seed_entries(user, count, content_size=2000, batch_size=1000, seed=0):
+    """Bulk-create ``count`` entries for ``user`` with realistic HTML bodies."""
+    rng = random.Random(seed)
+    # A small pool of bodies keeps seeding fast while sizes still vary; each
+    # is prepared once since bulk_create skips Entry.save().
+    bodies = [fake_html(rng.randint(content_size // 2, content_size * 3 // 2), rng) for _ in range(50)]
+    prepared = {}
+    for body in bodies:
+        entry = Entry(content=body)
+        entry.prepare_content()
+        prepared[body] = entry
+    for start in range(0, count, batch_size):
+        batch = []
+        for _ in range(start, min(start + batch_size, count)):
+            body = prepared[rng.choice(bodies)]
+            batch.append(Entry(
+                user=user,
+                title=' '.join(rng.choice(WORDS) for _ in range(rng.randint(2, 6))).title(),
+                duration_str=f"{rng.randint(1, 59)}m {rng.randint(0, 59)}s",
+                **{field: getattr(body, field) for field in Entry.DERIVED_FIELDS},
+            ))
+        Entry.objects.bulk_create(batch)
+
+
+def seed_user(name='bench', entries=0, **kwargs):
+    user = User.objects.create_user(name, f'{name}@example.com', 'benchmark')
+    if entries:
+        seed_entries(user, entries, **kwargs)
+    return user
+
+
+def seed_users(count, entries, content_size=2000, seed=0):
+    """``count`` users with ``entries`` entries each; returns the users."""
+    users = []
+    for i in range(count):
+        user = seed_user(f'bench{i}', entries=entries, content_size=content_size, seed=seed + i)
+        users.append(user)
+    return users
+
+
+def consume(response):
+    """Read a (possibly streaming) response.
+
+    Returns (time to first byte, total time, bytes). Times are in seconds,
+    measured from when the response object was handed back.
+    """
+    start = time.perf_counter()
+    first_byte = None
+    size = 0
+    chunks = response.streaming_content if response.streaming else [response.content]
+    for chunk in chunks:
+        if first_byte is None:
+            first_byte = time.perf_counter() - start
+        size += len(chunk)
+    return first_byte or 0.0, time.perf_counter() - start, size
+
+
+@contextmanager
+def peak_memory():
+    """Track the peak Python allocation inside the block, in bytes."""
+    result = {}
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    try:
+        yield result
+    finally:
+        result['peak'] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+
+# Endpoint suite. A scenario maps a BenchmarkContext to one request:
+# (who, method, path, JSON body or None); who is 'user' or 'admin'.
+def uncached_entries_page(ctx):
+    # A new journal version per request, so the page is queried and
+    # serialized rather than served from the per-version page cache.
+    ctx.invalidate_pages()
+    return ('user', 'GET', '/api/entries?limit=50', None)
+
+
+SCENARIOS = {
+    'api_entries': uncached_entries_page,
+    'api_entries_cached': lambda ctx: ('user', 'GET', '/api/entries?limit=50', None),
+    'api_entries_create': lambda ctx: ('user', 'POST', '/api/entries', {
+        'title': 'Benchmark entry', 'content': ctx.body, 'durationStr': '5m 0s'}),
+    'api_entries_search': lambda ctx: ('user', 'GET', f'/api/entries/search?q={WORDS[2]}', None),
+    'export_zip': lambda ctx: ('user', 'GET', '/export/zip', None),
+    'delete_entry': lambda ctx: ('user', 'POST', f'/api/entries/delete/{ctx.next_deletable()}', None),
+    'admin_dashboard': lambda ctx: ('admin', 'GET', '/admin/', None),
+}
+
+# What compare() checks: metric -> allowed relative increase (None: the
+# --tolerance argument). Query counts are deterministic, so any rise fails.
+COMPARED_METRICS = {'p50_ms': None, 'p95_ms': None, 'queries': 0, 'peak_memory_bytes': None}
+
+
+class BenchmarkContext:
+    """Seeded users plus per-scenario state shared by every request."""
+
+    def __init__(self, user, admin, deletable_ids):
+        self.user = user
+        self.admin = admin
+        self.body = fake_html(2000, random.Random(1))
+        self._deletable = iter(deletable_ids)
+        self._lock = threading.Lock()
+
+    def invalidate_pages(self):
+        """Move the user's journal version on, as a write elsewhere would."""
+        versions.bump(self.user.pk)
+
+    def next_deletable(self):
+        with self._lock:
+            try:
+                return next(self._deletable)
+            except StopIteration:
+                raise RuntimeError('Ran out of entries to delete; seed more entries per user') from None
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+def summarize(latencies, wall_time):
+    return {
+        'requests': len(latencies),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'mean_ms': round(statistics.fmean(latencies) * 1000, 3),
+        'throughput_rps': round(len(latencies) / wall_time, 1) if wall_time else 0.0,
+    }
+
+
+def make_context(users, admin):
+    """Context for the first user; its oldest entries are the ones delete_entry removes."""
+    user = users[0]
+    deletable = list(user.entries.order_by('created_at', 'id').values_list('id', flat=True))
+    return BenchmarkContext(user, admin, deletable)
+
+
+def client_request(clients, spec):
+    """Send one scenario request through the test client and read the body."""
+    who, method, path, body = spec
+    client = clients[who]
+    if method == 'GET':
+        response = client.get(path)
+    else:
+        response = client.generic(method, path, json.dumps(body) if body is not None else '',
+                                  content_type='application/json')
+    consume(response)
+    if response.status_code >= 400:
+        raise RuntimeError(f'{method} {path} returned {response.status_code}')
+
+
+def run_client_scenario(ctx, scenario, repeat, warmup=3, memory_runs=3):
+    """Sequential in-process runs: latency, queries per request and peak memory."""
+    clients = {'user': Client(), 'admin': Client()}
+    clients['user'].force_login(ctx.user)
+    clients['admin'].force_login(ctx.admin)
+    build = SCENARIOS[scenario]
+    for _ in range(warmup):
+        client_request(clients, build(ctx))
+
+    latencies, queries = [], []
+    wall_start = time.perf_counter()
+    for _ in range(repeat):
+        spec = build(ctx)
+        with CaptureQueriesContext(connection) as captured:
+            start = time.perf_counter()
+            client_request(clients, spec)
+            latencies.append(time.perf_counter() - start)
+        queries.append(len(captured))
+    result = summarize(latencies, time.perf_counter() - wall_start)
+    result['queries'] = statistics.median(queries)
+
+    # Separate pass: tracemalloc would distort the timings above.
+    peaks = []
+    for _ in range(memory_runs):
+        spec = build(ctx)
+        with peak_memory() as memory:
+            client_request(clients, spec)
+        peaks.append(memory['peak'])
+    result['peak_memory_bytes'] = max(peaks)
+    return result
+
+
+def database_url():
+    """URL of the active (test) database, for a server subprocess."""
+    db = connection.settings_dict
+    if connection.vendor == 'sqlite':
+        return f"sqlite:///{db['NAME']}"
+    if connection.vendor == 'postgresql':
+        auth = quote(db['USER'] or '') + (':' + quote(db['PASSWORD']) if db['PASSWORD'] else '')
+        return f"postgres://{auth}@{db['HOST'] or 'localhost'}:{db['PORT'] or 5432}/{quote(db['NAME'])}"
+    raise RuntimeError(f'No gunicorn benchmark support for {connection.vendor}')
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@contextmanager
+def gunicorn_server(workers=2, timeout=30):
+    """Serve the project from the active test database; yields the base URL.
+
+    Sessions are stored in the database and rate limits are off, so the
+    benchmark's logins are visible to every worker and nothing is throttled.
+    """
+    port = free_port()
+    env = dict(os.environ, DATABASE_URL=database_url(), SESSION_BACKEND='db', RATE_LIMIT_ENABLED='False')
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', 'journal_core.wsgi:application',
+         '--bind', f'127.0.0.1:{port}', '--workers', str(workers), '--log-level', 'warning'],
+        cwd=settings.BASE_DIR, env=env)
+    try:
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                break
+            except OSError:
+                if process.poll() is not None or time.monotonic() > deadline:
+                    raise RuntimeError('gunicorn did not start')
+                time.sleep(0.2)
+        yield f'http://127.0.0.1:{port}'
+    finally:
+        process.terminate()
+        process.wait(timeout=timeout)
+
+
+def http_session(base_url, user):
+    """A requests session logged in as ``user`` with a usable CSRF token."""
+    client = Client()
+    # The server subprocess reads sessions from the database (see gunicorn_server).
+    with override_settings(SESSION_ENGINE='django.contrib.sessions.backends.db'):
+        client.force_login(user)
+    token = get_random_string(32)
+    session = requests.Session()
+    session.cookies.set(settings.SESSION_COOKIE_NAME, client.cookies[settings.SESSION_COOKIE_NAME].value)
+    session.cookies.set(settings.CSRF_COOKIE_NAME, token)
+    session.headers.update({'X-CSRFToken': token, 'Referer': base_url + '/'})
+    return session
+
+
+def run_http_scenario(ctx, scenario, base_url, repeat, concurrency, warmup=3):
+    """Concurrent runs against gunicorn: latency under load and throughput."""
+    sessions = threading.local()
+
+    def send():
+        if not hasattr(sessions, 'by_role'):
+            sessions.by_role = {'user': http_session(base_url, ctx.user), 'admin': http_session(base_url, ctx.admin)}
+        who, method, path, body = SCENARIOS[scenario](ctx)
+        start = time.perf_counter()
+        response = sessions.by_role[who].request(method, base_url + path, json=body)
+        elapsed = time.perf_counter() - start
+        if response.status_code >= 400:
+            raise RuntimeError(f'{method} {path} returned {response.status_code}')
+        return elapsed
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(lambda _: send(), range(warmup)))
+        wall_start = time.perf_counter()
+        latencies = list(pool.map(lambda _: send(), range(repeat)))
+        wall_time = time.perf_counter() - wall_start
+    return summarize(latencies, wall_time)
+
+
+def compare(results, baseline, tolerance):
+    """Regressions of ``results`` against ``baseline`` as readable strings.
+
+    Both map mode -> scenario -> metrics. Scenarios or metrics missing on
+    either side are skipped.
+    """
+    regressions = []
+    for mode, scenarios in results.items():
+        for scenario, metrics in scenarios.items():
+            before = baseline.get(mode, {}).get(scenario, {})
+            for metric, allowed in COMPARED_METRICS.items():
+                if metric not in metrics or metric not in before:
+                    continue
+                limit = before[metric] * (1 + (tolerance if allowed is None else allowed))
+                if metrics[metric] > limit:
+                    regressions.append(
+                        f'{mode}/{scenario} {metric}: {metrics[metric]} > {before[metric]} baseline')
+    return regressions
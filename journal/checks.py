@@ -0,0 +1,18 @@
+"""System checks for deployment settings (run by ``manage.py check --deploy``)."""
+from django.core.cache import DEFAULT_CACHE_ALIAS, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.checks import Tags, Warning, register
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """Site config, rate limits and cached pages must be seen by every worker."""
+    if not isinstance(caches[DEFAULT_CACHE_ALIAS], LocMemCache):
+        return []
+    return [Warning(
+        'The default cache is per-process memory, so gunicorn workers disagree on site '
+        'configuration, rate limits and cached entry pages.',
+        hint='Set CACHE_URL to a shared backend, e.g. db://django_cache or redis://host:6379/0 '
+             '(a single-worker deployment can ignore this).',
+        id='journal.W001',
+    )]
@@ -0,0 +1,158 @@
+"""Transparent compression for large text columns (Entry.content).
+
+Values are stored as bytes. Short ones, and any that don't shrink, are
+plain UTF-8. Compressed ones start with a one-byte codec tag. Tags are
+bytes that can never begin valid UTF-8, so untagged values (including
+rows written before compression existed) need no marker at all.
+
+The column is read as raw bytes and only decompressed the first time the
+attribute is accessed on an instance, so list views and ``only()``
+queries that never touch ``content`` pay nothing. ``values()`` bypasses
+the model and returns the stored bytes; pass them through ``decode()``.
+
+ENTRY_CONTENT_CODEC picks the codec for new writes ('zlib', 'zstd' with
+the zstandard package installed, or 'none'); rows are readable whichever
+codec wrote them. `python manage.py compress_entries` rewrites old rows.
+"""
+import zlib
+
+from django import forms
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import models
+from django.db.models.query_utils import DeferredAttribute
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+class Codec:
+    def __init__(self, name, tag, compress, decompress):
+        self.name = name
+        self.tag = tag
+        self.compress = compress
+        self.decompress = decompress
+
+
+# Tag bytes 0xF8-0xFF never occur in UTF-8.
+CODECS = {
+    'zlib': Codec('zlib', b'\xfd', lambda data: zlib.compress(data, 6), zlib.decompress),
+}
+if zstandard is not None:
+    CODECS['zstd'] = Codec(
+        'zstd', b'\xfe',
+        lambda data: zstandard.ZstdCompressor(level=3).compress(data),
+        lambda data: zstandard.ZstdDecompressor().decompress(data))
+TAGS = {codec.tag[0]: codec for codec in CODECS.values()}
+# Known tags whose library may be missing here, for a clearer error.
+TAG_NAMES = {0xfd: 'zlib', 0xfe: 'zstd'}
+# What the database hands back for the column; anything else is text.
+BINARY_TYPES = (bytes, bytearray, memoryview)
+
+
+def get_codec(name=None):
+    """The configured codec (None for 'none')."""
+    name = name or settings.ENTRY_CONTENT_CODEC
+    if name == 'none':
+        return None
+    if name not in CODECS:
+        hint = ' (pip install zstandard)' if name == 'zstd' else ''
+        raise ImproperlyConfigured(f"Unsupported ENTRY_CONTENT_CODEC '{name}'{hint}")
+    return CODECS[name]
+
+
+def encode(text, codec_name=None):
+    """Stored bytes for ``text``; compressed only if large and it pays off."""
+    data = text.encode()
+    codec = get_codec(codec_name)
+    if codec is None or len(data) < settings.ENTRY_CONTENT_COMPRESS_MIN_BYTES:
+        return data
+    compressed = codec.tag + codec.compress(data)
+    return compressed if len(compressed) < len(data) else data
+
+
+def codec_of(value):
+    """Name of the codec ``value`` was stored with, or None if plain."""
+    if not value or not isinstance(value, BINARY_TYPES):
+        return None
+    return TAG_NAMES.get(bytes(value[:1])[0])
+
+
+def decode(value):
+    """Text for a stored value: tagged bytes, plain UTF-8 or a legacy str.
+
+    Values that aren't bytes (text columns, and SQLite rows kept from them,
+    or a number assigned from JSON) are returned as their str().
+    """
+    if value is None:
+        return value
+    if not isinstance(value, BINARY_TYPES):
+        return str(value)
+    value = bytes(value)
+    if not value or value[0] not in TAG_NAMES:
+        return value.decode()
+    codec = TAGS.get(value[0])
+    if codec is None:
+        raise ImproperlyConfigured(f"Entry content compressed with {TAG_NAMES[value[0]]} can't be read here")
+    return codec.decompress(value[1:]).decode()
+
+
+class CompressedTextDescriptor(DeferredAttribute):
+    """Decodes the stored bytes on first access and keeps the text."""
+
+    def __get__(self, instance, cls=None):
+        if instance is None:
+            return self
+        value = super().__get__(instance, cls)
+        if value is not None and not isinstance(value, str):
+            value = instance.__dict__[self.field.attname] = decode(value)
+        return value
+
+    def __set__(self, instance, value):
+        # Defining __set__ makes this a data descriptor, so __get__ still
+        # runs once the value sits in the instance __dict__.
+        instance.__dict__[self.field.attname] = value
+
+
+class CompressedTextField(models.Field):
+    """A TextField stored as (optionally compressed) bytes.
+
+    Assign and read text as usual. Saving an instance whose value was never
+    accessed writes the loaded bytes back untouched.
+    """
+    descriptor_class = CompressedTextDescriptor
+    description = "Text (compressed when large)"
+
+    def get_internal_type(self):
+        return 'BinaryField'
+
+    def from_db_value(self, value, expression, connection):
+        if isinstance(value, memoryview):
+            return bytes(value)
+        return value
+
+    def to_python(self, value):
+        return decode(value)
+
+    def get_prep_value(self, value):
+        value = super().get_prep_value(value)
+        if value is None:
+            return value
+        if isinstance(value, BINARY_TYPES):
+            # Already stored form, e.g. loaded and never accessed.
+            return bytes(value)
+        return encode(str(value))
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        value = super().get_db_prep_value(value, connection, prepared)
+        if value is not None:
+            return connection.Database.Binary(value)
+        return value
+
+    def value_to_string(self, obj):
+        return self.value_from_object(obj)
+
+    def formfield(self, **kwargs):
+        return super().formfield(**{'widget': forms.Textarea, **kwargs})
@@ -0,0 +1,363 @@
+"""Streaming journal exports.
+
+Every format in EXPORT_FORMATS is a generator of byte chunks: entries are
+read from the database in chunks and written out as they arrive, so memory
+stays bounded regardless of journal size. New formats are added with the
+``register_format`` decorator.
+
+Incremental exports only include entries whose ``updated_at`` is newer than
+a watermark; the watermark of each export is returned as its ETag so a
+scheduled backup can send it back as ``since=`` / ``If-None-Match``.
+
+Journals too large to export within a request are built by background
+ExportJobs: ``request_export`` queues a job, ``run_job`` writes the archive
+to EXPORT_ROOT, and the download view serves it with Range support.
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Max
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from django.utils.html import escape
+
+from . import versions
+from .models import Entry, ExportJob
+
+logger = logging.getLogger(__name__)
+
+# Rows fetched per database round-trip while exporting.
+EXPORT_CHUNK_SIZE = 200
+
+
+class ExportFormat:
+    """A registered export format: metadata plus a streaming writer."""
+
+    def __init__(self, name, extension, content_type, stream):
+        self.name = name
+        self.extension = extension
+        self.content_type = content_type
+        self.stream = stream
+
+    @property
+    def filename(self):
+        return f"journal_backup.{self.extension}"
+
+    def incremental_filename(self, since):
+        """Name for an export of only the entries changed after ``since``."""
+        return f"journal_changes_since_{since:%Y%m%dT%H%M%S}.{self.extension}"
+
+
+EXPORT_FORMATS = {}
+
+
+def register_format(name, extension, content_type):
+    """Register ``stream(entries)`` as the writer for export format ``name``."""
+    def decorator(stream):
+        EXPORT_FORMATS[name] = ExportFormat(name, extension, content_type, stream)
+        return stream
+    return decorator
+
+
+def get_format(name):
+    """Look up an export format, raising ValueError for unknown names."""
+    try:
+        return EXPORT_FORMATS[name]
+    except KeyError:
+        raise ValueError(
+            f"Unknown export format '{name}'. Available: {', '.join(sorted(EXPORT_FORMATS))}"
+        ) from None
+
+
+class ZipStream:
+    """Write-only file object that lets zipfile's output be drained in pieces.
+
+    It has no ``tell``/``seek``, so zipfile switches to streaming mode and
+    writes a data descriptor after each member instead of seeking back.
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def entry_filename(entry):
+    """Format: 'Title - Date.txt' with unsafe characters removed."""
+    date_str = entry.created_at.strftime('%Y-%m-%d')
+    # Safe filename: replace non-alphanumeric chars (keep spaces/dashes)
+    safe_title = "".join([c for c in entry.title if c.isalnum() or c in (' ', '-', '_')]).strip()
+    return f"{date_str} - {safe_title}.txt"
+
+
+def entry_text(entry):
+    """Plain-text body of an exported entry: Title, Date, Duration, Content."""
+    return (
+        f"Title: {entry.title}\n"
+        f"Date: {entry.created_at.strftime('%Y-%m-%d %H:%M')}\n"
+        f"Duration: {entry.duration_str}\n\n"
+        f"{entry.plain_text}"
+    )
+
+
+def unique_name(name, taken):
+    """Suffix ``name`` with (2), (3)... if it is already in ``taken``."""
+    if name not in taken:
+        return name
+    stem, dot, ext = name.rpartition('.')
+    n = 2
+    while f"{stem} ({n}).{ext}" in taken:
+        n += 1
+    return f"{stem} ({n}).{ext}"
+
+
+@register_format('zip', 'zip', 'application/zip')
+def stream_zip(entries, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield a ZIP archive of ``entries`` (one .txt per entry) as byte chunks.
+
+    The only per-entry state kept is zipfile's central directory record
+    (a few hundred bytes), which the format requires at the end.
+    """
+    stream = ZipStream()
+    with zipfile.ZipFile(stream, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+        for entry in entries.iterator(chunk_size=chunk_size):
+            member = zipfile.ZipInfo(
+                unique_name(entry_filename(entry), zip_file.NameToInfo),
+                date_time=entry.created_at.timetuple()[:6],
+            )
+            zip_file.writestr(member, entry_text(entry), compress_type=zipfile.ZIP_DEFLATED)
+            data = stream.drain()
+            if data:
+                yield data
+    # Central directory, written when the archive is closed.
+    yield stream.drain()
+
+
+@register_format('jsonl', 'jsonl', 'application/x-ndjson')
+def stream_jsonl(entries, chunk_size=EXPORT_CHUNK_SIZE):
+    """One JSON object per line, with both the HTML and plain-text body."""
+    for entry in entries.iterator(chunk_size=chunk_size):
+        record = {
+            'id': entry.id,
+            'title': entry.title,
+            'date': entry.created_at,
+            'updated': entry.updated_at,
+            'durationStr': entry.duration_str,
+            'content': entry.content,
+            'text': entry.plain_text,
+        }
+        yield (json.dumps(record, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n').encode()
+
+
+@register_format('markdown', 'md', 'text/markdown; charset=utf-8')
+def stream_markdown(entries, chunk_size=EXPORT_CHUNK_SIZE):
+    """A single Markdown document, one section per entry."""
+    yield b"# Journal\n\n"
+    for entry in entries.iterator(chunk_size=chunk_size):
+        section = (
+            f"## {entry.title}\n\n"
+            f"*{entry.created_at.strftime('%Y-%m-%d %H:%M')} \u00b7 {entry.duration_str}*\n\n"
+            f"{entry.plain_text}\n\n---\n\n"
+        )
+        yield section.encode()
+
+
+@register_format('html', 'html', 'text/html; charset=utf-8')
+def stream_html(entries, chunk_size=EXPORT_CHUNK_SIZE):
+    """A single self-contained HTML file keeping each entry's formatting."""
+    yield (
+        b'<!DOCTYPE html>\n<html><head><meta charset="utf-8"><title>Journal</title>'
+        b'<style>body{font-family:Georgia,serif;max-width:720px;margin:2em auto;padding:0 1em}'
+        b'article{border-bottom:1px solid #ddd;padding:1em 0}.meta{color:#777;font-size:.9em}</style>'
+        b'</head><body><h1>Journal</h1>\n'
+    )
+    for entry in entries.iterator(chunk_size=chunk_size):
+        article = (
+            f"<article><h2>{escape(entry.title)}</h2>"
+            f"<p class=\"meta\">{entry.created_at.strftime('%Y-%m-%d %H:%M')} &middot; "
+            f"{escape(entry.duration_str)}</p>{entry.content}</article>\n"
+        )
+        yield article.encode()
+    yield b"</body></html>\n"
+
+
+def export_queryset(user, since=None):
+    """The user's entries to export; with ``since``, only those edited after it."""
+    entries = Entry.objects.filter(user=user)
+    if since is not None:
+        entries = entries.filter(updated_at__gt=since)
+    return entries
+
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def encode_watermark(moment):
+    """ETag for an export covering every change up to ``moment``."""
+    return '"%d"' % ((moment - EPOCH) // timedelta(microseconds=1) if moment else 0)
+
+
+def decode_watermark(value):
+    """Parse a ``since`` value: an ETag from encode_watermark or an ISO datetime.
+
+    Returns an aware datetime or None (export everything). Raises
+    ValueError for anything else.
+    """
+    value = (value or '').strip()
+    if value.startswith('W/'):
+        value = value[2:]
+    value = value.strip('"')
+    if not value or value == '0':
+        return None
+    if value.isdigit():
+        try:
+            return EPOCH + timedelta(microseconds=int(value))
+        except OverflowError:
+            raise ValueError(f"Watermark '{value}' is out of range") from None
+    moment = datetime.fromisoformat(value)
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment, dt_timezone.utc)
+    return moment
+
+
+def latest_change(user):
+    """Most recent ``updated_at`` over the user's entries, or None."""
+    return Entry.objects.filter(user=user).aggregate(last=Max('updated_at'))['last']
+
+
+def entries_fingerprint(user):
+    """Digest that changes whenever any of the user's entries is added, edited or removed."""
+    raw = f"{user.pk}:{versions.current(user.pk)}"
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def request_export(user, format='zip'):
+    """Return (job, created): an up-to-date existing job, or a newly queued one."""
+    fingerprint = entries_fingerprint(user)
+    job = ExportJob.objects.filter(
+        user=user, format=format, fingerprint=fingerprint,
+    ).exclude(status=ExportJob.STATUS_FAILED).first()
+    if job and job.status != ExportJob.STATUS_READY:
+        if is_stale(job):
+            # Its worker went away (e.g. a restart emptied the thread pool).
+            requeue(job)
+        return job, False
+    if job and os.path.exists(job.file_path):
+        return job, False
+
+    job = ExportJob.objects.create(user=user, format=format, fingerprint=fingerprint)
+    transaction.on_commit(lambda: enqueue(job.pk))
+    return job, True
+
+
+def stale_cutoff(minutes=None):
+    return timezone.now() - timedelta(minutes=settings.EXPORT_STALE_MINUTES if minutes is None else minutes)
+
+
+def is_stale(job):
+    """A pending or running job nobody has touched for EXPORT_STALE_MINUTES."""
+    return (job.started_at or job.created_at) < stale_cutoff()
+
+
+def requeue(job):
+    """Put an abandoned job back to pending and hand it to the pool again."""
+    ExportJob.objects.filter(pk=job.pk, status=job.status).update(
+        status=ExportJob.STATUS_PENDING, started_at=None)
+    job.status, job.started_at = ExportJob.STATUS_PENDING, None
+    transaction.on_commit(lambda: enqueue(job.pk))
+
+
+def requeue_stale(minutes=None):
+    """Reset every job stuck in running past the cutoff; returns how many."""
+    return ExportJob.objects.filter(status=ExportJob.STATUS_RUNNING, started_at__lt=stale_cutoff(minutes)).update(
+        status=ExportJob.STATUS_PENDING, started_at=None)
+
+
+_executor = None
+
+
+def enqueue(job_id):
+    """Hand a pending job to the in-process pool (EXPORT_BACKEND='thread').
+
+    With EXPORT_BACKEND='command' jobs stay pending until the
+    ``run_export_jobs`` management command picks them up.
+    """
+    global _executor
+    if settings.EXPORT_BACKEND != 'thread':
+        return
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=settings.EXPORT_THREADS, thread_name_prefix='export')
+    _executor.submit(run_job, job_id)
+
+
+def run_job(job_id):
+    """Claim a pending job and build it. Safe to call from several workers."""
+    try:
+        claimed = ExportJob.objects.filter(pk=job_id, status=ExportJob.STATUS_PENDING).update(
+            status=ExportJob.STATUS_RUNNING, started_at=timezone.now())
+        if claimed:
+            build_job(ExportJob.objects.select_related('user').get(pk=job_id))
+    finally:
+        # Pool threads keep their own connection; don't leak it between jobs.
+        connection.close()
+
+
+def build_job(job):
+    """Write the archive to a temp file under EXPORT_ROOT, then publish it atomically."""
+    directory = os.path.join(settings.EXPORT_ROOT, str(job.user_id))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.part')
+    try:
+        export_format = get_format(job.format)
+        with os.fdopen(fd, 'wb') as f:
+            for chunk in export_format.stream(export_queryset(job.user)):
+                f.write(chunk)
+        final_path = os.path.join(directory, f"{job.pk}.{export_format.extension}")
+        os.replace(tmp_path, final_path)
+    except Exception as e:
+        logger.exception("Export job %s failed", job.pk)
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        job.status = ExportJob.STATUS_FAILED
+        job.error = str(e)
+        job.finished_at = timezone.now()
+        job.save(update_fields=['status', 'error', 'finished_at'])
+        return
+
+    job.status = ExportJob.STATUS_READY
+    job.file_path = final_path
+    job.size = os.path.getsize(final_path)
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'file_path', 'size', 'finished_at'])
+    discard_superseded(job)
+
+
+def discard_superseded(job):
+    """Remove older ready exports of the same format once a newer one exists."""
+    older = ExportJob.objects.filter(
+        user_id=job.user_id, format=job.format, status=ExportJob.STATUS_READY,
+        created_at__lt=job.created_at,
+    )
+    for old in older:
+        if old.file_path and os.path.exists(old.file_path):
+            os.unlink(old.file_path)
+    older.delete()
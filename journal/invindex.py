@@ -0,0 +1,492 @@
+"""Pure-Python inverted index over entry text (SEARCH_BACKEND='inverted').
+
+For deployments whose database has no usable full-text engine. Nothing
+here reads ``content`` at query time:
+
+* A posting list holds the sorted ids of the entries containing a term, in
+  blocks of up to BLOCK_SIZE ids. Each block is delta/varint-encoded bytes,
+  and its first id is kept in an array for bisecting. Adding or removing an
+  id re-encodes a single block.
+* The forward index (entry id -> encoded term ids) lets an edit or delete
+  remove exactly the postings the entry had.
+* Each user's entries form one more posting list, under a reserved term,
+  so a per-user query is just one more AND clause.
+
+A query walks its most selective clause newest-first and probes the other
+lists block by block. It stops as soon as ``limit`` matches are found, so
+common words don't need their whole list decoded.
+
+Persistence is a snapshot plus an append-only log in SEARCH_INDEX_DIR.
+Processes append their updates to the log under a file lock and replay
+other processes' lines before answering, so every gunicorn worker sees
+every change. Once the log grows past SEARCH_INDEX_LOG_MAX bytes it is
+folded into a new snapshot.
+"""
+import heapq
+import json
+import os
+import pickle
+import re
+import tempfile
+import threading
+import unicodedata
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from collections import defaultdict
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows dev boxes: single process, no locking needed
+    fcntl = None
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+BLOCK_SIZE = 128
+MAX_TERM_LENGTH = 40
+# Most terms a trailing prefix (``gard`` -> garden, gardening...) expands to.
+MAX_PREFIX_TERMS = 64
+USER_TERM = '\x00u:{}'  # can't come out of the tokenizer
+
+WORD_RE = re.compile(r'\w+')
+QUERY_RE = re.compile(r'(-?)"([^"]*)"|(\S+)')
+
+
+def tokenize(text):
+    """Lower-cased word tokens of plain ``text`` (strip HTML before calling)."""
+    text = unicodedata.normalize('NFKC', text).casefold()
+    return [token for token in WORD_RE.findall(text) if len(token) <= MAX_TERM_LENGTH]
+
+
+def encode_deltas(ids, previous=0):
+    """Varint-encode the gaps between sorted ``ids``, starting from ``previous``."""
+    out = bytearray()
+    for value in ids:
+        delta = value - previous
+        previous = value
+        while delta >= 0x80:
+            out.append((delta & 0x7f) | 0x80)
+            delta >>= 7
+        out.append(delta)
+    return bytes(out)
+
+
+def decode_deltas(data, previous=0):
+    ids = []
+    delta = shift = 0
+    for byte in data:
+        delta |= (byte & 0x7f) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            previous += delta
+            ids.append(previous)
+            delta = shift = 0
+    return ids
+
+
+class PostingList:
+    """Sorted entry ids, stored as delta-encoded blocks."""
+
+    __slots__ = ('firsts', 'blocks', 'count')
+
+    def __init__(self):
+        self.firsts = array('q')
+        self.blocks = []
+        self.count = 0
+
+    @classmethod
+    def from_sorted(cls, ids):
+        postings = cls()
+        for start in range(0, len(ids), BLOCK_SIZE):
+            chunk = ids[start:start + BLOCK_SIZE]
+            postings.firsts.append(chunk[0])
+            postings.blocks.append(encode_deltas(chunk[1:], chunk[0]))
+        postings.count = len(ids)
+        return postings
+
+    def __len__(self):
+        return self.count
+
+    def block(self, i):
+        first = self.firsts[i]
+        return [first] + decode_deltas(self.blocks[i], first)
+
+    def block_index(self, doc):
+        return max(bisect_right(self.firsts, doc) - 1, 0)
+
+    def _replace(self, i, ids):
+        """Store ``ids`` as block ``i``: dropped if empty, split if oversized."""
+        del self.firsts[i]
+        del self.blocks[i]
+        for start in reversed(range(0, len(ids), BLOCK_SIZE)):
+            chunk = ids[start:start + BLOCK_SIZE]
+            self.firsts.insert(i, chunk[0])
+            self.blocks.insert(i, encode_deltas(chunk[1:], chunk[0]))
+
+    def add(self, doc):
+        if not self.blocks:
+            self.firsts.append(doc)
+            self.blocks.append(b'')
+            self.count = 1
+            return
+        i = self.block_index(doc)
+        ids = self.block(i)
+        pos = bisect_left(ids, doc)
+        if pos < len(ids) and ids[pos] == doc:
+            return
+        ids.insert(pos, doc)
+        self.count += 1
+        self._replace(i, ids)
+
+    def remove(self, doc):
+        if not self.blocks:
+            return
+        i = self.block_index(doc)
+        ids = self.block(i)
+        pos = bisect_left(ids, doc)
+        if pos < len(ids) and ids[pos] == doc:
+            del ids[pos]
+            self.count -= 1
+            self._replace(i, ids)
+
+    def __iter__(self):
+        for i in range(len(self.blocks)):
+            yield from self.block(i)
+
+    def newest_first(self):
+        for i in reversed(range(len(self.blocks))):
+            yield from reversed(self.block(i))
+
+
+class Probe:
+    """Membership tests against a posting list, reusing the last decoded block."""
+
+    __slots__ = ('postings', 'index', 'ids')
+
+    def __init__(self, postings):
+        self.postings = postings
+        self.index = -1
+        self.ids = ()
+
+    def __contains__(self, doc):
+        i = self.postings.block_index(doc)
+        if i != self.index:
+            self.index = i
+            self.ids = self.postings.block(i)
+        pos = bisect_left(self.ids, doc)
+        return pos < len(self.ids) and self.ids[pos] == doc
+
+
+def parse_query(query):
+    """Split web-search syntax into (required groups, excluded terms).
+
+    A group is a list of (term, is_prefix) alternatives, any of which may
+    match: words joined by OR share a group. Positions aren't stored, so a
+    quoted phrase requires each of its words. The last bare word also
+    matches as a prefix, for search-as-you-type.
+    """
+    groups, excluded = [], []
+    tokens = list(QUERY_RE.finditer(query))
+    join_next = False
+    for i, match in enumerate(tokens):
+        negate, phrase, word = match.groups()
+        if word == 'OR':
+            join_next = bool(groups)
+            continue
+        if word is not None:
+            negate = word.startswith('-')
+            phrase = word.lstrip('-')
+        terms = tokenize(phrase)
+        if not terms:
+            continue
+        if negate:
+            excluded.extend(terms)
+            continue
+        prefix = word is not None and i == len(tokens) - 1
+        alternatives = [(term, prefix and n == len(terms) - 1) for n, term in enumerate(terms)]
+        if join_next:
+            groups[-1].append(alternatives.pop(0))
+        groups.extend([alternative] for alternative in alternatives)
+        join_next = False
+    return groups, excluded
+
+
+class InvertedIndex:
+    """Term -> entry id postings plus the entry -> term forward index."""
+
+    def __init__(self):
+        self.terms = []         # term id -> term
+        self.vocab = {}         # term -> term id
+        self.sorted_terms = []  # for prefix expansion
+        self.postings = {}      # term id -> PostingList
+        self.forward = {}       # entry id -> encode_deltas(sorted term ids)
+
+    def __getstate__(self):
+        return {'terms': self.terms, 'postings': self.postings, 'forward': self.forward}
+
+    def __setstate__(self, state):
+        self.__init__()
+        self.terms = state['terms']
+        self.postings = state['postings']
+        self.forward = state['forward']
+        self.vocab = {term: term_id for term_id, term in enumerate(self.terms)}
+        self.sorted_terms = sorted(self.terms)
+
+    def __len__(self):
+        return len(self.forward)
+
+    def term_id(self, term):
+        term_id = self.vocab.get(term)
+        if term_id is None:
+            term_id = self.vocab[term] = len(self.terms)
+            self.terms.append(term)
+            insort(self.sorted_terms, term)
+        return term_id
+
+    @staticmethod
+    def entry_terms(user_id, text):
+        return sorted(set(tokenize(text))) + [USER_TERM.format(user_id)]
+
+    def set_terms(self, doc, terms):
+        """Make ``terms`` the complete set of terms indexed for entry ``doc``."""
+        new = {self.term_id(term) for term in terms}
+        old = set(decode_deltas(self.forward.get(doc, b'')))
+        for term_id in old - new:
+            postings = self.postings[term_id]
+            postings.remove(doc)
+            if not postings:
+                del self.postings[term_id]
+        for term_id in new - old:
+            self.postings.setdefault(term_id, PostingList()).add(doc)
+        self.forward[doc] = encode_deltas(sorted(new))
+
+    def remove(self, doc):
+        self.set_terms(doc, ())
+        del self.forward[doc]
+
+    def lists_for(self, term, prefix=False):
+        if not prefix:
+            term_id = self.vocab.get(term)
+            return [self.postings[term_id]] if term_id in self.postings else []
+        start = bisect_left(self.sorted_terms, term)
+        lists = []
+        for candidate in self.sorted_terms[start:]:
+            if not candidate.startswith(term) or len(lists) >= MAX_PREFIX_TERMS:
+                break
+            lists.extend(self.lists_for(candidate))
+        return lists
+
+    def search(self, query, user_id=None, limit=20):
+        """Ids of up to ``limit`` matching entries, newest first."""
+        groups, excluded = parse_query(query)
+        if not groups:
+            return []
+        required = [
+            [postings for term, prefix in group for postings in self.lists_for(term, prefix)]
+            for group in groups
+        ]
+        if user_id is not None:
+            required.append(self.lists_for(USER_TERM.format(user_id)))
+        if not all(required):
+            return []
+
+        required.sort(key=lambda lists: sum(len(p) for p in lists))
+        driver, others = required[0], required[1:]
+        probes = [[Probe(p) for p in lists] for lists in others]
+        excluded = [Probe(p) for term in excluded for p in self.lists_for(term)]
+
+        results = []
+        candidates = heapq.merge(*(p.newest_first() for p in driver), reverse=True)
+        previous = None
+        for doc in candidates:
+            if doc == previous:
+                continue
+            previous = doc
+            if all(any(doc in probe for probe in group) for group in probes) and \
+                    not any(doc in probe for probe in excluded):
+                results.append(doc)
+                if len(results) >= limit:
+                    break
+        return results
+
+
+def build(rows):
+    """Build an index from (entry id, user id, plain text) rows in ascending id order."""
+    index = InvertedIndex()
+    pending = defaultdict(list)
+    for doc, user_id, text in rows:
+        term_ids = sorted({index.term_id(term) for term in index.entry_terms(user_id, text)})
+        for term_id in term_ids:
+            pending[term_id].append(doc)
+        index.forward[doc] = encode_deltas(term_ids)
+    index.postings = {term_id: PostingList.from_sorted(ids) for term_id, ids in pending.items()}
+    return index
+
+
+class IndexStore:
+    """An InvertedIndex persisted as snapshot + shared append log in ``directory``.
+
+    The log's first line names the snapshot generation it extends; a
+    process that finds a different generation reloads the snapshot.
+    """
+
+    def __init__(self, directory, log_max):
+        self.directory = str(directory)
+        self.snapshot_path = os.path.join(self.directory, 'index.pickle')
+        self.log_path = os.path.join(self.directory, 'index.log')
+        self.lock_path = os.path.join(self.directory, 'index.lock')
+        self.log_max = log_max
+        self.index = InvertedIndex()
+        self.generation = 0
+        self.offset = 0
+        self.loaded = False
+        self.lock = threading.RLock()
+
+    @contextmanager
+    def file_lock(self):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.lock_path, 'a') as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def header(self, generation):
+        return (json.dumps({'generation': generation}) + '\n').encode()
+
+    def load(self):
+        self.index, self.generation = InvertedIndex(), 0
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, 'rb') as f:
+                self.generation = pickle.load(f)
+                self.index = pickle.load(f)
+        self.offset = len(self.header(self.generation))
+        self.loaded = True
+
+    def refresh(self):
+        """Apply log lines written (by any process) since we last looked."""
+        with self.lock:
+            if not self.loaded:
+                self.load()
+            try:
+                with open(self.log_path, 'rb') as f:
+                    if f.readline() != self.header(self.generation):
+                        # A newer snapshot replaced the log (or the log predates ours).
+                        if self.snapshot_generation() != self.generation:
+                            self.load()
+                            return self.refresh()
+                        return
+                    f.seek(self.offset)
+                    data = f.read()
+            except FileNotFoundError:
+                return
+            end = data.rfind(b'\n') + 1  # ignore a line still being written
+            for line in data[:end].splitlines():
+                self.apply(json.loads(line))
+            self.offset += end
+
+    def snapshot_generation(self):
+        if not os.path.exists(self.snapshot_path):
+            return 0
+        with open(self.snapshot_path, 'rb') as f:
+            return pickle.load(f)  # the generation is pickled ahead of the index
+
+    def apply(self, record):
+        if record['op'] == 'set':
+            self.index.set_terms(record['id'], record['terms'])
+        elif record['id'] in self.index.forward:
+            self.index.remove(record['id'])
+
+    def append(self, records):
+        """Log ``records`` for every process, then apply them here."""
+        if not records:
+            return
+        payload = b''.join((json.dumps(record) + '\n').encode() for record in records)
+        with self.lock, self.file_lock():
+            self.refresh()
+            mode = 'ab'
+            try:
+                with open(self.log_path, 'rb') as f:
+                    if f.readline() != self.header(self.generation):
+                        mode = 'wb'  # stale log left by an interrupted compaction
+            except FileNotFoundError:
+                mode = 'wb'
+            with open(self.log_path, mode) as f:
+                if mode == 'wb':
+                    f.write(self.header(self.generation))
+                f.write(payload)
+            if mode == 'wb':
+                self.offset = len(self.header(self.generation))
+            self.refresh()
+            if os.path.getsize(self.log_path) > self.log_max:
+                self._write_snapshot(self.index)
+
+    def update(self, entries):
+        """Index (entry id, user id, plain text) tuples."""
+        self.append([
+            {'op': 'set', 'id': doc, 'terms': InvertedIndex.entry_terms(user_id, text)}
+            for doc, user_id, text in entries
+        ])
+
+    def delete(self, entry_ids):
+        self.append([{'op': 'del', 'id': doc} for doc in entry_ids])
+
+    def search(self, query, user_id=None, limit=20):
+        self.refresh()
+        with self.lock:
+            return self.index.search(query, user_id, limit)
+
+    def replace(self, index):
+        """Publish a freshly built index as the new snapshot."""
+        with self.lock, self.file_lock():
+            self.refresh()
+            self._write_snapshot(index)
+
+    def compact(self):
+        with self.lock, self.file_lock():
+            self.refresh()
+            self._write_snapshot(self.index)
+
+    def _write_snapshot(self, index):
+        """Write ``index`` as generation+1 and start an empty log (file lock held)."""
+        generation = self.generation + 1
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.part')
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(generation, f)
+            pickle.dump(index, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.snapshot_path)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.part')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(self.header(generation))
+        os.replace(tmp_path, self.log_path)
+        self.index, self.generation = index, generation
+        self.offset = len(self.header(generation))
+
+    def size_on_disk(self):
+        return sum(os.path.getsize(p) for p in (self.snapshot_path, self.log_path) if os.path.exists(p))
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = IndexStore(settings.SEARCH_INDEX_DIR, settings.SEARCH_INDEX_LOG_MAX)
+    return _store
+
+
+@receiver(setting_changed)
+def reset_on_setting_change(setting, **kwargs):
+    global _store
+    if setting.startswith('SEARCH_'):
+        _store = None
@@ -0,0 +1,65 @@
+import random
+import statistics
+import time
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+from journal import compression
+from journal.benchmarks import benchmark_database, seed_user
+from journal.models import Entry
+
+
+class Command(BaseCommand):
+    help = "Compares stored content size and read latency per compression codec on a throwaway database"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--entries', type=int, default=5000, help='Entries to seed (default 5000)')
+        parser.add_argument('--content-size', type=int, default=4000, help='Average entry HTML size in characters')
+        parser.add_argument('--repeat', type=int, default=20, help='Timed runs per measurement')
+
+    def timed(self, func, repeat):
+        """Median milliseconds per call."""
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            times.append((time.perf_counter() - start) * 1000)
+        return statistics.median(times)
+
+    def handle(self, *args, **options):
+        codecs = ['none'] + sorted(compression.CODECS)
+        repeat = options['repeat']
+        with benchmark_database():
+            self.stdout.write(f"Seeding {options['entries']} entries...")
+            user = seed_user(entries=options['entries'], content_size=options['content_size'])
+            entries = Entry.objects.filter(user=user).order_by('-created_at', '-id')
+            ids = list(entries.values_list('pk', flat=True))
+            rng = random.Random(0)
+
+            def page(touch_content):
+                for entry in entries[:50]:
+                    if touch_content:
+                        entry.content
+
+            def single():
+                Entry.objects.get(pk=rng.choice(ids)).content
+
+            self.stdout.write(self.style.SUCCESS('Content compression benchmark (median of %d runs)' % repeat))
+            self.stdout.write(f"  entries: {options['entries']}, average HTML size: {options['content_size']}")
+            # "page" loads 50 full entries; "page, lazy" loads them without
+            # reading content, as list views do; "single" fetches one by id.
+            self.stdout.write(
+                f"  {'codec':<8}{'stored':>12}{'ratio':>8}{'page':>12}{'page, lazy':>14}{'single':>12}")
+            raw_size = None
+            for codec in codecs:
+                call_command('compress_entries', codec=codec, stdout=StringIO())
+                size = sum(len(value) for value in entries.values_list('content', flat=True).iterator())
+                raw_size = raw_size or size
+                full = self.timed(lambda: page(True), repeat)
+                lazy = self.timed(lambda: page(False), repeat)
+                one = self.timed(single, repeat * 5)
+                self.stdout.write(
+                    f"  {codec:<8}{size / 1024 / 1024:>8.2f} MiB{raw_size / size:>7.1f}x"
+                    f"{full:>10.2f}ms{lazy:>12.2f}ms{one:>10.3f}ms")
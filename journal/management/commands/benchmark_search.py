@@ -0,0 +1,68 @@
+import statistics
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.test import override_settings
+
+from journal import invindex, search
+from journal.benchmarks import WORDS, benchmark_database, seed_user
+from journal.models import Entry
+
+
+class Command(BaseCommand):
+    help = "Compares the pure-Python inverted index with icontains scans on a throwaway database"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--entries', type=int, default=100000, help='Entries to seed (default 100000)')
+        parser.add_argument('--content-size', type=int, default=1000, help='Average entry HTML size in characters')
+        parser.add_argument('--repeat', type=int, default=20, help='Timed runs per query')
+
+    def timed(self, func, repeat):
+        """Median milliseconds per call, plus the last result."""
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = func()
+            times.append((time.perf_counter() - start) * 1000)
+        return statistics.median(times), result
+
+    def handle(self, *args, **options):
+        queries = [WORDS[0], f'{WORDS[1]} {WORDS[2]}', f'{WORDS[3]} -{WORDS[4]}', WORDS[5][:3], 'nonexistentword']
+        with benchmark_database(), tempfile.TemporaryDirectory() as directory, \
+                override_settings(SEARCH_BACKEND='inverted', SEARCH_INDEX_DIR=directory):
+            self.stdout.write(f"Seeding {options['entries']} entries...")
+            user = seed_user(entries=options['entries'], content_size=options['content_size'])
+
+            start = time.perf_counter()
+            search.rebuild_index()
+            build_time = time.perf_counter() - start
+            store = invindex.get_store()
+
+            self.stdout.write(self.style.SUCCESS('Search benchmark (median of %d runs)' % options['repeat']))
+            self.stdout.write(f"  entries:          {options['entries']}")
+            self.stdout.write(f"  index build:      {build_time:.1f} s")
+            self.stdout.write(f"  index on disk:    {store.size_on_disk() / 1024 / 1024:.1f} MiB")
+            # "lookup" is the index alone; "search" adds fetching the rows and
+            # building snippets, i.e. what /api/entries/search does.
+            self.stdout.write(f"  {'query':<24}{'lookup':>12}{'search':>12}{'icontains':>12}")
+            for query in queries:
+                lookup, _ = self.timed(
+                    lambda: store.search(query, user_id=user.pk, limit=search.DEFAULT_LIMIT), options['repeat'])
+                inverted, _ = self.timed(
+                    lambda: search.search_entries(user, query, search.DEFAULT_LIMIT), options['repeat'])
+                # The pre-index path: substring scan over every entry's text.
+                scan = Entry.objects.filter(user=user).filter(
+                    Q(title__icontains=query) | Q(plain_text__icontains=query)).order_by('-created_at')
+                icontains, _ = self.timed(
+                    lambda: list(scan[:search.DEFAULT_LIMIT]), max(1, options['repeat'] // 5))
+                self.stdout.write(f"  {query:<24}{lookup:>10.2f}ms{inverted:>10.2f}ms{icontains:>10.2f}ms")
+
+            # Index maintenance cost per saved entry.
+            entry_ids = list(Entry.objects.order_by('-id').values_list('id', flat=True)[:100])
+            start = time.perf_counter()
+            for pk in entry_ids:
+                store.update([(pk, user.pk, f'{WORDS[6]} {WORDS[7]} edited')])
+            update_ms = (time.perf_counter() - start) * 1000 / len(entry_ids)
+            self.stdout.write(f"  incremental update: {update_ms:.2f} ms/entry")
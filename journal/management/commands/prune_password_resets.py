@@ -0,0 +1,26 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from journal.models import PasswordResetRequest
+
+
+class Command(BaseCommand):
+    help = "Deletes old PasswordResetRequest audit rows in batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30, help='Keep rows newer than this many days (default 30)')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows deleted per query')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        old = PasswordResetRequest.objects.filter(requested_at__lt=cutoff).order_by('pk')
+        deleted = 0
+        # Small deletes keep each transaction (and any table lock) short.
+        while True:
+            batch = list(old.values_list('pk', flat=True)[:options['batch_size']])
+            if not batch:
+                break
+            deleted += PasswordResetRequest.objects.filter(pk__in=batch).delete()[0]
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} password reset requests older than {options["days"]} days'))
@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from journal import invindex, search
+
+
+class Command(BaseCommand):
+    help = "Re-creates the SQLite FTS table or the inverted index from the entry table (Postgres maintains its own)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--compact', action='store_true',
+                            help='Inverted index only: fold the update log into the snapshot instead of rebuilding')
+
+    def handle(self, *args, **options):
+        kind = search.backend()
+        if kind not in ('sqlite', 'inverted'):
+            self.stdout.write(self.style.WARNING(f'Nothing to rebuild for the {kind} backend'))
+            return
+        start = time.perf_counter()
+        if options['compact'] and kind == 'inverted':
+            store = invindex.get_store()
+            store.compact()
+            self.stdout.write(self.style.SUCCESS(
+                f'Compacted index of {len(store.index)} entries ({store.size_on_disk() / 1024 / 1024:.1f} MiB)'))
+            return
+        count = search.rebuild_index()
+        self.stdout.write(self.style.SUCCESS(
+            f'Indexed {count} entries in {time.perf_counter() - start:.1f}s ({kind})'))
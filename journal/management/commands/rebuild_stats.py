@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from journal import stats
+
+
+class Command(BaseCommand):
+    help = "Recomputes the admin dashboard counters from the entry and user tables"
+
+    def handle(self, *args, **options):
+        totals = stats.rebuild()
+        for name, value in totals.items():
+            self.stdout.write(f"  {name}: {value}")
+        self.stdout.write(self.style.SUCCESS('Dashboard statistics rebuilt'))
@@ -0,0 +1,34 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from journal.models import ActivityRollup
+from journal.stats import rollup_activity
+
+
+class Command(BaseCommand):
+    help = "Aggregates new entries and signups into hourly/daily ActivityRollup rows (run from cron)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--period', choices=['hour', 'day', 'all'], default='all',
+                            help='Which rollups to refresh (default both)')
+        parser.add_argument('--since', help='Re-aggregate from this ISO date/datetime instead of the newest bucket')
+        parser.add_argument('--full', action='store_true', help='Rebuild the whole history')
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            try:
+                since = datetime.fromisoformat(options['since'])
+            except ValueError as e:
+                raise CommandError(f"Invalid --since: {e}")
+            if timezone.is_naive(since):
+                since = timezone.make_aware(since)
+
+        periods = [p for p, _ in ActivityRollup.PERIOD_CHOICES] if options['period'] == 'all' else [options['period']]
+        for period in periods:
+            if options['full']:
+                ActivityRollup.objects.filter(period=period).delete()
+            written = rollup_activity(period, since)
+            self.stdout.write(self.style.SUCCESS(f'{period}: {written} bucket(s) written'))
@@ -0,0 +1,83 @@
+import json
+import platform
+from datetime import datetime
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+
+from journal import benchmarks
+from journal.benchmarks import SCENARIOS, benchmark_database, seed_users
+
+
+class Command(BaseCommand):
+    help = "Benchmarks the journal endpoints on a throwaway database and compares against a baseline"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=5, help='Users to seed (default 5)')
+        parser.add_argument('--entries', type=int, default=500, help='Entries per user (default 500)')
+        parser.add_argument('--content-size', type=int, default=2000, help='Average entry HTML size in characters')
+        parser.add_argument('--repeat', type=int, default=50, help='Timed requests per scenario')
+        parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS),
+                            help='Run only this scenario (repeatable; default all)')
+        parser.add_argument('--gunicorn', action='store_true',
+                            help='Also load-test a local gunicorn over HTTP')
+        parser.add_argument('--workers', type=int, default=2, help='gunicorn workers')
+        parser.add_argument('--concurrency', type=int, default=4, help='Concurrent HTTP clients')
+        parser.add_argument('--output', help='Write the results as JSON to this file')
+        parser.add_argument('--baseline', help='Fail if results regress against this JSON file')
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help='Allowed relative slowdown before a timing counts as a regression')
+
+    def handle(self, *args, **options):
+        scenarios = options['scenario'] or list(SCENARIOS)
+        # delete_entry removes one seeded entry per request.
+        needed = options['repeat'] * (2 if options['gunicorn'] else 1) + 20
+        if 'delete_entry' in scenarios and options['entries'] < needed:
+            raise CommandError(f"delete_entry needs --entries of at least {needed}")
+
+        results = {'client': {}}
+        with benchmark_database(shared=options['gunicorn']), override_settings(RATE_LIMIT_ENABLED=False):
+            self.stdout.write(f"Seeding {options['users']} users x {options['entries']} entries...")
+            users = seed_users(options['users'], options['entries'], content_size=options['content_size'])
+            admin = User.objects.create_superuser('bench-admin', 'bench-admin@example.com', 'benchmark')
+            ctx = benchmarks.make_context(users, admin)
+
+            for scenario in scenarios:
+                results['client'][scenario] = benchmarks.run_client_scenario(ctx, scenario, options['repeat'])
+                self.report('client', scenario, results['client'][scenario])
+
+            if options['gunicorn']:
+                results['gunicorn'] = {}
+                with benchmarks.gunicorn_server(workers=options['workers']) as base_url:
+                    for scenario in scenarios:
+                        results['gunicorn'][scenario] = benchmarks.run_http_scenario(
+                            ctx, scenario, base_url, options['repeat'], options['concurrency'])
+                        self.report('gunicorn', scenario, results['gunicorn'][scenario])
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump({
+                    'created_at': datetime.now().isoformat(timespec='seconds'),
+                    'python': platform.python_version(),
+                    'options': {key: options[key] for key in ('users', 'entries', 'content_size', 'repeat')},
+                    'results': results,
+                }, f, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                baseline = json.load(f)['results']
+            regressions = benchmarks.compare(results, baseline, options['tolerance'])
+            if regressions:
+                for line in regressions:
+                    self.stdout.write(self.style.ERROR(f"  {line}"))
+                raise CommandError(f"{len(regressions)} regression(s) against {options['baseline']}")
+            self.stdout.write(self.style.SUCCESS(f"No regressions against {options['baseline']}"))
+
+    def report(self, mode, scenario, metrics):
+        line = (f"  {mode:<9}{scenario:<22}p50 {metrics['p50_ms']:>9.2f} ms  p95 {metrics['p95_ms']:>9.2f} ms  "
+                f"p99 {metrics['p99_ms']:>9.2f} ms  {metrics['throughput_rps']:>8.1f} req/s")
+        if 'queries' in metrics:
+            line += f"  {metrics['queries']:>4g} queries  {metrics['peak_memory_bytes'] / 1024:>8.0f} KiB peak"
+        self.stdout.write(line)
@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from journal.exports import requeue_stale, run_job
+from journal.models import ExportJob
+
+
+class Command(BaseCommand):
+    help = "Builds pending background exports (for EXPORT_BACKEND=command)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep polling for new jobs instead of exiting')
+        parser.add_argument('--interval', type=float, default=5.0, help='Seconds between polls with --loop')
+        parser.add_argument('--stale-after', type=int,
+                            help='Re-queue jobs stuck in "running" for this many minutes '
+                                 '(worker died; default EXPORT_STALE_MINUTES)')
+
+    def handle(self, *args, **options):
+        while True:
+            self.requeue_stale(options['stale_after'])
+            pending = list(ExportJob.objects.filter(
+                status=ExportJob.STATUS_PENDING).order_by('created_at').values_list('id', flat=True))
+            for job_id in pending:
+                run_job(job_id)
+                job = ExportJob.objects.get(pk=job_id)
+                style = self.style.SUCCESS if job.status == ExportJob.STATUS_READY else self.style.ERROR
+                self.stdout.write(style(f'Export job {job_id}: {job.status}'))
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+    def requeue_stale(self, minutes):
+        count = requeue_stale(minutes)
+        if count:
+            self.stdout.write(self.style.WARNING(f'Re-queued {count} stale export job(s)'))
@@ -0,0 +1,90 @@
+"""In-process request histograms, rendered in the Prometheus text format.
+
+PerformanceMiddleware (journal/middleware.py) feeds one observation per
+request into ``REGISTRY``; the admin serves ``render()`` at admin/metrics/.
+Each process keeps its own numbers: with several gunicorn workers a scrape
+sees whichever worker answered it, and counts restart with the worker.
+"""
+import bisect
+import threading
+
+# Upper bounds; +Inf is implied.
+TIME_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+BYTES_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216, 67108864)
+
+METRICS = {
+    # name: (help, buckets)
+    'journal_request_duration_seconds': ('Wall time per request', TIME_BUCKETS),
+    'journal_request_db_queries': ('SQL queries per request', QUERY_BUCKETS),
+    'journal_request_db_seconds': ('Time spent in SQL per request', TIME_BUCKETS),
+    'journal_response_bytes': ('Response body size', BYTES_BUCKETS),
+    'journal_request_peak_alloc_bytes': ('Peak Python allocation per request (PERF_TRACE_MEMORY)', BYTES_BUCKETS),
+}
+
+
+class Histogram:
+    """Cumulative-bucket histogram for one (metric, view) pair."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def cumulative(self):
+        running = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            running += count
+            yield bound, running
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}
+
+    def observe(self, view, **values):
+        """Record one request; ``values`` maps metric names to observations."""
+        with self.lock:
+            for name, value in values.items():
+                key = (name, view)
+                histogram = self.histograms.get(key)
+                if histogram is None:
+                    histogram = self.histograms[key] = Histogram(METRICS[name][1])
+                histogram.observe(value)
+
+    def clear(self):
+        with self.lock:
+            self.histograms.clear()
+
+    def render(self):
+        """Every histogram in the Prometheus text exposition format (0.0.4)."""
+        with self.lock:
+            items = sorted(
+                (key, list(h.cumulative()), h.total, h.count) for key, h in self.histograms.items())
+        lines = []
+        current = None
+        for (name, view), buckets, total, count in items:
+            if name != current:
+                current = name
+                lines.append(f'# HELP {name} {METRICS[name][0]}')
+                lines.append(f'# TYPE {name} histogram')
+            label = f'view="{escape_label(view)}"'
+            for bound, running in buckets:
+                lines.append(f'{name}_bucket{{{label},le="{bound}"}} {running}')
+            lines.append(f'{name}_sum{{{label}}} {total:g}')
+            lines.append(f'{name}_count{{{label}}} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+def escape_label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+REGISTRY = Registry()
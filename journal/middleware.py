@@ -0,0 +1,266 @@
+"""Per-request performance instrumentation and profiling.
+
+PerformanceMiddleware times every request and, under WSGI, counts and
+times its SQL through ``connection.execute_wrapper``. Each request is fed
+into the histograms in journal/metrics.py under the resolved view name.
+Requests slower than PERF_SLOW_REQUEST_MS are logged to 'journal.perf'.
+Streaming responses are measured when their last chunk has been sent, so
+queries made while streaming (api_entries pages, exports) are included.
+
+Under ASGI the SQL runs in worker threads the wrapper can't see, so async
+requests record only time and bytes.
+
+ProfilingMiddleware runs selected requests under cProfile and stores the
+result as a RequestProfile for the admin. See its docstring.
+"""
+import cProfile
+import io
+import json
+import logging
+import marshal
+import pstats
+import random
+import time
+import tracemalloc
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+
+from .metrics import REGISTRY
+from .models import RequestProfile, SiteConfiguration
+
+logger = logging.getLogger('journal.perf')
+
+
+class RequestSample:
+    """Measurements for one request; also the execute_wrapper callable."""
+
+    def __init__(self, trace_memory=False, track_sql=True):
+        self.start = time.perf_counter()
+        self.track_sql = track_sql
+        self.queries = 0
+        self.db_time = 0.0
+        self.bytes = 0
+        self.memory_baseline = None
+        if trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+            self.memory_baseline = tracemalloc.get_traced_memory()[0]
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_time += time.perf_counter() - start
+
+    def peak_memory(self):
+        if self.memory_baseline is None or not tracemalloc.is_tracing():
+            return None
+        return max(tracemalloc.get_traced_memory()[1] - self.memory_baseline, 0)
+
+
+def logfmt(value):
+    value = str(value)
+    return json.dumps(value) if not value or ' ' in value or '"' in value else value
+
+
+def view_label(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match else 'unmatched'
+
+
+class PerformanceMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.PERF_METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        # Peak allocation is process-wide, so it is only meaningful when a
+        # worker serves one request at a time (gunicorn's sync workers).
+        sample = RequestSample(settings.PERF_TRACE_MEMORY)
+        with connection.execute_wrapper(sample):
+            response = self.get_response(request)
+        return self.measure(request, response, sample, wrap_sql=True)
+
+    async def __acall__(self, request):
+        sample = RequestSample(track_sql=False)
+        response = await self.get_response(request)
+        return self.measure(request, response, sample, wrap_sql=False)
+
+    def measure(self, request, response, sample, wrap_sql):
+        if not response.streaming:
+            sample.bytes = len(response.content)
+            self.finish(request, response, sample)
+        elif getattr(response, 'file_to_stream', None) is not None:
+            # Leave FileResponse alone so the server can still sendfile() it.
+            sample.bytes = int(response.get('Content-Length') or 0)
+            self.finish(request, response, sample)
+        elif response.is_async:
+            response.streaming_content = self.astream(response.streaming_content, request, response, sample)
+        else:
+            response.streaming_content = self.stream(
+                response.streaming_content, request, response, sample, wrap_sql)
+        return response
+
+    def stream(self, content, request, response, sample, wrap_sql):
+        try:
+            if wrap_sql:
+                with connection.execute_wrapper(sample):
+                    for chunk in content:
+                        sample.bytes += len(chunk)
+                        yield chunk
+            else:
+                for chunk in content:
+                    sample.bytes += len(chunk)
+                    yield chunk
+        finally:
+            self.finish(request, response, sample)
+
+    async def astream(self, content, request, response, sample):
+        try:
+            async for chunk in content:
+                sample.bytes += len(chunk)
+                yield chunk
+        finally:
+            self.finish(request, response, sample)
+
+    def finish(self, request, response, sample):
+        duration = time.perf_counter() - sample.start
+        view = view_label(request)
+        values = {
+            'journal_request_duration_seconds': duration,
+            'journal_response_bytes': sample.bytes,
+        }
+        if sample.track_sql:
+            values['journal_request_db_queries'] = sample.queries
+            values['journal_request_db_seconds'] = sample.db_time
+        peak = sample.peak_memory()
+        if peak is not None:
+            values['journal_request_peak_alloc_bytes'] = peak
+        REGISTRY.observe(view, **values)
+
+        threshold = settings.PERF_SLOW_REQUEST_MS
+        if threshold and duration * 1000 >= threshold:
+            fields = {
+                'view': view, 'method': request.method, 'path': request.path,
+                'status': response.status_code, 'duration_ms': round(duration * 1000, 1),
+                'db_queries': sample.queries, 'db_ms': round(sample.db_time * 1000, 1),
+                'bytes': sample.bytes, 'peak_alloc': peak,
+            }
+            # logfmt, so the line can be parsed back out of plain console logs.
+            logger.warning(
+                'slow_request %s', ' '.join(f'{key}={logfmt(value)}' for key, value in fields.items()),
+                extra={'perf': fields})
+
+
+class ProfilingMiddleware:
+    """Run a request under cProfile when asked to, and store the profile.
+
+    A request is profiled when a staff user sends ``X-Profile: 1`` or adds
+    ``?_profile=1``, or when it falls within
+    SiteConfiguration.profile_sample_rate (optionally limited to
+    profile_path_prefix). Everything else passes straight through: with
+    PROFILING_ENABLED off the middleware isn't installed at all.
+    Streaming responses are profiled chunk by chunk while they are sent.
+    It is sync-only: under ASGI Django runs it in a thread like any other,
+    and async streaming responses are profiled up to the first byte.
+    """
+    HEADER = 'HTTP_X_PROFILE'
+    QUERY_FLAG = '_profile'
+
+    def __init__(self, get_response):
+        if not settings.PROFILING_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        trigger = self.trigger(request)
+        if trigger is None:
+            return self.get_response(request)
+
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:  # another profiler (e.g. a debugger) is active
+            return self.get_response(request)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            profiler.disable()
+        if response.streaming and getattr(response, 'file_to_stream', None) is None and not response.is_async:
+            response.streaming_content = self.stream(
+                response.streaming_content, profiler, request, response, trigger, start)
+        else:
+            self.save(profiler, request, response, trigger, start)
+        return response
+
+    def trigger(self, request):
+        if request.META.get(self.HEADER) == '1' or request.GET.get(self.QUERY_FLAG) == '1':
+            # Only now touch request.user, so the session isn't loaded for
+            # every request just to find out.
+            user = getattr(request, 'user', None)
+            if user is not None and user.is_staff:
+                return RequestProfile.TRIGGER_FLAG
+        config = SiteConfiguration.load()
+        if (config.profile_sample_rate and random.random() < config.profile_sample_rate
+                and request.path.startswith(config.profile_path_prefix)):
+            return RequestProfile.TRIGGER_SAMPLE
+        return None
+
+    def stream(self, content, profiler, request, response, trigger, start):
+        iterator = iter(content)
+        try:
+            while True:
+                profiler.enable()
+                try:
+                    chunk = next(iterator)
+                except StopIteration:
+                    break
+                finally:
+                    profiler.disable()
+                yield chunk
+        finally:
+            self.save(profiler, request, response, trigger, start)
+
+    def save(self, profiler, request, response, trigger, start):
+        duration = time.perf_counter() - start
+        profiler.create_stats()
+        summary = io.StringIO()
+        pstats.Stats(profiler, stream=summary).sort_stats('cumulative').print_stats(40)
+        user = getattr(request, 'user', None)
+        try:
+            RequestProfile.objects.create(
+                user=user if user is not None and user.is_authenticated else None,
+                method=request.method,
+                path=request.path[:500],
+                view_name=view_label(request)[:200],
+                status_code=response.status_code,
+                duration_ms=duration * 1000,
+                trigger=trigger,
+                summary=summary.getvalue(),
+                stats=marshal.dumps(profiler.stats),
+            )
+            # Keep only the newest PROFILE_MAX_STORED.
+            stale = RequestProfile.objects.order_by('-created_at', '-id').values_list('id', flat=True)[
+                settings.PROFILE_MAX_STORED:]
+            stale_ids = list(stale)
+            if stale_ids:
+                RequestProfile.objects.filter(id__in=stale_ids).delete()
+        except Exception:
+            # Losing a profile must never fail the request it measured.
+            logger.exception('Could not store request profile for %s', request.path)
@@ -0,0 +1,18 @@
+# Generated by Django 5.1 on 2026-10-18 19:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('journal', '0005_exportjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='entry',
+            name='version',
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
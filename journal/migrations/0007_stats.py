@@ -0,0 +1,86 @@
+# Generated by Django 5.1 on 2026-10-18 19:18
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+
+def backfill_stats(apps, schema_editor):
+    """Seed the counters from the existing tables (same as rebuild_stats)."""
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    Entry = apps.get_model('journal', 'Entry')
+    SocialAccount = apps.get_model('socialaccount', 'SocialAccount')
+    StatCounter = apps.get_model('journal', 'StatCounter')
+    DailyActivity = apps.get_model('journal', 'DailyActivity')
+
+    StatCounter.objects.bulk_create([
+        StatCounter(name='total_users', value=User.objects.count()),
+        StatCounter(name='total_entries', value=Entry.objects.count()),
+        StatCounter(name='google_users', value=SocialAccount.objects.filter(
+            provider='google').values('user').distinct().count()),
+    ])
+    days = {}
+    for row in Entry.objects.annotate(day=TruncDate('created_at')).values('day').annotate(
+            created=Count('id'), active=Count('user', distinct=True)).order_by():
+        days[row['day']] = DailyActivity(
+            date=row['day'], entries_created=row['created'], active_users=row['active'])
+    for row in User.objects.annotate(day=TruncDate('date_joined')).values('day').annotate(
+            joined=Count('id')).order_by():
+        days.setdefault(row['day'], DailyActivity(date=row['day'])).new_users = row['joined']
+    DailyActivity.objects.bulk_create(days.values(), batch_size=500)
+    # Today's authors, so their next entry doesn't count them again.
+    DailyActiveUser = apps.get_model('journal', 'DailyActiveUser')
+    today = timezone.localdate()
+    DailyActiveUser.objects.bulk_create([
+        DailyActiveUser(date=today, user_id=user_id)
+        for user_id in Entry.objects.filter(created_at__date=today).values_list('user', flat=True).distinct().order_by()
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('journal', '0006_entry_version'),
+        ('socialaccount', '0006_alter_socialaccount_extra_data'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyActivity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+                ('entries_created', models.IntegerField(default=0)),
+                ('new_users', models.IntegerField(default=0)),
+                ('active_users', models.IntegerField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'Daily Activity',
+                'ordering': ['-date'],
+            },
+        ),
+        migrations.CreateModel(
+            name='StatCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DailyActiveUser',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('date', 'user'), name='unique_daily_active_user')],
+            },
+        ),
+        migrations.RunPython(backfill_stats, migrations.RunPython.noop),
+    ]
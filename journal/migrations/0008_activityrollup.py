@@ -0,0 +1,29 @@
+# Generated by Django 5.1 on 2026-10-18 19:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('journal', '0007_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ActivityRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day')], max_length=4)),
+                ('bucket_start', models.DateTimeField()),
+                ('entries_created', models.IntegerField(default=0)),
+                ('active_users', models.IntegerField(default=0)),
+                ('new_signups', models.IntegerField(default=0)),
+                ('bytes_written', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['period', 'bucket_start'],
+                'constraints': [models.UniqueConstraint(fields=('period', 'bucket_start'), name='unique_rollup_bucket')],
+            },
+        ),
+    ]
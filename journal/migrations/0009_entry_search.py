@@ -0,0 +1,46 @@
+import html
+
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+from django.utils.html import strip_tags
+
+# Keep in sync with journal.search.pg_vector(): queries only use the index
+# if they compute exactly this expression.
+PG_INDEX = GinIndex(SearchVector('title', 'content', config='english'), name='entry_search_idx')
+
+
+def create_search_index(apps, schema_editor):
+    Entry = apps.get_model('journal', 'Entry')
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.add_index(Entry, PG_INDEX)
+    elif vendor == 'sqlite':
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE journal_entry_fts USING fts5(title, body, tokenize='porter unicode61')")
+        rows = (
+            (entry.pk, entry.title, html.unescape(strip_tags(entry.content or '')))
+            for entry in Entry.objects.only('id', 'title', 'content').iterator(chunk_size=500)
+        )
+        with schema_editor.connection.cursor() as cursor:
+            cursor.executemany('INSERT INTO journal_entry_fts (rowid, title, body) VALUES (%s, %s, %s)', rows)
+
+
+def drop_search_index(apps, schema_editor):
+    Entry = apps.get_model('journal', 'Entry')
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.remove_index(Entry, PG_INDEX)
+    elif vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS journal_entry_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('journal', '0008_activityrollup'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
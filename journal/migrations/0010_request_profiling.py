@@ -0,0 +1,47 @@
+# Generated by Django 5.1 on 2026-10-18 19:36
+
+import django.core.validators
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('journal', '0009_entry_search'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='siteconfiguration',
+            name='profile_path_prefix',
+            field=models.CharField(blank=True, help_text='Only sample paths starting with this, e.g. /api/entries (blank: all).', max_length=200),
+        ),
+        migrations.AddField(
+            model_name='siteconfiguration',
+            name='profile_sample_rate',
+            field=models.FloatField(default=0.0, help_text='Fraction of requests to run under cProfile (0 disables sampling).', validators=[django.core.validators.MinValueValidator(0.0), django.core.validators.MaxValueValidator(1.0)]),
+        ),
+        migrations.CreateModel(
+            name='RequestProfile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('method', models.CharField(max_length=10)),
+                ('path', models.CharField(max_length=500)),
+                ('view_name', models.CharField(blank=True, max_length=200)),
+                ('status_code', models.PositiveSmallIntegerField(default=0)),
+                ('duration_ms', models.FloatField(default=0)),
+                ('trigger', models.CharField(choices=[('flag', 'Staff flag'), ('sample', 'Sampled')], max_length=10)),
+                ('summary', models.TextField(blank=True)),
+                ('stats', models.BinaryField()),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name_plural': 'Request Profiles',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
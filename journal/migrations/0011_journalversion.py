@@ -0,0 +1,20 @@
+# Generated by Django 5.1 on 2026-10-18 19:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('journal', '0010_request_profiling'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JournalVersion',
+            fields=[
+                ('user_id', models.IntegerField(primary_key=True, serialize=False)),
+                ('version', models.BigIntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -0,0 +1,74 @@
+# Generated by Django 5.1 on 2026-10-18 19:45
+
+import hashlib
+
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations, models
+
+from journal.migrations._sanitize_0012 import clean
+
+# The search index moves from the raw HTML to the derived plain text; keep
+# NEW_PG_INDEX in sync with journal.search.pg_vector().
+OLD_PG_INDEX = GinIndex(SearchVector('title', 'content', config='english'), name='entry_search_idx')
+NEW_PG_INDEX = GinIndex(SearchVector('title', 'plain_text', config='english'), name='entry_search_idx')
+
+
+def prepare_entries(apps, schema_editor):
+    """Sanitize every stored entry and fill in the derived columns."""
+    Entry = apps.get_model('journal', 'Entry')
+    batch = []
+    for entry in Entry.objects.only('id', 'content').iterator(chunk_size=500):
+        # Same steps as Entry.prepare_content().
+        entry.content, entry.plain_text = clean(entry.content)
+        entry.word_count = len(entry.plain_text.split())
+        entry.content_hash = hashlib.sha256(entry.content.encode()).hexdigest()
+        batch.append(entry)
+        if len(batch) >= 500:
+            Entry.objects.bulk_update(batch, ['content', 'plain_text', 'word_count', 'content_hash'])
+            batch = []
+    Entry.objects.bulk_update(batch, ['content', 'plain_text', 'word_count', 'content_hash'])
+
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.remove_index(Entry, OLD_PG_INDEX)
+        schema_editor.add_index(Entry, NEW_PG_INDEX)
+    elif vendor == 'sqlite':
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute('DELETE FROM journal_entry_fts')
+            cursor.executemany(
+                'INSERT INTO journal_entry_fts (rowid, title, body) VALUES (%s, %s, %s)',
+                Entry.objects.values_list('id', 'title', 'plain_text').iterator(chunk_size=500))
+
+
+def restore_search_index(apps, schema_editor):
+    Entry = apps.get_model('journal', 'Entry')
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.remove_index(Entry, NEW_PG_INDEX)
+        schema_editor.add_index(Entry, OLD_PG_INDEX)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('journal', '0011_journalversion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='entry',
+            name='content_hash',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='entry',
+            name='plain_text',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='entry',
+            name='word_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(prepare_entries, restore_search_index),
+    ]
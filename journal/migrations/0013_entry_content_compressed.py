@@ -0,0 +1,74 @@
+# Generated by Django 5.1 on 2026-10-18 19:50
+
+from django.db import migrations
+
+import journal.compression
+
+# Rows keep their text as plain UTF-8, which the new field reads as is;
+# `manage.py compress_entries` compresses them afterwards.
+PG_TO_BYTES = "ALTER TABLE journal_entry ALTER COLUMN content TYPE bytea USING convert_to(content, 'UTF8')"
+PG_TO_TEXT = "ALTER TABLE journal_entry ALTER COLUMN content TYPE text USING convert_from(content, 'UTF8')"
+
+
+def compressed_field():
+    field = journal.compression.CompressedTextField()
+    field.set_attributes_from_name('content')
+    return field
+
+
+def to_bytes(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        # A plain AlterField would cast with ::bytea, which treats
+        # backslashes in the text as escapes.
+        schema_editor.execute(PG_TO_BYTES)
+    else:
+        Entry = apps.get_model('journal', 'Entry')
+        schema_editor.alter_field(Entry, Entry._meta.get_field('content'), compressed_field())
+
+
+def to_text(apps, schema_editor):
+    """Decompress every row, then turn the column back into text."""
+    connection = schema_editor.connection
+    last_id = 0
+    with connection.cursor() as cursor:
+        while True:
+            cursor.execute('SELECT id, content FROM journal_entry WHERE id > %s ORDER BY id LIMIT 500', [last_id])
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            updates = []
+            for entry_id, value in rows:
+                if value is None or isinstance(value, str):
+                    continue
+                text = journal.compression.decode(value)
+                # Postgres converts the bytes to text in the ALTER below.
+                updates.append((text.encode() if connection.vendor == 'postgresql' else text, entry_id))
+            cursor.executemany('UPDATE journal_entry SET content = %s WHERE id = %s', updates)
+    if connection.vendor == 'postgresql':
+        schema_editor.execute(PG_TO_TEXT)
+    else:
+        Entry = apps.get_model('journal', 'Entry')
+        schema_editor.alter_field(Entry, compressed_field(), Entry._meta.get_field('content'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('journal', '0012_entry_plain_text'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name='entry',
+                    name='content',
+                    field=journal.compression.CompressedTextField(),
+                ),
+            ],
+            database_operations=[
+                migrations.RunPython(to_bytes, to_text),
+            ],
+        ),
+    ]
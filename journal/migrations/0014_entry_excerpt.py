@@ -0,0 +1,50 @@
+# Generated by Django 5.1 on 2026-10-18 19:56
+
+from django.conf import settings
+from django.db import migrations, models
+from django.utils.text import Truncator
+
+
+def fill_summaries(apps, schema_editor):
+    """Backfill excerpt and content_length, as Entry.prepare_content() does."""
+    Entry = apps.get_model('journal', 'Entry')
+    batch = []
+    for entry in Entry.objects.only('id', 'content', 'plain_text').iterator(chunk_size=500):
+        entry.excerpt = Truncator(' '.join(entry.plain_text.split())).chars(200)
+        entry.content_length = len(entry.content)
+        batch.append(entry)
+        if len(batch) >= 500:
+            Entry.objects.bulk_update(batch, ['excerpt', 'content_length'])
+            batch = []
+    Entry.objects.bulk_update(batch, ['excerpt', 'content_length'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('journal', '0013_entry_content_compressed'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='entry',
+            name='entry_user_list_idx',
+        ),
+        migrations.AddField(
+            model_name='entry',
+            name='content_length',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='entry',
+            name='excerpt',
+            field=models.CharField(blank=True, default='', max_length=200),
+        ),
+        # Fill the excerpts before the index that includes them is built.
+        migrations.RunPython(fill_summaries, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='entry',
+            index=models.Index(fields=['user', '-created_at', '-id'], include=('title', 'duration_str', 'excerpt'), name='entry_user_list_idx'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.1 on 2026-10-18 20:00
+
+import django.db.models.deletion
+import journal.compression
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('journal', '0014_entry_excerpt'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EntryRevision',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.PositiveIntegerField()),
+                ('version', models.PositiveIntegerField()),
+                ('title', models.CharField(max_length=255)),
+                ('content_hash', models.CharField(max_length=64)),
+                ('is_keyframe', models.BooleanField(default=False)),
+                ('data', journal.compression.CompressedTextField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('saved_at', models.DateTimeField(auto_now=True)),
+                ('entry', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='revisions', to='journal.entry')),
+            ],
+            options={
+                'ordering': ['entry', '-number'],
+                'constraints': [models.UniqueConstraint(fields=('entry', 'number'), name='unique_entry_revision')],
+            },
+        ),
+    ]
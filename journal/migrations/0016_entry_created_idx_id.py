@@ -0,0 +1,23 @@
+# Generated by Django 5.1 on 2026-10-18 20:21
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('journal', '0015_entryrevision'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='entry',
+            name='entry_created_idx',
+        ),
+        migrations.AddIndex(
+            model_name='entry',
+            index=models.Index(fields=['-created_at', '-id'], name='entry_created_idx'),
+        ),
+    ]
@@ -0,0 +1,148 @@
+"""Frozen copy of journal/sanitize.py as of migration 0012_entry_plain_text.
+
+0012 sanitizes every stored entry with this exact code. Migrations must
+replay the same way however journal.sanitize changes later, so this module
+is never edited; a later data migration that needs different rules gets
+its own copy. The leading underscore keeps Django's migration loader from
+treating it as a migration.
+"""
+import re
+from html import escape
+from html.parser import HTMLParser
+
+ALLOWED_TAGS = {
+    'a', 'b', 'blockquote', 'br', 'code', 'div', 'em', 'font', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6',
+    'hr', 'i', 'li', 'mark', 'ol', 'p', 'pre', 's', 'span', 'strike', 'strong', 'sub', 'sup', 'u', 'ul',
+}
+VOID_TAGS = {'br', 'hr'}
+# Dropped together with everything inside them.
+DROP_CONTENT_TAGS = {'script', 'style', 'iframe', 'object', 'embed', 'template', 'noscript', 'svg', 'math', 'head', 'title'}
+# Tags that start a new line in the plain text.
+BLOCK_TAGS = {'blockquote', 'br', 'div', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'hr', 'li', 'ol', 'p', 'pre', 'ul'}
+# Other block elements (e.g. from pasted pages) become divs, keeping their line breaks.
+BLOCK_ALIASES = dict.fromkeys(
+    ('address', 'article', 'aside', 'dd', 'dl', 'dt', 'figure', 'footer', 'header', 'main', 'nav',
+     'section', 'table', 'tbody', 'thead', 'tr'), 'div')
+
+ALLOWED_ATTRIBUTES = {
+    'a': {'href', 'title'},
+    'font': {'color', 'face', 'size'},
+}
+STYLED_TAGS = {'div', 'font', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'li', 'p', 'span'}
+ALLOWED_STYLES = {
+    'background-color', 'color', 'font-family', 'font-size', 'font-style', 'font-weight',
+    'text-align', 'text-decoration',
+}
+SAFE_URL_RE = re.compile(r'^(?:https?:|mailto:|[^:]*$)', re.IGNORECASE)
+SAFE_STYLE_VALUE_RE = re.compile(r"^[\w\s#%.,'\"()+-]*$")
+
+
+def clean_style(value):
+    declarations = []
+    for declaration in value.split(';'):
+        name, _, style_value = declaration.partition(':')
+        name, style_value = name.strip().lower(), style_value.strip()
+        if (name in ALLOWED_STYLES and style_value and SAFE_STYLE_VALUE_RE.match(style_value)
+                and 'url(' not in style_value.lower() and 'expression' not in style_value.lower()):
+            declarations.append(f'{name}: {style_value}')
+    return '; '.join(declarations)
+
+
+def clean_attributes(tag, attrs):
+    allowed = ALLOWED_ATTRIBUTES.get(tag, set())
+    cleaned = []
+    for name, value in attrs:
+        value = value or ''
+        if name == 'style' and tag in STYLED_TAGS:
+            value = clean_style(value)
+            if value:
+                cleaned.append((name, value))
+        elif name in allowed:
+            # Control characters and whitespace can hide a javascript: scheme.
+            if name == 'href' and not SAFE_URL_RE.match(re.sub(r'[\x00-\x20]', '', value)):
+                continue
+            cleaned.append((name, value))
+    return ''.join(f' {name}="{escape(value)}"' for name, value in cleaned)
+
+
+def text_escape(text):
+    # Keep non-breaking spaces as the entity browsers serialize them as.
+    return escape(text, quote=False).replace('\xa0', '&nbsp;')
+
+
+class Cleaner(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.html = []
+        self.text = []
+        self.open_tags = []
+        self.dropping = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in DROP_CONTENT_TAGS:
+            self.dropping += 1
+            return
+        if self.dropping:
+            return
+        tag = BLOCK_ALIASES.get(tag, tag)
+        if tag in BLOCK_TAGS:
+            self.text.append('\n')
+        if tag not in ALLOWED_TAGS:
+            return
+        self.html.append(f'<{tag}{clean_attributes(tag, attrs)}>')
+        if tag not in VOID_TAGS:
+            self.open_tags.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_TAGS and tag not in DROP_CONTENT_TAGS:
+            self.handle_endtag(tag)
+        elif tag in DROP_CONTENT_TAGS:
+            self.dropping -= 1
+
+    def handle_endtag(self, tag):
+        if tag in DROP_CONTENT_TAGS:
+            self.dropping = max(self.dropping - 1, 0)
+            return
+        if self.dropping:
+            return
+        tag = BLOCK_ALIASES.get(tag, tag)
+        if tag not in self.open_tags:
+            return  # stray end tag
+        if tag in BLOCK_TAGS:
+            self.text.append('\n')
+        # Close anything left open inside it, as browsers do.
+        while self.open_tags:
+            open_tag = self.open_tags.pop()
+            self.html.append(f'</{open_tag}>')
+            if open_tag == tag:
+                break
+
+    def handle_data(self, data):
+        if self.dropping:
+            return
+        self.html.append(text_escape(data))
+        self.text.append(data)
+
+    def close(self):
+        super().close()
+        while self.open_tags:
+            self.html.append(f'</{self.open_tags.pop()}>')
+
+
+def normalize_text(text):
+    """Collapse whitespace within lines and runs of blank lines."""
+    lines = [' '.join(line.split()) for line in text.split('\n')]
+    collapsed = []
+    for line in lines:
+        if line or (collapsed and collapsed[-1]):
+            collapsed.append(line)
+    return '\n'.join(collapsed).strip()
+
+
+def clean(html):
+    """``(safe_html, plain_text)`` for a chunk of editor HTML."""
+    cleaner = Cleaner()
+    cleaner.feed(html or '')
+    cleaner.close()
+    return ''.join(cleaner.html), normalize_text(''.join(cleaner.text))
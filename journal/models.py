@@ -1,48 +1,194 @@
+import hashlib
+import time
+
 from django.db import models
 from django.conf import settings
 from django.core.cache import cache
+from django.core.validators import MaxValueValidator, MinValueValidator
+from django.utils.text import Truncator
+
+from .compression import CompressedTextField
+
+EXCERPT_LENGTH = 200
+
+
+class EntryQuerySet(models.QuerySet):
+    # Named column sets for only(). Other columns stay deferred and cost a
+    # query each if touched, so views must stick to what they load.
+    PROJECTIONS = {
+        # Lists and dashboards: everything except the content and its text.
+        'summary': ('id', 'user', 'title', 'excerpt', 'content_length', 'word_count',
+                    'created_at', 'updated_at', 'duration_str', 'version', 'ip_address'),
+        # Search results: snippets come from the plain text.
+        'search': ('id', 'user', 'title', 'created_at', 'duration_str', 'plain_text'),
+    }
+
+    def projection(self, name):
+        return self.only(*self.PROJECTIONS[name])
+
+    def summary(self):
+        return self.projection('summary')
+
 
 class Entry(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='entries')
     title = models.CharField(max_length=255)
-    content = models.TextField()
+    # Stored as bytes, compressed when large; decoded on first access.
+    content = CompressedTextField()
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     ip_address = models.GenericIPAddressField(null=True, blank=True)
     duration_str = models.CharField(max_length=50, default="0s")
+    # Bumped on every save; delta saves must name the version they edit.
+    version = models.PositiveIntegerField(default=1)
+    # Derived from content by prepare_content() on save (journal.sanitize).
+    plain_text = models.TextField(blank=True, default='')
+    word_count = models.PositiveIntegerField(default=0)
+    content_hash = models.CharField(max_length=64, blank=True, default='')
+    excerpt = models.CharField(max_length=EXCERPT_LENGTH, blank=True, default='')
+    content_length = models.PositiveIntegerField(default=0)
+
+    objects = EntryQuerySet.as_manager()
+
+    # Set False before save() to start a new revision rather than fold the
+    # save into a recent one (journal.revisions), e.g. when restoring.
+    coalesce_revisions = True
 
     class Meta:
         ordering = ['-created_at']
         verbose_name_plural = "Journal Entries"
+        indexes = [
+            # Every user-facing list filters by user and walks newest first.
+            models.Index(fields=['user', '-created_at'], name='entry_user_created_idx'),
+            # Keyset pagination key plus the sidebar projection, so list pages
+            # are index-only scans on Postgres (INCLUDE is ignored elsewhere).
+            models.Index(
+                fields=['user', '-created_at', '-id'],
+                include=['title', 'duration_str', 'excerpt'],
+                name='entry_user_list_idx',
+            ),
+            # Admin dashboard's recent entries and the entry changelist, which
+            # Django orders by (-created_at, -pk) to make it deterministic.
+            models.Index(fields=['-created_at', '-id'], name='entry_created_idx'),
+        ]
+
+    DERIVED_FIELDS = ('content', 'plain_text', 'word_count', 'content_hash', 'excerpt', 'content_length')
 
     def __str__(self):
         return f"{self.title} ({self.user.username})"
 
+    def prepare_content(self):
+        """Sanitize content and recompute the fields derived from it.
+
+        save() calls this; code that bypasses it (bulk_create, bulk_update)
+        must call it itself.
+        """
+        from .sanitize import clean
+        self.content, self.plain_text = clean(self.content)
+        self.word_count = len(self.plain_text.split())
+        self.content_hash = hashlib.sha256(self.content.encode()).hexdigest()
+        self.excerpt = Truncator(' '.join(self.plain_text.split())).chars(EXCERPT_LENGTH)
+        self.content_length = len(self.content)
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'content' in update_fields:
+            self.prepare_content()
+            if update_fields is not None:
+                kwargs['update_fields'] = set(update_fields) | set(self.DERIVED_FIELDS)
+        super().save(*args, **kwargs)
+
+class EntryRevision(models.Model):
+    """One saved state of an entry, stored as a keyframe or a diff (journal.revisions)."""
+    entry = models.ForeignKey(Entry, on_delete=models.CASCADE, related_name='revisions')
+    # 1, 2, 3... per entry; gaps only where old revisions were pruned.
+    number = models.PositiveIntegerField()
+    # Entry.version the state was saved at.
+    version = models.PositiveIntegerField()
+    title = models.CharField(max_length=255)
+    content_hash = models.CharField(max_length=64)
+    is_keyframe = models.BooleanField(default=False)
+    # Keyframes: the full content. Others: a JSON delta against the previous revision.
+    data = CompressedTextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    saved_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['entry', '-number']
+        constraints = [
+            models.UniqueConstraint(fields=['entry', 'number'], name='unique_entry_revision'),
+        ]
+
+    def __str__(self):
+        return f"{self.title} (revision {self.number})"
+
 class SiteConfiguration(models.Model):
     site_name = models.CharField(max_length=100, default="Journal App")
     maintenance_mode = models.BooleanField(default=False, help_text="If active, only admins can access the site.")
     allow_registration = models.BooleanField(default=True)
     welcome_message = models.TextField(default="Welcome to your personal secure journal.")
+    profile_sample_rate = models.FloatField(
+        default=0.0, validators=[MinValueValidator(0.0), MaxValueValidator(1.0)],
+        help_text="Fraction of requests to run under cProfile (0 disables sampling).")
+    profile_path_prefix = models.CharField(
+        max_length=200, blank=True, help_text="Only sample paths starting with this, e.g. /api/entries (blank: all).")
     
+    CACHE_KEY = 'site_config'
+
+    # Per-process copy: (instance, monotonic expiry). Other workers pick up a
+    # change from the shared cache once their copy expires. That only holds
+    # if the default cache really is shared: with the per-process locmem
+    # default and several workers, a worker that didn't make the change keeps
+    # its cached copy indefinitely. Set CACHE_URL in that case (`manage.py
+    # check --deploy` warns about locmem).
+    _local = None
+
     # Singleton pattern enforcement
     def save(self, *args, **kwargs):
         self.pk = 1
         super(SiteConfiguration, self).save(*args, **kwargs)
-        cache.set('site_config', self)
+        cache.set(self.CACHE_KEY, self, None)
+        SiteConfiguration._local = (self, time.monotonic() + settings.SITE_CONFIG_LOCAL_TTL)
 
     def delete(self, *args, **kwargs):
         pass # Prevent deletion
 
     @classmethod
     def load(cls):
+        """Read-through: process copy, then shared cache, then the database.
+
+        The returned instance is shared by every request in this process;
+        treat it as read-only and use ``load_for_update`` to change settings.
+        """
+        local = cls._local
+        now = time.monotonic()
+        if local is not None and local[1] > now:
+            return local[0]
+
+        obj = cache.get(cls.CACHE_KEY)
+        if obj is None:
+            obj, created = cls.objects.get_or_create(pk=1)
+            cache.set(cls.CACHE_KEY, obj, None)
+        cls._local = (obj, now + settings.SITE_CONFIG_LOCAL_TTL)
+        return obj
+
+    @classmethod
+    def load_for_update(cls):
+        """Fresh, private instance from the database for editing."""
         obj, created = cls.objects.get_or_create(pk=1)
         return obj
 
+    @classmethod
+    def invalidate(cls):
+        """Drop the process copy and the shared cache entry."""
+        cls._local = None
+        cache.delete(cls.CACHE_KEY)
+
     def __str__(self):
         return "Site Configuration"
 
 class PasswordResetRequest(models.Model):
-    """Track password reset requests for rate limiting (1 per day per user)"""
+    """Audit log of password reset requests (limits are enforced by journal.ratelimit)"""
     email = models.EmailField(db_index=True)
     requested_at = models.DateTimeField(auto_now_add=True)
     ip_address = models.GenericIPAddressField(null=True, blank=True)
@@ -54,28 +200,162 @@ class PasswordResetRequest(models.Model):
     def __str__(self):
         return f"Reset request for {self.email} at {self.requested_at}"
     
-    @classmethod
-    def can_request_reset(cls, email):
-        """Check if user can request password reset (once per 24 hours)"""
-        from django.utils import timezone
-        from datetime import timedelta
-        
-        # Check if there's a recent request within last 24 hours
-        one_day_ago = timezone.now() - timedelta(days=1)
-        recent_request = cls.objects.filter(
-            email=email,
-            requested_at__gte=one_day_ago
-        ).first()
-        
-        if recent_request:
-            # Calculate time remaining
-            time_diff = timezone.now() - recent_request.requested_at
-            hours_remaining = 24 - (time_diff.total_seconds() / 3600)
-            return False, hours_remaining
-        
-        return True, 0
-    
     @classmethod
     def create_request(cls, email, ip_address=None):
         """Create a new password reset request"""
         return cls.objects.create(email=email, ip_address=ip_address)
+
+class JournalVersion(models.Model):
+    """Per-user counter bumped on every entry write (see journal.versions).
+
+    Keyed by the bare user id rather than a foreign key: the row outlives
+    its user so versions never repeat for a reused id.
+    """
+    user_id = models.IntegerField(primary_key=True)
+    version = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"Journal of user {self.user_id} at version {self.version}"
+
+class RateLimitCounter(models.Model):
+    """A rate-limit window counter, used when the cache can't count atomically.
+
+    See journal.ratelimit: Redis and locmem count in the cache, database
+    and file caches fall back to these rows.
+    """
+    key = models.CharField(max_length=128, unique=True)
+    count = models.IntegerField(default=0)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"{self.key} = {self.count}"
+
+class ExportJob(models.Model):
+    """A journal export built in the background and downloaded later."""
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_READY = 'ready'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_READY, 'Ready'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='export_jobs')
+    format = models.CharField(max_length=20, default='zip')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    # Snapshot of the user's entries the export was built from; a ready job
+    # is reused until this changes.
+    fingerprint = models.CharField(max_length=64)
+    file_path = models.CharField(max_length=500, blank=True)
+    size = models.BigIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name_plural = "Export Jobs"
+        indexes = [
+            models.Index(fields=['user', 'format', 'fingerprint'], name='exportjob_reuse_idx'),
+            models.Index(fields=['status', 'created_at'], name='exportjob_queue_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.format} export for {self.user} ({self.status})"
+
+class StatCounter(models.Model):
+    """Running site-wide totals for the admin dashboard (see journal.stats)."""
+    name = models.CharField(max_length=50, unique=True)
+    value = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name} = {self.value}"
+
+
+class DailyActivity(models.Model):
+    """Per-day activity counters, maintained incrementally by signals."""
+    date = models.DateField(unique=True)
+    entries_created = models.IntegerField(default=0)
+    new_users = models.IntegerField(default=0)
+    active_users = models.IntegerField(default=0)
+
+    class Meta:
+        ordering = ['-date']
+        verbose_name_plural = "Daily Activity"
+
+    def __str__(self):
+        return f"Activity on {self.date}"
+
+
+class DailyActiveUser(models.Model):
+    """Marks a user as active on a day, so active_users counts each user once."""
+    date = models.DateField()
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'user'], name='unique_daily_active_user'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} active on {self.date}"
+
+
+class ActivityRollup(models.Model):
+    """Hourly or daily activity totals, filled by the rollup_activity command."""
+    PERIOD_HOUR = 'hour'
+    PERIOD_DAY = 'day'
+    PERIOD_CHOICES = [
+        (PERIOD_HOUR, 'Hour'),
+        (PERIOD_DAY, 'Day'),
+    ]
+
+    period = models.CharField(max_length=4, choices=PERIOD_CHOICES)
+    bucket_start = models.DateTimeField()
+    entries_created = models.IntegerField(default=0)
+    active_users = models.IntegerField(default=0)
+    new_signups = models.IntegerField(default=0)
+    bytes_written = models.BigIntegerField(default=0)
+
+    class Meta:
+        ordering = ['period', 'bucket_start']
+        constraints = [
+            models.UniqueConstraint(fields=['period', 'bucket_start'], name='unique_rollup_bucket'),
+        ]
+
+    def __str__(self):
+        return f"{self.period} from {self.bucket_start}"
+
+
+class RequestProfile(models.Model):
+    """A cProfile run of one request (see journal.middleware.ProfilingMiddleware)."""
+    TRIGGER_FLAG = 'flag'
+    TRIGGER_SAMPLE = 'sample'
+    TRIGGER_CHOICES = [
+        (TRIGGER_FLAG, 'Staff flag'),
+        (TRIGGER_SAMPLE, 'Sampled'),
+    ]
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=500)
+    view_name = models.CharField(max_length=200, blank=True)
+    status_code = models.PositiveSmallIntegerField(default=0)
+    duration_ms = models.FloatField(default=0)
+    trigger = models.CharField(max_length=10, choices=TRIGGER_CHOICES)
+    # Top functions by cumulative time, as printed by pstats.
+    summary = models.TextField(blank=True)
+    # marshal'd pstats data, the same bytes cProfile.Profile.dump_stats writes.
+    stats = models.BinaryField()
+
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name_plural = "Request Profiles"
+
+    def __str__(self):
+        return f"{self.method} {self.path} ({self.duration_ms:.0f} ms)"
@@ -0,0 +1,187 @@
+"""Sliding-window rate limiting on shared counters.
+
+Limits are named in settings.RATE_LIMITS as "<count>/<period>", e.g.
+'5/15m'. Each (limit, identity) pair keeps one counter per fixed window.
+The sliding window is approximated by also counting the previous window,
+weighted by how much of it still overlaps. That needs two counters and no
+table scans. Rejected attempts are not counted, so a blocked client is let
+back in on schedule.
+
+Counters live in the default cache when it increments atomically (Redis,
+memcached, locmem). Django's database and file caches implement ``incr``
+as get+set, which undercounts parallel attempts, so with those the
+counters are RateLimitCounter rows bumped with ``UPDATE ... count + 1``
+instead. With several workers the cache must be shared (CACHE_URL); with
+the per-process locmem default every worker counts separately.
+"""
+import hashlib
+import math
+import re
+import time
+from datetime import timedelta
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.cache.backends.memcached import BaseMemcachedCache
+from django.core.cache.backends.redis import RedisCache
+from django.db import transaction
+from django.db.models import F
+from django.http import JsonResponse
+from django.utils import timezone
+
+from .models import RateLimitCounter
+
+RATE_RE = re.compile(r'^\s*(\d+)\s*/\s*(\d*)\s*([smhd])\s*$')
+UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+# Cache backends whose incr/decr are atomic.
+ATOMIC_BACKENDS = (RedisCache, BaseMemcachedCache, LocMemCache)
+
+
+def parse_rate(value):
+    """'5/15m' -> (5, 900). Raises ValueError for anything else."""
+    match = RATE_RE.match(value or '')
+    if not match:
+        raise ValueError(f"Invalid rate '{value}', expected e.g. '5/15m'")
+    count, multiplier, unit = match.groups()
+    return int(count), int(multiplier or 1) * UNITS[unit]
+
+
+def cache_key(name, identity, window):
+    digest = hashlib.sha256(str(identity).lower().encode()).hexdigest()[:32]
+    return f'rl:{name}:{digest}:{window}'
+
+
+def retry_after(limit, period, previous, current, elapsed):
+    """Seconds until one more hit fits under ``limit``."""
+    if current + 1 > limit:
+        # Wait for this window to become the previous one and decay enough.
+        decay = period * (current - limit + 1) / current if current else 0
+        return (period - elapsed) + max(decay, 0)
+    # The previous window's overlap has to shrink, or the window roll over.
+    return min(period * (previous - limit + current + 1) / previous - elapsed, period - elapsed)
+
+
+def counts_in_cache():
+    return isinstance(caches[DEFAULT_CACHE_ALIAS], ATOMIC_BACKENDS)
+
+
+def incr(key, timeout):
+    """Add one to the counter ``key`` (expiring after ``timeout`` seconds); returns the new count."""
+    if counts_in_cache():
+        cache.add(key, 0, timeout=timeout)
+        try:
+            return cache.incr(key)
+        except ValueError:  # expired between add and incr
+            cache.set(key, 1, timeout=timeout)
+            return 1
+    now = timezone.now()
+    counters = RateLimitCounter.objects.filter(key=key)
+    with transaction.atomic():
+        # The UPDATE locks the row, so the count read back is this hit's.
+        if not counters.filter(expires_at__gt=now).update(count=F('count') + 1):
+            expires_at = now + timedelta(seconds=timeout)
+            if not counters.filter(expires_at__lte=now).update(count=1, expires_at=expires_at):
+                _, created = RateLimitCounter.objects.get_or_create(
+                    key=key, defaults={'count': 1, 'expires_at': expires_at})
+                if created:
+                    RateLimitCounter.objects.filter(expires_at__lte=now).delete()
+                    return 1
+                # Another process created the row between our UPDATE and INSERT.
+                counters.update(count=F('count') + 1)
+        return counters.values_list('count', flat=True).get()
+
+
+def decr(key):
+    if counts_in_cache():
+        try:
+            cache.decr(key)
+        except ValueError:  # expired meanwhile
+            pass
+    else:
+        RateLimitCounter.objects.filter(key=key, count__gt=0).update(count=F('count') - 1)
+
+
+def get(key):
+    if counts_in_cache():
+        return cache.get(key, 0)
+    return RateLimitCounter.objects.filter(key=key, expires_at__gt=timezone.now()).values_list(
+        'count', flat=True).first() or 0
+
+
+def _hit(name, identity, now):
+    """Count one hit; returns 0 if allowed, else seconds to wait (hit undone)."""
+    limit, period = parse_rate(settings.RATE_LIMITS[name])
+    window = int(now // period)
+    elapsed = now - window * period
+    key = cache_key(name, identity, window)
+    current = incr(key, period * 2)
+    previous = get(cache_key(name, identity, window - 1))
+    if previous * (period - elapsed) / period + current <= limit:
+        return 0
+    decr(key)
+    return retry_after(limit, period, previous, current - 1, elapsed)
+
+
+def hit(limits):
+    """Record one attempt against every ``{limit name: identity}`` pair.
+
+    Returns 0 if all limits allow it, otherwise the seconds until the
+    strictest one would. A rejected attempt isn't counted against any
+    limit. Identities that are None or empty are skipped.
+    """
+    if not settings.RATE_LIMIT_ENABLED:
+        return 0
+    now = time.time()
+    counted = []
+    for name, identity in limits.items():
+        if not identity:
+            continue
+        wait = _hit(name, identity, now)
+        if wait:
+            # Undo the hits already counted for the other limits.
+            for other_name, other_identity in counted:
+                _, period = parse_rate(settings.RATE_LIMITS[other_name])
+                decr(cache_key(other_name, other_identity, int(now // period)))
+            return max(math.ceil(wait), 1)
+        counted.append((name, identity))
+    return 0
+
+
+def too_many_requests(wait, message='Too many requests, please slow down'):
+    response = JsonResponse(
+        {'status': 'error', 'message': f'{message} (retry in {wait}s)', 'retryAfter': wait}, status=429)
+    response['Retry-After'] = str(wait)
+    return response
+
+
+def ratelimit(limits, methods=None):
+    """Decorate a view with ``limits(request) -> {limit name: identity}``.
+
+    Only requests whose method is in ``methods`` (default: all) count.
+    Over the limit the view is skipped and a 429 JSON response returned.
+    Works on sync and async views.
+    """
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                if methods is None or request.method in methods:
+                    # limits() may touch request.user, which needs the ORM.
+                    wait = await sync_to_async(lambda: hit(limits(request)))()
+                    if wait:
+                        return too_many_requests(wait)
+                return await view(request, *args, **kwargs)
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if methods is None or request.method in methods:
+                wait = hit(limits(request))
+                if wait:
+                    return too_many_requests(wait)
+            return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
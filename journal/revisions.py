@@ -0,0 +1,170 @@
+"""Entry revision history stored as diffs between periodic keyframes.
+
+Every save that changes an entry's title or content records an
+EntryRevision. Every ENTRY_REVISION_KEYFRAME_INTERVAL-th revision is a
+keyframe holding the full content. The others hold a delta against the
+revision before them: a JSON list whose items are either ``[start, end]``
+(copy that slice of the previous text) or a string to insert. A delta is
+computed with difflib over tag/word/whitespace tokens. Deltas are stored
+through CompressedTextField like entry content.
+
+Rebuilding revision n reads the nearest keyframe at or before n and the
+deltas after it, in one query. That is at most the keyframe interval in
+rows, however long the history. A delta that saves less than half of the
+full text becomes a keyframe instead.
+
+The editor autosaves every few seconds. A save within
+ENTRY_REVISION_COALESCE_SECONDS of the newest revision's start therefore
+replaces that revision instead of adding one. Each entry keeps about
+ENTRY_REVISION_LIMIT revisions. Old ones are dropped a whole keyframe
+group at a time, so what remains can always be rebuilt.
+
+save() records through the post_save handler below. Code that bypasses
+signals (bulk_create/bulk_update) calls ``record_entries`` itself.
+"""
+import json
+import re
+from datetime import timedelta
+from difflib import SequenceMatcher
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Subquery
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Entry, EntryRevision
+
+# Tags, words and whitespace runs; a stray '<' is its own token.
+TOKEN_RE = re.compile(r'<[^>]*>|[^<\s]+|\s+|<')
+
+
+def diff(old, new):
+    """JSON delta turning ``old`` into ``new``."""
+    a, b = TOKEN_RE.findall(old), TOKEN_RE.findall(new)
+    # Edits are usually local: match the common ends directly and only run
+    # SequenceMatcher on the middle.
+    prefix = 0
+    while prefix < min(len(a), len(b)) and a[prefix] == b[prefix]:
+        prefix += 1
+    suffix = 0
+    while suffix < min(len(a), len(b)) - prefix and a[-1 - suffix] == b[-1 - suffix]:
+        suffix += 1
+    offsets = [0]
+    for token in a:
+        offsets.append(offsets[-1] + len(token))
+
+    ops = []
+    if prefix:
+        ops.append([0, offsets[prefix]])
+    matcher = SequenceMatcher(None, a[prefix:len(a) - suffix], b[prefix:len(b) - suffix], autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            ops.append([offsets[prefix + i1], offsets[prefix + i2]])
+        elif j2 > j1:
+            ops.append(''.join(b[prefix + j1:prefix + j2]))
+    if suffix:
+        ops.append([offsets[len(a) - suffix], offsets[len(a)]])
+    return json.dumps(ops, separators=(',', ':'), ensure_ascii=False)
+
+
+def patch(old, delta):
+    """Apply a ``diff()`` delta to ``old``."""
+    return ''.join(old[op[0]:op[1]] if isinstance(op, list) else op for op in json.loads(delta))
+
+
+def chain(entry_id, number=None):
+    """Revisions from the keyframe at or before ``number`` (default: newest) up to it."""
+    revisions = EntryRevision.objects.filter(entry_id=entry_id)
+    if number is not None:
+        revisions = revisions.filter(number__lte=number)
+    keyframe = revisions.filter(is_keyframe=True).order_by('-number').values('number')[:1]
+    return list(revisions.filter(number__gte=Subquery(keyframe)).order_by('number'))
+
+
+def replay(revisions):
+    """The text of each revision in a chain, in order."""
+    texts = []
+    for revision in revisions:
+        texts.append(revision.data if revision.is_keyframe else patch(texts[-1], revision.data))
+    return texts
+
+
+def get_revision(entry_id, number):
+    """Revision ``number`` with its rebuilt text as ``.content``, or None."""
+    revisions = chain(entry_id, number)
+    if not revisions or revisions[-1].number != number:
+        return None
+    revision = revisions[-1]
+    revision.content = replay(revisions)[-1]
+    return revision
+
+
+def encode(base, content, position):
+    """(is_keyframe, data) for ``content`` at ``position`` in its chain after ``base``."""
+    if base is None or position >= settings.ENTRY_REVISION_KEYFRAME_INTERVAL:
+        return True, content
+    delta = diff(base, content)
+    if len(delta) * 2 >= len(content):
+        return True, content
+    return False, delta
+
+
+def record(entry):
+    """Record the entry's current title and content, unless the newest revision has them."""
+    revisions = chain(entry.pk)
+    newest = revisions[-1] if revisions else None
+    if newest is not None and newest.content_hash == entry.content_hash and newest.title == entry.title:
+        return None
+    texts = replay(revisions)
+
+    window = settings.ENTRY_REVISION_COALESCE_SECONDS
+    if (newest is not None and window and entry.coalesce_revisions
+            and newest.created_at >= timezone.now() - timedelta(seconds=window)):
+        # Fold this save into the newest revision, re-diffed against the one before it.
+        base = texts[-2] if len(texts) > 1 else None
+        newest.is_keyframe, newest.data = encode(base, entry.content, len(texts) - 1)
+        newest.title, newest.content_hash, newest.version = entry.title, entry.content_hash, entry.version
+        newest.save()
+        return newest
+
+    is_keyframe, data = encode(texts[-1] if texts else None, entry.content, len(texts))
+    try:
+        with transaction.atomic():
+            revision = EntryRevision.objects.create(
+                entry=entry, number=newest.number + 1 if newest else 1, version=entry.version,
+                title=entry.title, content_hash=entry.content_hash, is_keyframe=is_keyframe, data=data)
+    except IntegrityError:
+        # A concurrent save took the number; its revision stands and the
+        # next save records this state.
+        return None
+    if is_keyframe:
+        prune(entry.pk)
+    return revision
+
+
+def record_entries(entries):
+    for entry in entries:
+        record(entry)
+
+
+def prune(entry_id):
+    """Drop whole keyframe groups older than the newest ENTRY_REVISION_LIMIT revisions."""
+    revisions = EntryRevision.objects.filter(entry_id=entry_id)
+    limit = settings.ENTRY_REVISION_LIMIT
+    cutoff = list(revisions.order_by('-number').values_list('number', flat=True)[limit - 1:limit])
+    if not cutoff:
+        return
+    # The oldest keyframe inside the limit; everything before it goes.
+    keep_from = revisions.filter(is_keyframe=True, number__gte=cutoff[0]).order_by('number').values_list(
+        'number', flat=True).first()
+    if keep_from is not None:
+        revisions.filter(number__lt=keep_from).delete()
+
+
+@receiver(post_save, sender=Entry)
+def entry_saved(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or (update_fields is not None and not {'title', 'content'} & set(update_fields)):
+        return
+    record(instance)
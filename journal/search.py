@@ -0,0 +1,306 @@
+"""Ranked, highlighted full-text search over journal entries.
+
+Each database uses its own real index:
+
+* PostgreSQL: a GIN expression index on ``to_tsvector('english', title ||
+  plain_text)`` (migrations 0009/0012). Queries go through ``websearch_to_tsquery``
+  and are ranked with ``ts_rank``. Postgres keeps the index current itself.
+* SQLite: an FTS5 table ``journal_entry_fts`` holding each entry's title and
+  plain text, queried with ``MATCH`` and ranked with ``bm25``. It is a
+  separate table, so the signal handlers below keep it in step with
+  ``Entry`` saves and deletes. Bulk writes call ``index_entries`` themselves.
+* SEARCH_BACKEND='inverted': the pure-Python index in journal/invindex.py,
+  for databases without either engine. It is fed from the same hooks.
+* Anything else falls back to ``icontains``.
+
+Everything indexes ``Entry.plain_text``, computed once at write time, so
+no search path parses HTML. Snippets are HTML: the text is escaped and the
+matches are wrapped in <mark>.
+"""
+import re
+
+from django.contrib.postgres.search import SearchHeadline, SearchQuery, SearchRank, SearchVector
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.html import escape
+
+from . import invindex
+from .models import Entry
+
+FTS_TABLE = 'journal_entry_fts'
+PG_CONFIG = 'english'
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+# Cap on matches the inverted index hands the admin changelist filter.
+ADMIN_LIMIT = 1000
+
+# Highlight markers that can't occur in entry text; swapped for <mark>
+# after escaping so user text can never inject markup.
+MARK_START, MARK_END = '\x02', '\x03'
+
+
+def backend():
+    if settings.SEARCH_BACKEND != 'auto':
+        return settings.SEARCH_BACKEND
+    if connection.vendor == 'postgresql':
+        return 'postgresql'
+    if connection.vendor == 'sqlite':
+        return 'sqlite'
+    return 'basic'
+
+
+def pg_vector():
+    """Must stay identical to the indexed expression in migration 0012."""
+    return SearchVector('title', 'plain_text', config=PG_CONFIG)
+
+
+def mark(text):
+    """Escape ``text`` and turn the highlight markers into <mark> tags."""
+    return escape(text).replace(MARK_START, '<mark>').replace(MARK_END, '</mark>')
+
+
+TOKEN_RE = re.compile(r'(-?)"([^"]*)"|(\S+)')
+
+
+def fts5_query(query):
+    """Translate web-search syntax ("phrase", -word, OR) into an FTS5 MATCH string.
+
+    Every term is quoted so FTS5 operators in user input are taken
+    literally; the last bare word also matches as a prefix, so results
+    appear while the user is still typing. Returns '' if nothing is left.
+    """
+    include, exclude = [], []
+    tokens = list(TOKEN_RE.finditer(query))
+    for i, match in enumerate(tokens):
+        negate, phrase, word = match.groups()
+        if word is not None:
+            if word == 'OR':
+                if include and include[-1] != 'OR':
+                    include.append('OR')
+                continue
+            negate = word.startswith('-')
+            phrase = word.lstrip('-')
+        phrase = phrase.replace('"', ' ').strip()
+        if not phrase:
+            continue
+        term = f'"{phrase}"'
+        if word is not None and not negate and i == len(tokens) - 1:
+            term += '*'
+        (exclude if negate else include).append(term)
+    while include and include[-1] == 'OR':
+        include.pop()
+    if not include:
+        return ''
+    expression = ' '.join(include)
+    for term in exclude:
+        expression = f'({expression}) NOT {term}'
+    return expression
+
+
+def filter_entries(queryset, query):
+    """Restrict an Entry queryset to full-text matches of ``query`` (no ranking)."""
+    kind = backend()
+    if kind == 'postgresql':
+        return queryset.annotate(search=pg_vector()).filter(
+            search=SearchQuery(query, search_type='websearch', config=PG_CONFIG))
+    if kind == 'sqlite':
+        expression = fts5_query(query)
+        if not expression:
+            return queryset.none()
+        return queryset.filter(pk__in=RawSQL(
+            f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [expression]))
+    if kind == 'inverted':
+        return queryset.filter(pk__in=invindex.get_store().search(query, limit=ADMIN_LIMIT))
+    return queryset.filter(Q(title__icontains=query) | Q(plain_text__icontains=query))
+
+
+def search_entries(user, query, limit=DEFAULT_LIMIT):
+    """The user's best ``limit`` matches for ``query``, best first.
+
+    Returns dicts with id, title, created_at, duration_str, rank and snippet.
+    """
+    kind = backend()
+    if kind == 'postgresql':
+        return _search_postgresql(user, query, limit)
+    if kind == 'sqlite':
+        return _search_sqlite(user, query, limit)
+    if kind == 'inverted':
+        return _search_inverted(user, query, limit)
+    return _search_basic(user, query, limit)
+
+
+def _search_postgresql(user, query, limit):
+    search_query = SearchQuery(query, search_type='websearch', config=PG_CONFIG)
+    rows = (
+        Entry.objects.filter(user=user)
+        .annotate(search=pg_vector())
+        .filter(search=search_query)
+        .annotate(
+            rank=SearchRank(pg_vector(), search_query),
+            snippet=SearchHeadline(
+                'plain_text', search_query, config=PG_CONFIG, start_sel=MARK_START, stop_sel=MARK_END,
+                max_words=30, min_words=10, max_fragments=2, fragment_delimiter=' … ',
+            ),
+        )
+        .order_by('-rank', '-created_at')
+        .values('id', 'title', 'created_at', 'duration_str', 'rank', 'snippet')[:limit]
+    )
+    return [dict(row, snippet=mark(row['snippet'])) for row in rows]
+
+
+def _search_sqlite(user, query, limit):
+    expression = fts5_query(query)
+    if not expression:
+        return []
+    # bm25() is lower-is-better; weight title matches over body matches.
+    sql = (
+        f"SELECT e.id, e.title, e.created_at, e.duration_str, "
+        f"bm25({FTS_TABLE}, 5.0, 1.0) AS rank, "
+        f"snippet({FTS_TABLE}, 1, %s, %s, ' … ', 24) AS snippet "
+        f"FROM {FTS_TABLE} JOIN journal_entry e ON e.id = {FTS_TABLE}.rowid "
+        f"WHERE {FTS_TABLE} MATCH %s AND e.user_id = %s "
+        f"ORDER BY rank, e.created_at DESC LIMIT %s"
+    )
+    entries = Entry.objects.raw(sql, [MARK_START, MARK_END, expression, user.pk, limit])
+    # Go through Entry.objects.raw so created_at comes back as an aware datetime.
+    return [
+        {
+            'id': entry.id, 'title': entry.title, 'created_at': entry.created_at,
+            'duration_str': entry.duration_str, 'rank': -entry.rank, 'snippet': mark(entry.snippet),
+        }
+        for entry in entries
+    ]
+
+
+def _search_basic(user, query, limit):
+    entries = filter_entries(
+        Entry.objects.filter(user=user).projection('search'), query).order_by('-created_at')[:limit]
+    return [
+        {
+            'id': entry.id, 'title': entry.title, 'created_at': entry.created_at,
+            'duration_str': entry.duration_str, 'rank': 0.0,
+            'snippet': basic_snippet(entry.plain_text, query),
+        }
+        for entry in entries
+    ]
+
+
+def _search_inverted(user, query, limit):
+    ids = invindex.get_store().search(query, user_id=user.pk, limit=limit)
+    entries = Entry.objects.filter(user=user).projection('search').in_bulk(ids)
+    groups, _ = invindex.parse_query(query)
+    terms = [(term, prefix) for group in groups for term, prefix in group]
+    return [
+        {
+            'id': entry.id, 'title': entry.title, 'created_at': entry.created_at,
+            'duration_str': entry.duration_str, 'rank': 0.0,
+            'snippet': terms_snippet(entry.plain_text, terms),
+        }
+        for entry in (entries[pk] for pk in ids if pk in entries)
+    ]
+
+
+def terms_snippet(text, terms, width=80):
+    """Text around the first matched term, with every term occurrence highlighted."""
+    if not terms:
+        return escape(text[:width * 2])
+    pattern = re.compile(
+        r'\b(?:%s)' % '|'.join(re.escape(term) + ('' if prefix else r'\b') for term, prefix in terms),
+        re.IGNORECASE)
+    first = pattern.search(text)
+    start = max(0, first.start() - width) if first else 0
+    excerpt = text[start:start + width * 3]
+    excerpt = pattern.sub(lambda m: MARK_START + m.group(0) + MARK_END, excerpt)
+    return mark(('… ' if start else '') + excerpt)
+
+
+def basic_snippet(text, query, width=80):
+    """Text around the first occurrence of ``query``, with it highlighted."""
+    pos = text.lower().find(query.lower())
+    if pos < 0:
+        return escape(text[:width * 2])
+    start = max(0, pos - width)
+    end = pos + len(query)
+    excerpt = (
+        text[start:pos] + MARK_START + text[pos:end] + MARK_END + text[end:end + width]
+    )
+    return mark(('… ' if start else '') + excerpt)
+
+
+def index_entries(entries):
+    """(Re)index entries in the SQLite FTS table or the inverted index.
+
+    A no-op on Postgres, whose index follows the table by itself.
+    """
+    kind = backend()
+    if kind == 'inverted':
+        rows = [(entry.pk, entry.user_id, f'{entry.title} {entry.plain_text}') for entry in entries]
+        # The index lives outside the database; only record committed writes.
+        transaction.on_commit(lambda: invindex.get_store().update(rows))
+        return
+    if kind != 'sqlite':
+        return
+    rows = [(entry.pk, entry.title, entry.plain_text) for entry in entries]
+    if not rows:
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [(row[0],) for row in rows])
+        cursor.executemany(f'INSERT INTO {FTS_TABLE} (rowid, title, body) VALUES (%s, %s, %s)', rows)
+
+
+def unindex_entries(entry_ids):
+    kind = backend()
+    if kind == 'inverted':
+        entry_ids = list(entry_ids)
+        transaction.on_commit(lambda: invindex.get_store().delete(entry_ids))
+        return
+    if kind != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [(pk,) for pk in entry_ids])
+
+
+def rebuild_index(batch_size=500):
+    """Re-create the FTS table or inverted index from the entry table.
+
+    Returns the number of entries indexed.
+    """
+    kind = backend()
+    if kind == 'inverted':
+        entries = Entry.objects.only('id', 'user_id', 'title', 'plain_text').order_by('id')
+        index = invindex.build(
+            (entry.pk, entry.user_id, f'{entry.title} {entry.plain_text}')
+            for entry in entries.iterator(chunk_size=batch_size)
+        )
+        invindex.get_store().replace(index)
+        return len(index)
+    if kind != 'sqlite':
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+    count = 0
+    batch = []
+    for entry in Entry.objects.only('id', 'title', 'plain_text').iterator(chunk_size=batch_size):
+        batch.append(entry)
+        if len(batch) >= batch_size:
+            index_entries(batch)
+            count += len(batch)
+            batch = []
+    index_entries(batch)
+    return count + len(batch)
+
+
+@receiver(post_save, sender=Entry)
+def entry_saved(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if update_fields is not None and not {'title', 'content'} & set(update_fields):
+        return
+    index_entries([instance])
+
+
+@receiver(post_delete, sender=Entry)
+def entry_deleted(sender, instance, **kwargs):
+    unindex_entries([instance.pk])
@@ -33,6 +33,8 @@ document.addEventListener('DOMContentLoaded', () => {
         timerInterval: null,
         isTimerRunning: false,
         currentEntryId: null,
+        version: null,       // server version of the open entry, for delta saves
+        savedContent: '',    // content as last saved, the base for the next delta
         undoStack: [],
         redoStack: [],
         lastContent: ''
@@ -278,26 +280,53 @@ document.addEventListener('DOMContentLoaded', () => {
         durationStr += `${secs % 60}s`;
         if (!durationStr) durationStr = "0s";
 
-        const newEntry = {
-            id: state.currentEntryId,
-            title: elements.titleInput.value || 'Untitled',
-            content: elements.journalArea.innerHTML,
-            durationStr: durationStr
-        };
+        const title = elements.titleInput.value || 'Untitled';
+        const content = elements.journalArea.innerHTML;
 
         try {
-            const res = await fetch('/api/entries', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json',
-                    'X-CSRFToken': csrfToken
-                },
-                body: JSON.stringify(newEntry)
-            });
+            let res;
+            if (state.currentEntryId && state.version !== null) {
+                // Existing entry: send only what changed since the last save.
+                res = await fetch(`/api/entries/${state.currentEntryId}/patch`, {
+                    method: 'PATCH',
+                    headers: {
+                        'Content-Type': 'application/json',
+                        'X-CSRFToken': csrfToken
+                    },
+                    body: JSON.stringify({
+                        version: state.version,
+                        ops: computeDelta(state.savedContent, content),
+                        title: title,
+                        durationStr: durationStr
+                    })
+                });
+                if (res.status === 409) {
+                    showToast("⚠️ This entry was changed elsewhere. Reload it before saving.", 4000);
+                    return;
+                }
+            } else {
+                res = await fetch('/api/entries', {
+                    method: 'POST',
+                    headers: {
+                        'Content-Type': 'application/json',
+                        'X-CSRFToken': csrfToken
+                    },
+                    body: JSON.stringify({
+                        id: state.currentEntryId,
+                        title: title,
+                        content: content,
+                        durationStr: durationStr
+                    })
+                });
+            }
 
             if (res.ok) {
                 const data = await res.json();
                 state.currentEntryId = data.id; // Update ID to prevent duplicates
+                state.version = data.version;
+                // The server returns the content when sanitizing changed it;
+                // later deltas must be computed against what it stored.
+                state.savedContent = data.content !== undefined ? data.content : content;
                 showPopup(durationStr);
                 loadEntries();
             } else {
@@ -309,24 +338,78 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     }
 
+    // Single splice turning `before` into `after` (common prefix/suffix trimmed).
+    // Offsets are JS string indices, i.e. UTF-16 code units, as the server expects.
+    function computeDelta(before, after) {
+        if (before === after) return [];
+        let start = 0;
+        const maxStart = Math.min(before.length, after.length);
+        while (start < maxStart && before[start] === after[start]) start++;
+        let endBefore = before.length;
+        let endAfter = after.length;
+        while (endBefore > start && endAfter > start && before[endBefore - 1] === after[endAfter - 1]) {
+            endBefore--;
+            endAfter--;
+        }
+        // Don't cut through a surrogate pair.
+        if (start > 0 && /[\uD800-\uDBFF]/.test(before[start - 1])) start--;
+        if (endBefore < before.length && /[\uDC00-\uDFFF]/.test(before[endBefore])) {
+            endBefore++;
+            endAfter++;
+        }
+        return [{ start: start, end: endBefore, text: after.slice(start, endAfter) }];
+    }
+
+    // Sidebar only needs the summary columns; full content is fetched on open.
+    const LIST_FIELDS = 'id,title,date,durationStr,excerpt';
+    const PAGE_SIZE = 50;
+
     async function loadEntries() {
         elements.entriesList.innerHTML = '<p class="empty-state">Loading...</p>';
         try {
-            const res = await fetch('/api/entries');
-            if (res.ok) {
-                const entries = await res.json();
-                renderEntries(entries);
-            }
+            let cursor = null;
+            let first = true;
+            do {
+                const params = new URLSearchParams({ fields: LIST_FIELDS, limit: PAGE_SIZE });
+                if (cursor) params.set('cursor', cursor);
+                const res = await fetch(`/api/entries?${params}`);
+                if (!res.ok) throw new Error('Load failed');
+                const page = await res.json();
+                renderEntries(page.entries, !first);
+                cursor = page.next;
+                first = false;
+            } while (cursor);
         } catch (e) {
             elements.entriesList.innerHTML = '<p class="empty-state">Error loading entries.</p>';
         }
     }
 
-    function renderEntries(entries) {
-        elements.entriesList.innerHTML = '';
+    async function openEntry(entryId) {
+        try {
+            const res = await fetch(`/api/entries/${entryId}`);
+            if (!res.ok) throw new Error('Load failed');
+            const entry = await res.json();
+
+            state.currentEntryId = entry.id;
+            state.version = entry.version;
+            state.savedContent = entry.content;
+            elements.titleInput.value = entry.title;
+            elements.journalArea.innerHTML = entry.content;
+            state.lastContent = entry.content; // Initialize for undo
+            state.undoStack = [];
+            state.redoStack = [];
+            startWritingMode();
+        } catch (e) {
+            showToast("❌ Error opening entry", 3000);
+            console.error(e);
+        }
+    }
+
+    function renderEntries(entries, append = false) {
+        if (!append) elements.entriesList.innerHTML = '';
 
         if (entries.length === 0) {
-            elements.entriesList.innerHTML = '<p class="empty-state">No entries yet.</p>';
+            if (!append) elements.entriesList.innerHTML = '<p class="empty-state">No entries yet.</p>';
             return;
         }
 
@@ -334,9 +417,20 @@ document.addEventListener('DOMContentLoaded', () => {
             const card = document.createElement('div');
             card.className = 'entry-card';
 
-            const tmp = document.createElement('div');
-            tmp.innerHTML = entry.content;
-            const preview = (tmp.textContent || tmp.innerText || "").substring(0, 80);
+            let preview = '';
+            if (entry.snippet !== undefined) {
+                // Search results: server-escaped text with <mark> highlights.
+                preview = entry.snippet;
+            } else if (entry.excerpt !== undefined) {
+                // Stored plain text; escape it before it goes into innerHTML.
+                const tmp = document.createElement('div');
+                tmp.textContent = entry.excerpt.substring(0, 80);
+                preview = tmp.innerHTML;
+            } else if (entry.content !== undefined) {
+                const tmp = document.createElement('div');
+                tmp.innerHTML = entry.content;
+                preview = (tmp.textContent || tmp.innerText || "").substring(0, 80);
+            }
 
             card.innerHTML = `
                 <div class="entry-header">
@@ -344,7 +438,7 @@ document.addEventListener('DOMContentLoaded', () => {
                     <span>${entry.durationStr}</span>
                 </div>
                 <span class="entry-title">${entry.title}</span>
-                <div class="entry-snippet">${preview}...</div>
+                ${preview ? `<div class="entry-snippet">${preview}${entry.snippet !== undefined ? '' : '...'}</div>` : ''}
                 <button class="delete-entry-btn" data-entry-id="${entry.id}" title="Delete this entry">
                     <ion-icon name="trash-outline"></ion-icon>
                 </button>
@@ -355,13 +449,7 @@ document.addEventListener('DOMContentLoaded', () => {
                 // Don't open if clicking delete button
                 if (e.target.closest('.delete-entry-btn')) return;
 
-                state.currentEntryId = entry.id;
-                elements.titleInput.value = entry.title;
-                elements.journalArea.innerHTML = entry.content;
-                state.lastContent = entry.content; // Initialize for undo
-                state.undoStack = [];
-                state.redoStack = [];
-                startWritingMode();
+                openEntry(entry.id);
             });
 
             // Delete button handler
@@ -395,6 +483,74 @@ document.addEventListener('DOMContentLoaded', () => {
         });
     }
 
+    // Search: debounced full-text query; clearing the box restores the list.
+    const searchInput = document.getElementById('searchInput');
+    let searchTimer = null;
+    let searchSeq = 0;
+
+    async function searchEntries(query) {
+        const seq = ++searchSeq;
+        try {
+            const res = await fetch(`/api/entries/search?${new URLSearchParams({ q: query })}`);
+            if (!res.ok) throw new Error('Search failed');
+            const data = await res.json();
+            if (seq !== searchSeq) return; // A newer query is already on its way
+            if (data.results.length === 0) {
+                elements.entriesList.innerHTML = '<p class="empty-state">No matches.</p>';
+            } else {
+                renderEntries(data.results);
+            }
+        } catch (e) {
+            if (seq === searchSeq) elements.entriesList.innerHTML = '<p class="empty-state">Search failed.</p>';
+        }
+    }
+
+    if (searchInput) {
+        searchInput.addEventListener('input', () => {
+            clearTimeout(searchTimer);
+            const query = searchInput.value.trim();
+            searchTimer = setTimeout(() => {
+                if (query) {
+                    searchEntries(query);
+                } else {
+                    searchSeq++;
+                    loadEntries();
+                }
+            }, 250);
+        });
+    }
+
+    // Export: build in the background, poll, then download (resumable).
+    const exportBtn = document.getElementById('exportBtn');
+    if (exportBtn) {
+        exportBtn.addEventListener('click', async (e) => {
+            e.preventDefault();
+            showToast("⏳ Preparing export...", 2000);
+            try {
+                let res = await fetch('/api/exports', {
+                    method: 'POST',
+                    headers: { 'X-CSRFToken': csrfToken }
+                });
+                let job = await res.json();
+                if (res.status === 404) {
+                    showToast("⚠️ No entries to export", 3000);
+                    return;
+                }
+                while (job.status === 'pending' || job.status === 'running') {
+                    await new Promise(resolve => setTimeout(resolve, 2000));
+                    res = await fetch(`/api/exports/${job.id}`);
+                    job = await res.json();
+                }
+                if (job.status !== 'ready') throw new Error(job.error || 'Export failed');
+                window.location.href = job.downloadUrl;
+            } catch (err) {
+                console.error(err);
+                // Fall back to the synchronous streaming export.
+                window.location.href = exportBtn.href;
+            }
+        });
+    }
+
     // 5. Popup & Reset
     function showPopup(time) {
         elements.finalTimeSpan.innerText = time;
@@ -418,6 +574,8 @@ document.addEventListener('DOMContentLoaded', () => {
 
         state.startTime = null;
         state.currentEntryId = null;
+        state.version = null;
+        state.savedContent = '';
         state.undoStack = [];
         state.redoStack = [];
         state.lastContent = '';
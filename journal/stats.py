@@ -0,0 +1,272 @@
+"""Incrementally maintained statistics for the admin dashboard.
+
+Site-wide totals live in StatCounter rows and per-day numbers in
+DailyActivity. The signal handlers at the bottom keep them current as
+users, entries and Google accounts come and go. The dashboard then reads a
+few rows, cached for STATS_CACHE_TTL seconds, instead of counting whole
+tables. Code that bypasses signals (``bulk_create``) calls the
+``record_*`` helpers itself. ``rebuild_stats`` recomputes everything from
+scratch if the counters ever drift.
+
+Longer-range trends come from ActivityRollup. The ``rollup_activity``
+command fills it with hourly and daily buckets. Each run re-aggregates only
+the entries created since the newest stored bucket, so the GROUP BY never
+scans the whole entry table.
+"""
+from collections import Counter
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F, Max, Sum
+from django.db.models.functions import Length, TruncDate, TruncDay, TruncHour
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+from allauth.socialaccount.models import SocialAccount
+
+from .models import ActivityRollup, DailyActiveUser, DailyActivity, Entry, StatCounter
+
+TOTAL_USERS = 'total_users'
+TOTAL_ENTRIES = 'total_entries'
+GOOGLE_USERS = 'google_users'
+COUNTERS = (TOTAL_USERS, TOTAL_ENTRIES, GOOGLE_USERS)
+
+CACHE_KEY = 'dashboard_stats'
+
+# DailyActiveUser markers are only needed while a day can still get new
+# entries; older ones are pruned when a new day's row is first created.
+ACTIVE_MARKER_DAYS = 2
+
+
+def _increment(model, lookup, deltas):
+    """Add ``deltas`` to the row matching ``lookup``, creating it if needed.
+
+    Returns True if the row was created by this call.
+    """
+    deltas = {field: delta for field, delta in deltas.items() if delta}
+    if not deltas:
+        return False
+    updates = {field: F(field) + delta for field, delta in deltas.items()}
+    if model.objects.filter(**lookup).update(**updates):
+        return False
+    _, created = model.objects.get_or_create(**lookup, defaults=deltas)
+    if not created:
+        # Another process created the row between our UPDATE and INSERT.
+        model.objects.filter(**lookup).update(**updates)
+    return created
+
+
+def add(name, delta):
+    _increment(StatCounter, {'name': name}, {'value': delta})
+
+
+def add_daily(day, **deltas):
+    if _increment(DailyActivity, {'date': day}, deltas):
+        cutoff = day - timedelta(days=ACTIVE_MARKER_DAYS - 1)
+        DailyActiveUser.objects.filter(date__lt=cutoff).delete()
+
+
+def mark_active(user_id, day):
+    _, created = DailyActiveUser.objects.get_or_create(date=day, user_id=user_id)
+    if created:
+        add_daily(day, active_users=1)
+
+
+def record_entries_created(entries):
+    """Count newly inserted entries (call this after ``bulk_create``)."""
+    entries = list(entries)
+    add(TOTAL_ENTRIES, len(entries))
+    for day, count in Counter(timezone.localdate(e.created_at) for e in entries).items():
+        add_daily(day, entries_created=count)
+    for day, user_id in {(timezone.localdate(e.created_at), e.user_id) for e in entries}:
+        mark_active(user_id, day)
+
+
+def record_entries_deleted(entries):
+    """Uncount deleted entries. Their authors stay counted as active that day."""
+    entries = list(entries)
+    add(TOTAL_ENTRIES, -len(entries))
+    for day, count in Counter(timezone.localdate(e.created_at) for e in entries).items():
+        add_daily(day, entries_created=-count)
+
+
+def snapshot():
+    """Dashboard numbers: totals plus today's activity, cached briefly."""
+    stats = cache.get(CACHE_KEY)
+    if stats is None:
+        counters = dict(StatCounter.objects.values_list('name', 'value'))
+        stats = {name: counters.get(name, 0) for name in COUNTERS}
+        today = DailyActivity.objects.filter(date=timezone.localdate()).first()
+        stats.update({
+            'new_users_today': today.new_users if today else 0,
+            'entries_today': today.entries_created if today else 0,
+            'active_users_today': today.active_users if today else 0,
+        })
+        cache.set(CACHE_KEY, stats, settings.STATS_CACHE_TTL)
+    return stats
+
+
+def rebuild():
+    """Recompute every counter and daily row from the underlying tables."""
+    with transaction.atomic():
+        totals = {
+            TOTAL_USERS: User.objects.count(),
+            TOTAL_ENTRIES: Entry.objects.count(),
+            GOOGLE_USERS: SocialAccount.objects.filter(provider='google').values('user').distinct().count(),
+        }
+        for name, value in totals.items():
+            StatCounter.objects.update_or_create(name=name, defaults={'value': value})
+
+        days = {}
+        entry_days = Entry.objects.annotate(day=TruncDate('created_at')).values('day').annotate(
+            created=Count('id'), active=Count('user', distinct=True)).order_by()
+        for row in entry_days:
+            days[row['day']] = DailyActivity(
+                date=row['day'], entries_created=row['created'], active_users=row['active'])
+        user_days = User.objects.annotate(day=TruncDate('date_joined')).values('day').annotate(
+            joined=Count('id')).order_by()
+        for row in user_days:
+            days.setdefault(row['day'], DailyActivity(date=row['day'])).new_users = row['joined']
+        DailyActivity.objects.all().delete()
+        DailyActivity.objects.bulk_create(days.values(), batch_size=500)
+
+        cutoff = timezone.localdate() - timedelta(days=ACTIVE_MARKER_DAYS - 1)
+        DailyActiveUser.objects.all().delete()
+        DailyActiveUser.objects.bulk_create([
+            DailyActiveUser(date=row['day'], user_id=row['user'])
+            for row in Entry.objects.annotate(day=TruncDate('created_at')).filter(
+                day__gte=cutoff).values('day', 'user').distinct().order_by()
+        ], batch_size=500)
+    cache.delete(CACHE_KEY)
+    return totals
+
+
+ROLLUP_TRUNC = {
+    ActivityRollup.PERIOD_HOUR: TruncHour,
+    ActivityRollup.PERIOD_DAY: TruncDay,
+}
+ROLLUP_METRICS = ('entries_created', 'active_users', 'new_signups', 'bytes_written')
+
+
+def bucket_floor(moment, period):
+    """Start of the rollup bucket containing ``moment`` (local time for days)."""
+    if period == ActivityRollup.PERIOD_HOUR:
+        return moment.replace(minute=0, second=0, microsecond=0)
+    return timezone.make_aware(datetime.combine(timezone.localtime(moment).date(), time.min))
+
+
+def bucket_starts(start, end, period):
+    """Every bucket start from the bucket containing ``start`` up to ``end``."""
+    current = bucket_floor(start, period)
+    while current < end:
+        yield current
+        if period == ActivityRollup.PERIOD_HOUR:
+            current += timedelta(hours=1)
+        else:
+            # Step in local dates so DST changes don't shift midnight.
+            next_day = timezone.localtime(current).date() + timedelta(days=1)
+            current = timezone.make_aware(datetime.combine(next_day, time.min))
+
+
+def rollup_activity(period, since=None):
+    """Recompute ``period`` buckets from ``since`` onwards; returns how many were written.
+
+    ``since`` defaults to the newest stored bucket, which may have been
+    incomplete when it was last written. Without any stored buckets the
+    whole history is aggregated once.
+    """
+    trunc = ROLLUP_TRUNC[period]
+    if since is None:
+        since = ActivityRollup.objects.filter(period=period).aggregate(last=Max('bucket_start'))['last']
+    entries = Entry.objects.all()
+    users = User.objects.all()
+    if since is not None:
+        since = bucket_floor(since, period)
+        entries = entries.filter(created_at__gte=since)
+        users = users.filter(date_joined__gte=since)
+
+    buckets = {}
+    entry_rows = entries.annotate(bucket=trunc('created_at')).values('bucket').annotate(
+        created=Count('id'), active=Count('user', distinct=True),
+        # Characters of text written, markup excluded.
+        size=Sum(Length('plain_text'))).order_by()
+    for row in entry_rows:
+        buckets[row['bucket']] = ActivityRollup(
+            period=period, bucket_start=row['bucket'], entries_created=row['created'],
+            active_users=row['active'], bytes_written=row['size'] or 0)
+    for row in users.annotate(bucket=trunc('date_joined')).values('bucket').annotate(
+            joined=Count('id')).order_by():
+        rollup = buckets.setdefault(row['bucket'], ActivityRollup(period=period, bucket_start=row['bucket']))
+        rollup.new_signups = row['joined']
+
+    with transaction.atomic():
+        stale = ActivityRollup.objects.filter(period=period)
+        if since is not None:
+            stale = stale.filter(bucket_start__gte=since)
+        stale.delete()
+        ActivityRollup.objects.bulk_create(buckets.values(), batch_size=500)
+    return len(buckets)
+
+
+def activity_series(period, start, end):
+    """Rollups for [start, end) with empty buckets filled in as zeros."""
+    stored = {
+        rollup.bucket_start: rollup
+        for rollup in ActivityRollup.objects.filter(
+            period=period, bucket_start__gte=bucket_floor(start, period), bucket_start__lt=end)
+    }
+    return [
+        stored.get(bucket) or ActivityRollup(period=period, bucket_start=bucket)
+        for bucket in bucket_starts(start, end, period)
+    ]
+
+
+@receiver(post_save, sender=Entry)
+def entry_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        record_entries_created([instance])
+
+
+@receiver(post_delete, sender=Entry)
+def entry_deleted(sender, instance, **kwargs):
+    record_entries_deleted([instance])
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        add(TOTAL_USERS, 1)
+        add_daily(timezone.localdate(instance.date_joined), new_users=1)
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    add(TOTAL_USERS, -1)
+    add_daily(timezone.localdate(instance.date_joined), new_users=-1)
+
+
+@receiver(post_save, sender=SocialAccount)
+def social_account_saved(sender, instance, created, raw=False, **kwargs):
+    # google_users counts users, not accounts: only a user's first one counts.
+    if created and not raw and instance.provider == 'google' and not SocialAccount.objects.filter(
+            user_id=instance.user_id, provider='google').exclude(pk=instance.pk).exists():
+        add(GOOGLE_USERS, 1)
+
+
+@receiver(pre_delete, sender=SocialAccount)
+def social_account_deleting(sender, instance, **kwargs):
+    if instance.provider == 'google':
+        instance._google_pks = set(SocialAccount.objects.filter(
+            user_id=instance.user_id, provider='google').values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=SocialAccount)
+def social_account_deleted(sender, instance, **kwargs):
+    # A cascade may delete several of a user's accounts at once; whichever
+    # has the lowest pk uncounts the user, once, if none are left.
+    pks = getattr(instance, '_google_pks', None)
+    if pks and instance.pk == min(pks) and not SocialAccount.objects.filter(pk__in=pks).exists():
+        add(GOOGLE_USERS, -1)
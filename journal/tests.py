@@ -1,3 +1,1499 @@
-from django.test import TestCase
+import asyncio
+import json
+import marshal
+import os
+import random
+import re
+import shutil
+import socketserver
+import tempfile
+import threading
+import time
+import tracemalloc
+import zipfile
+from datetime import datetime, timedelta, timezone as dt_timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
+from urllib.parse import parse_qs, urlsplit
 
-# Create your tests here.
+from django.contrib.auth.models import Permission, User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.cache.backends.redis import RedisCache
+from django.db import connection
+from django.test import AsyncClient, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from allauth.socialaccount.models import SocialAccount
+
+from journal_core import cache_url
+from . import (
+    benchmarks, checks, compression, exports, invindex, ratelimit, revisions, sanitize, search, stats, translation,
+    versions,
+)
+from .metrics import REGISTRY
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+from .models import (
+    ActivityRollup, Entry, EntryRevision, ExportJob, PasswordResetRequest, RateLimitCounter, RequestProfile,
+    SiteConfiguration,
+)
+from .views import apply_delta, entries_page_queryset
+
+
+class EntryQueryPlanTests(TestCase):
+    """EXPLAIN the hot Entry querysets and fail on seq scans or explicit sorts."""
+
+    USERS = 20
+    ENTRIES_PER_USER = 100
+
+    # Patterns that mean the planner could not use an index for the query.
+    BAD_PLAN_PATTERNS = {
+        'postgresql': [r'Seq Scan on', r'\bSort\s+\('],
+        'sqlite': [r'(?m)\bSCAN \w+$', r'TEMP B-TREE FOR (?:RIGHT PART OF )?ORDER BY'],
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        users = [User.objects.create_user(f'user{i}', f'user{i}@example.com') for i in range(cls.USERS)]
+        Entry.objects.bulk_create([
+            Entry(user=user, title=f'Entry {n}', content='<p>Lorem ipsum</p>' * 20)
+            for user in users for n in range(cls.ENTRIES_PER_USER)
+        ])
+        # auto_now_add stamps every row identically; spread them over time.
+        entries = list(Entry.objects.order_by('id'))
+        for i, entry in enumerate(entries):
+            entry.created_at = now - timedelta(minutes=i * 7)
+        Entry.objects.bulk_update(entries, ['created_at'], batch_size=500)
+        cls.user = users[0]
+
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def setUp(self):
+        if connection.vendor not in self.BAD_PLAN_PATTERNS:
+            self.skipTest(f'No plan checks for {connection.vendor}')
+        if connection.vendor == 'postgresql':
+            # Small test tables make seq scans look cheap; penalize them so the
+            # plan only contains one if no usable index exists at all.
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+                cursor.execute('SET LOCAL enable_sort = off')
+
+    def assertIndexedPlan(self, queryset):
+        plan = queryset.explain()
+        for pattern in self.BAD_PLAN_PATTERNS[connection.vendor]:
+            self.assertIsNone(re.search(pattern, plan), f'{pattern!r} in plan:\n{plan}')
+
+    def test_api_entries_first_page(self):
+        self.assertIndexedPlan(entries_page_queryset(self.user)[:51])
+
+    def test_api_entries_cursor_page(self):
+        anchor = Entry.objects.filter(user=self.user).order_by('-created_at', '-id')[50]
+        cursor = (anchor.created_at, anchor.id)
+        self.assertIndexedPlan(entries_page_queryset(self.user, cursor)[:51])
+
+    def test_export(self):
+        self.assertIndexedPlan(exports.export_queryset(self.user))
+        self.assertIndexedPlan(exports.export_queryset(self.user, timezone.now() - timedelta(days=1)))
+
+    def admin_context(self, url):
+        admin = User.objects.create_superuser('planner', 'planner@example.com', 'pw')
+        self.client.force_login(admin)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.context
+
+    def test_dashboard_recent_entries(self):
+        self.assertIndexedPlan(self.admin_context('/admin/')['recent_entries'])
+
+    def test_admin_entry_changelist(self):
+        changelist = self.admin_context('/admin/journal/entry/')['cl']
+        self.assertIndexedPlan(changelist.queryset[:changelist.list_per_page])
+
+
+class DashboardStatsTests(TestCase):
+    """Incremental dashboard counters must agree with a full recount."""
+
+    def setUp(self):
+        cache.delete(stats.CACHE_KEY)
+        self.user = User.objects.create_user('writer', 'writer@example.com', 'pw')
+        self.client.force_login(self.user)
+
+    def counted(self):
+        cache.delete(stats.CACHE_KEY)
+        return stats.snapshot()
+
+    def test_signals_and_batch_match_rebuild(self):
+        Entry.objects.create(user=self.user, title='One')
+        Entry.objects.create(user=self.user, title='Two')
+        other = User.objects.create_user('other', 'other@example.com')
+        SocialAccount.objects.create(user=other, provider='google', uid='1')
+        SocialAccount.objects.create(user=other, provider='google', uid='2')
+        response = self.client.post('/api/entries/batch', {'ops': [
+            {'op': 'create', 'title': 'Three'},
+            {'op': 'create', 'title': 'Four'},
+            {'op': 'delete', 'id': Entry.objects.get(title='One').id},
+        ]}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+
+        incremental = self.counted()
+        self.assertEqual(incremental['total_entries'], 3)
+        self.assertEqual(incremental['entries_today'], 3)
+        self.assertEqual(incremental['active_users_today'], 1)
+        self.assertEqual(incremental['google_users'], 1)
+        self.assertEqual(incremental['new_users_today'], 2)
+
+        stats.rebuild()
+        self.assertEqual(self.counted(), incremental)
+
+        other.delete()
+        after = self.counted()
+        self.assertEqual((after['total_users'], after['google_users']), (1, 0))
+
+    def test_get_stats_reads_counters(self):
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'pw')
+        self.client.force_login(admin)
+        Entry.objects.bulk_create([Entry(user=self.user, title=str(i)) for i in range(5)])
+        cache.delete(stats.CACHE_KEY)
+        # Session, user, counters, today's row; nothing scales with the tables.
+        with self.assertNumQueries(4):
+            data = self.client.get('/admin/get-stats/').json()
+        self.assertEqual(data['total_entries'], 0)  # bulk_create bypassed the signals
+        with self.assertNumQueries(2):
+            self.client.get('/admin/get-stats/')
+
+
+class ActivityRollupTests(TestCase):
+    """Incremental rollup runs must agree with aggregating everything at once."""
+
+    def setUp(self):
+        self.user = User.objects.create_superuser('admin', 'admin@example.com', 'pw')
+        now = timezone.now()
+        for days_ago in (5, 3, 3, 0):
+            entry = Entry.objects.create(user=self.user, title='t', content='x' * 10)
+            Entry.objects.filter(pk=entry.pk).update(created_at=now - timedelta(days=days_ago))
+
+    def rollups(self):
+        return list(ActivityRollup.objects.order_by('period', 'bucket_start').values_list(
+            'period', 'bucket_start', 'entries_created', 'active_users', 'new_signups', 'bytes_written'))
+
+    def test_incremental_matches_full(self):
+        for period in ('hour', 'day'):
+            stats.rollup_activity(period)
+        Entry.objects.create(user=self.user, title='late', content='y' * 5)
+        User.objects.create_user('late', 'late@example.com')
+        for period in ('hour', 'day'):
+            stats.rollup_activity(period)
+        incremental = self.rollups()
+
+        ActivityRollup.objects.all().delete()
+        for period in ('hour', 'day'):
+            stats.rollup_activity(period)
+        self.assertEqual(self.rollups(), incremental)
+        today = ActivityRollup.objects.get(period='day', bucket_start=stats.bucket_floor(timezone.now(), 'day'))
+        self.assertEqual((today.entries_created, today.new_signups, today.bytes_written), (2, 2, 15))
+
+    def test_admin_series_fills_gaps(self):
+        stats.rollup_activity('day')
+        self.client.force_login(self.user)
+        response = self.client.get('/admin/activity/', {'period': 'day', 'format': 'json'})
+        buckets = response.json()['buckets']
+        self.assertEqual(len(buckets), 30)
+        self.assertEqual([b['entries_created'] for b in buckets[-6:]], [1, 0, 2, 0, 0, 1])
+        response = self.client.get('/admin/activity/', {'period': 'hour', 'start': '2000-01-01', 'format': 'json'})
+        self.assertEqual(response.status_code, 400)
+        for dates in ({'end': '9999-12-31'}, {'end': '0001-01-05'}, {'start': '9999-12-31', 'end': '9999-12-31'}):
+            response = self.client.get('/admin/activity/', {'period': 'day', 'format': 'json', **dates})
+            self.assertEqual((response.status_code, response.json()['message']), (400, 'Date out of range'), dates)
+        self.assertEqual(self.client.get('/admin/activity/', {'end': '9999-12-31'}).status_code, 200)
+
+
+class AdminChangelistQueryTests(TestCase):
+    """Changelist pages must cost the same number of queries at any page size."""
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'pw')
+        self.client.force_login(self.admin)
+
+    def add_users(self, count):
+        for _ in range(count):
+            n = User.objects.count()
+            user = User.objects.create_user(f'user{n}', f'user{n}@example.com')
+            SocialAccount.objects.create(user=user, provider='google', uid=str(n))
+            Entry.objects.bulk_create([Entry(user=user, title=f'Entry {i}') for i in range(3)])
+
+    def queries_for(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def assertConstantQueries(self, url):
+        self.add_users(5)
+        small = self.queries_for(url)
+        self.add_users(20)
+        self.assertEqual(self.queries_for(url), small)
+
+    def test_user_changelist(self):
+        self.assertConstantQueries('/admin/auth/user/')
+
+    def test_entry_changelist(self):
+        self.assertConstantQueries('/admin/journal/entry/')
+
+    def test_entry_lists_skip_content(self):
+        self.add_users(2)
+        with CaptureQueriesContext(connection) as queries:
+            self.queries_for('/admin/journal/entry/')
+        entry_selects = [q['sql'] for q in queries if '"journal_entry"."title"' in q['sql']]
+        self.assertTrue(entry_selects)
+        self.assertFalse([sql for sql in entry_selects if '"journal_entry"."content"' in sql])
+        recent = self.client.get('/admin/').context['recent_entries']
+        self.assertNotIn('"journal_entry"."content"', str(recent.query))
+
+    def test_user_changelist_sorts_by_entry_count(self):
+        self.add_users(2)
+        response = self.client.get('/admin/auth/user/', {'o': '3'})
+        self.assertEqual(response.status_code, 200)
+
+
+class EntryWriteApiTests(TestCase):
+    """Input validation and conflicts on the entry write endpoints."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('author', 'author@example.com', 'pw')
+        self.entry = Entry.objects.create(user=self.user, title='Start', content='<p>hello</p>')
+        self.client.force_login(self.user)
+
+    def post(self, url, body):
+        return self.client.post(url, body, content_type='application/json')
+
+    def test_batch_rejects_bad_fields_per_op(self):
+        response = self.post('/api/entries/batch', {'ops': [
+            {'op': 'create', 'title': ['not', 'a', 'string']},
+            {'op': 'create', 'title': 'x' * 256},
+            {'op': 'update', 'id': self.entry.pk, 'content': 5},
+            {'op': 'update', 'id': self.entry.pk, 'durationStr': 'y' * 51},
+            {'op': 'create', 'title': 'Fine', 'content': '<p>ok</p>'},
+        ]})
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual([r['status'] for r in results], ['error'] * 4 + ['created'])
+        self.assertEqual(results[0]['message'], 'title must be a string')
+        self.assertEqual(results[1]['message'], 'title must be at most 255 characters')
+        self.assertEqual(Entry.objects.filter(user=self.user).count(), 2)
+
+        response = self.post('/api/entries/batch', {'atomic': True, 'ops': [
+            {'op': 'create', 'title': 'Rolled back'}, {'op': 'update', 'id': self.entry.pk, 'title': 7}]})
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(Entry.objects.filter(title='Rolled back').exists())
+
+    def test_apply_delta(self):
+        # 😀 is two UTF-16 code units, as in a JavaScript string.
+        self.assertEqual(apply_delta('a😀b', [{'start': 3, 'end': 4, 'text': 'c'}]), 'a😀c')
+        self.assertEqual(apply_delta('a😀b', [{'start': 1, 'end': 3}]), 'ab')
+        self.assertEqual(apply_delta('abc', [{'start': 0, 'end': 0, 'text': 'x'}, {'start': 4, 'end': 4, 'text': 'y'}]),
+                         'xabcy')
+        for ops in ([{'start': 2, 'end': 5}], [{'start': 2, 'end': 1}], [{'start': -1, 'end': 0}],
+                    [{'start': 0, 'end': 1, 'text': 3}], [{'start': '0', 'end': 1}], ['x']):
+            with self.assertRaises(ValueError):
+                apply_delta('abc', ops)
+        with self.assertRaisesMessage(ValueError, 'surrogate pair'):
+            apply_delta('a😀', [{'start': 2, 'end': 2, 'text': 'x'}])
+
+    def test_save_validates_before_writing(self):
+        version = self.entry.version
+        for body in ({'id': self.entry.pk, 'title': ['x']}, {'id': self.entry.pk, 'content': 5},
+                     {'id': self.entry.pk, 'durationStr': 'y' * 60}, {'title': 'x' * 256}):
+            response = self.post('/api/entries', body)
+            self.assertEqual(response.status_code, 400, body)
+        self.assertEqual(self.post('/api/entries', [self.entry.pk]).status_code, 400)
+        self.entry.refresh_from_db()
+        self.assertEqual((self.entry.title, self.entry.version), ('Start', version))
+        self.assertEqual(Entry.objects.filter(user=self.user).count(), 1)
+
+        # A failure in a save's signal-driven writes rolls the save back too.
+        with mock.patch('journal.search.index_entries', side_effect=RuntimeError('index down')):
+            response = self.post('/api/entries', {'id': self.entry.pk, 'title': 'Lost'})
+        self.assertEqual(response.status_code, 400)
+        self.entry.refresh_from_db()
+        self.assertEqual((self.entry.title, self.entry.version), ('Start', version))
+        self.assertEqual(self.entry.revisions.count(), 1)
+
+    def test_patch(self):
+        url = f'/api/entries/{self.entry.pk}/patch'
+        version = self.entry.version
+        response = self.post(url, {'version': version, 'ops': [{'start': 8, 'end': 8, 'text': ' world'}],
+                                   'title': 'Renamed'})
+        self.assertEqual(response.json(), {'status': 'updated', 'id': self.entry.pk, 'version': version + 1})
+        self.entry.refresh_from_db()
+        self.assertEqual((self.entry.content, self.entry.title), ('<p>hello world</p>', 'Renamed'))
+
+        # A stale version writes nothing and reports the current one.
+        response = self.post(url, {'version': version, 'ops': [{'start': 0, 'end': 0, 'text': 'lost'}]})
+        self.assertEqual((response.status_code, response.json()['version']), (409, version + 1))
+        response = self.post(url, {'version': version + 1, 'ops': [{'start': 0, 'end': 99}]})
+        self.assertEqual(response.status_code, 400)
+        for body in ({'title': 7}, {'title': 'x' * 256}, {'durationStr': ['1h']}, {'durationStr': 'y' * 51}):
+            response = self.post(url, {'version': version + 1, **body})
+            self.assertEqual(response.status_code, 400, body)
+        self.entry.refresh_from_db()
+        self.assertEqual((self.entry.version, self.entry.content), (version + 1, '<p>hello world</p>'))
+
+
+class EntrySearchTests(TestCase):
+    """Full-text search: ranking, highlighting, scoping and index upkeep."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('writer', 'writer@example.com', 'pw')
+        self.other = User.objects.create_user('other', 'other@example.com', 'pw')
+        self.client.force_login(self.user)
+        self.garden = Entry.objects.create(
+            user=self.user, title='Garden day', content='<p>Planted <b>tomatoes</b> &amp; basil.</p>')
+        self.walk = Entry.objects.create(
+            user=self.user, title='Morning walk', content='<p>Walked past the community garden.</p>')
+        Entry.objects.create(user=self.other, title='Garden', content='<p>Not yours</p>')
+
+    def search(self, q, **params):
+        response = self.client.get('/api/entries/search', {'q': q, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.json()['results']
+
+    def test_ranked_highlighted_and_scoped(self):
+        results = self.search('garden')
+        self.assertEqual([r['id'] for r in results], [self.garden.id, self.walk.id])
+        self.assertIn('<mark>garden</mark>', results[1]['snippet'])
+        self.assertIn('&amp;', self.search('basil')[0]['snippet'])
+
+    def test_query_syntax_is_literal(self):
+        self.assertEqual([r['id'] for r in self.search('garden -tomatoes')], [self.walk.id])
+        self.assertEqual([r['id'] for r in self.search('"community garden"')], [self.walk.id])
+        self.assertEqual(len(self.search('tomat')), 1)  # prefix while typing
+        self.assertEqual(self.search('NEAR( ) AND "'), [])
+        self.assertEqual(self.search('"b"'), [])  # <b> tags aren't indexed
+
+    def test_index_follows_saves_deletes_and_batches(self):
+        self.garden.content = '<p>Rain all day</p>'
+        self.garden.save()
+        self.assertEqual(len(self.search('tomatoes')), 0)
+        self.assertEqual(len(self.search('rain')), 1)
+        self.walk.delete()
+        self.assertEqual(self.search('community'), [])
+        self.client.post('/api/entries/batch', {'ops': [
+            {'op': 'create', 'title': 'Batch', 'content': '<p>zucchini</p>'},
+            {'op': 'update', 'id': self.garden.id, 'content': '<p>cucumbers</p>'},
+        ]}, content_type='application/json')
+        self.assertEqual(len(self.search('zucchini')), 1)
+        self.assertEqual(len(self.search('cucumbers')), 1)
+        self.assertEqual(self.search('rain'), [])
+
+    def test_admin_search_uses_index(self):
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'pw')
+        self.client.force_login(admin)
+        response = self.client.get('/admin/journal/entry/', {'q': 'garden'})
+        self.assertEqual(len(response.context['cl'].result_list), 3)
+        response = self.client.get('/admin/journal/entry/', {'q': 'other@example'})
+        self.assertEqual(len(response.context['cl'].result_list), 1)
+
+
+class InvertedIndexTests(TestCase):
+    """The pure-Python index: encoding, shared on-disk log, and the search API."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        settings_override = override_settings(SEARCH_BACKEND='inverted', SEARCH_INDEX_DIR=self.directory)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_posting_list_roundtrip(self):
+        ids = sorted(random.Random(0).sample(range(1, 10 ** 6), 1000))
+        postings = invindex.PostingList.from_sorted(ids)
+        postings.add(5)
+        postings.remove(ids[500])
+        expected = sorted(set(ids) - {ids[500]} | {5})
+        self.assertEqual(list(postings), expected)
+        self.assertEqual(list(postings.newest_first()), expected[::-1])
+        self.assertLess(sum(map(len, postings.blocks)), len(ids) * 3)
+
+    def test_processes_share_updates_through_the_log(self):
+        writer = invindex.IndexStore(self.directory, log_max=10 ** 6)
+        reader = invindex.IndexStore(self.directory, log_max=10 ** 6)
+        writer.update([(1, 7, 'Morning walk in the garden'), (2, 7, 'Garden party'), (3, 8, 'garden')])
+        self.assertEqual(reader.search('garden', user_id=7), [2, 1])
+        writer.update([(2, 7, 'Quiet evening')])
+        writer.delete([1])
+        self.assertEqual(reader.search('garden', user_id=7), [])
+        self.assertEqual(reader.search('even'), [2])
+
+        writer.compact()
+        writer.update([(4, 7, 'garden again')])
+        self.assertEqual(reader.search('garden'), [4, 3])
+        fresh = invindex.IndexStore(self.directory, log_max=10 ** 6)
+        self.assertEqual(fresh.search('garden'), [4, 3])
+
+        # A small log limit makes every append fold itself into a snapshot.
+        tiny = invindex.IndexStore(self.directory, log_max=1)
+        tiny.update([(5, 7, 'garden gnome')])
+        self.assertEqual(reader.search('garden', user_id=7), [5, 4])
+
+    def test_search_api_follows_entry_writes(self):
+        user = User.objects.create_user('writer', 'writer@example.com', 'pw')
+        self.client.force_login(user)
+        with self.captureOnCommitCallbacks(execute=True):
+            entry = Entry.objects.create(user=user, title='Trip', content='<p>Visited the <b>lighthouse</b></p>')
+            Entry.objects.create(user=User.objects.create_user('other'), title='lighthouse')
+        results = self.client.get('/api/entries/search', {'q': 'lighthouse'}).json()['results']
+        self.assertEqual([r['id'] for r in results], [entry.id])
+        self.assertIn('<mark>lighthouse</mark>', results[0]['snippet'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            entry.delete()
+        self.assertEqual(self.client.get('/api/entries/search', {'q': 'lighthouse'}).json()['results'], [])
+
+    def test_rebuild_from_database(self):
+        user = User.objects.create_user('writer')
+        entries = [Entry(user=user, title=f'Note {i}', content='<p>tea</p>') for i in range(300)]
+        for entry in entries:
+            entry.prepare_content()  # bulk_create skips save()
+        Entry.objects.bulk_create(entries)
+        self.assertEqual(search.rebuild_index(), 300)
+        self.assertEqual(len(invindex.get_store().search('tea', user_id=user.pk, limit=500)), 300)
+
+
+@override_settings(RATE_LIMITS={
+    'login_email': '3/15m', 'login_ip': '100/15m', 'entries_write': '2/1m',
+    'password_reset_email': '1/24h', 'password_reset_ip': '10/1h',
+    'translate_user': '2/1m', 'translate_ip': '2/1m',
+})
+class RateLimitTests(TestCase):
+    """Shared-counter limits: no table scans, rejected attempts not counted."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('limited', 'limited@example.com', 'pw')
+
+    def test_sliding_window(self):
+        self.assertEqual(ratelimit.parse_rate('5/15m'), (5, 900))
+        with self.assertRaises(ValueError):
+            ratelimit.parse_rate('5 per minute')
+        limits = {'login_email': 'a@example.com'}
+        self.assertEqual([ratelimit.hit(limits) for _ in range(3)], [0, 0, 0])
+        wait = ratelimit.hit(limits)
+        self.assertTrue(0 < wait <= 1800)
+        # Identities are independent and case-insensitive.
+        self.assertEqual(ratelimit.hit({'login_email': 'b@example.com'}), 0)
+        self.assertTrue(ratelimit.hit({'login_email': 'A@example.com'}))
+        with override_settings(RATE_LIMIT_ENABLED=False):
+            self.assertEqual(ratelimit.hit(limits), 0)
+
+    def test_previous_window_counts(self):
+        window = 1000
+        cache.set(ratelimit.cache_key('login_email', 'c@example.com', window - 1), 3)
+        # 60s into the window, 14/15 of the full previous window still overlaps.
+        with mock.patch('journal.ratelimit.time.time', return_value=window * 900 + 60):
+            wait = ratelimit.hit({'login_email': 'c@example.com'})
+        self.assertEqual(wait, 240)  # once 3 * (900 - t) / 900 + 1 <= 3, i.e. t = 300s
+        with mock.patch('journal.ratelimit.time.time', return_value=window * 900 + 300):
+            self.assertEqual(ratelimit.hit({'login_email': 'c@example.com'}), 0)
+
+    def test_database_counters(self):
+        # Database and file caches can't incr atomically: counters are rows.
+        with override_settings(CACHES={'default': {
+                'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': tempfile.gettempdir()}}):
+            self.assertFalse(ratelimit.counts_in_cache())
+        self.assertTrue(ratelimit.counts_in_cache())
+
+        limits = {'login_email': 'a@example.com', 'login_ip': '10.0.0.1'}
+        window = 1000
+        with mock.patch('journal.ratelimit.counts_in_cache', return_value=False), \
+                mock.patch('journal.ratelimit.time.time', return_value=window * 900 + 10):
+            self.assertEqual([ratelimit.hit(limits) for _ in range(3)], [0, 0, 0])
+            self.assertTrue(ratelimit.hit(limits))
+            key = ratelimit.cache_key('login_email', 'a@example.com', window)
+            self.assertEqual(ratelimit.get(key), 3)
+            # The rejected hit was taken back from the other limit too.
+            self.assertEqual(ratelimit.get(ratelimit.cache_key('login_ip', '10.0.0.1', window)), 3)
+            self.assertEqual(ratelimit.get(ratelimit.cache_key('login_email', 'b@example.com', window)), 0)
+
+            # An expired row starts counting again.
+            RateLimitCounter.objects.filter(key=key).update(expires_at=timezone.now() - timedelta(seconds=1))
+            self.assertEqual(ratelimit.get(key), 0)
+            self.assertEqual(ratelimit.incr(key, 60), 1)
+        self.assertEqual(RateLimitCounter.objects.count(), 2)
+        self.assertIsNone(cache.get(key))
+
+    def test_login_and_password_reset(self):
+        for _ in range(3):
+            self.client.post('/accounts/login/', {'login': 'limited@example.com', 'password': 'wrong'})
+        response = self.client.post('/accounts/login/', {'login': 'limited@example.com', 'password': 'pw'})
+        self.assertRedirects(response, '/accounts/login/', fetch_redirect_response=False)
+        self.assertNotIn('_auth_user_id', self.client.session)
+
+        with self.assertNumQueries(0):
+            self.assertTrue(ratelimit.hit({'login_email': 'limited@example.com'}))
+        self.client.post('/accounts/password/reset/', {'email': 'limited@example.com'})
+        response = self.client.post('/accounts/password/reset/', {'email': 'limited@example.com'})
+        self.assertRedirects(response, '/accounts/password/reset/', fetch_redirect_response=False)
+        self.assertEqual(PasswordResetRequest.objects.count(), 1)
+
+    def test_api_writes(self):
+        self.client.force_login(self.user)
+        for _ in range(2):
+            self.assertEqual(self.client.post(
+                '/api/entries', {'title': 'T', 'content': ''}, content_type='application/json').status_code, 200)
+        response = self.client.post('/api/entries', {'title': 'T'}, content_type='application/json')
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response['Retry-After']), 0)
+        # Reads aren't limited.
+        self.assertEqual(self.client.get('/api/entries').status_code, 200)
+        self.assertEqual(self.client.get('/api/translate', {'target': 'es'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/translate', {'target': 'es'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/translate', {'target': 'es'}).status_code, 429)
+
+    def test_prune_password_resets(self):
+        for days in (1, 40, 50):
+            request = PasswordResetRequest.create_request('old@example.com')
+            PasswordResetRequest.objects.filter(pk=request.pk).update(
+                requested_at=timezone.now() - timedelta(days=days))
+        call_command('prune_password_resets', days=30, batch_size=1, stdout=StringIO())
+        self.assertEqual(PasswordResetRequest.objects.count(), 1)
+
+
+class PerformanceMiddlewareTests(TestCase):
+    """Per-view histograms, the admin metrics endpoint and slow-request logging."""
+
+    def setUp(self):
+        cache.clear()
+        REGISTRY.clear()
+        self.user = User.objects.create_user('perf', 'perf@example.com', 'pw', is_staff=True)
+        self.user.user_permissions.add(Permission.objects.get(codename='view_requestprofile'))
+        Entry.objects.create(user=self.user, title='Measured')
+        self.client.force_login(self.user)
+
+    def test_streamed_page_is_measured(self):
+        response = self.client.get('/api/entries')
+        body = b''.join(response.streaming_content)
+        queries = REGISTRY.histograms[('journal_request_db_queries', 'api_entries')]
+        size = REGISTRY.histograms[('journal_response_bytes', 'api_entries')]
+        self.assertEqual(queries.count, 1)
+        self.assertGreater(queries.total, 0)
+        self.assertEqual(size.total, len(body))
+
+        text = self.client.get('/admin/metrics/').content.decode()
+        self.assertIn('# TYPE journal_request_duration_seconds histogram', text)
+        self.assertIn('journal_request_db_queries_bucket{view="api_entries",le="+Inf"} 1', text)
+        self.assertIn('journal_response_bytes_count{view="api_entries"} 1', text)
+
+    def test_metrics_are_admin_only(self):
+        self.user.user_permissions.clear()
+        self.assertEqual(self.client.get('/admin/metrics/').status_code, 403)
+        self.user.is_staff = False
+        self.user.save()
+        response = self.client.get('/admin/metrics/')
+        self.assertEqual(response.status_code, 302)
+
+    @override_settings(PERF_SLOW_REQUEST_MS=1)
+    def test_slow_requests_are_logged(self):
+        with self.assertLogs('journal.perf', 'WARNING') as logs:
+            self.client.get('/admin/')
+        self.assertIn('slow_request view=admin:index method=GET path=/admin/ status=200', logs.output[0])
+
+    @override_settings(PERF_SLOW_REQUEST_MS=0, PERF_TRACE_MEMORY=True)
+    def test_peak_memory(self):
+        self.addCleanup(tracemalloc.stop)
+        b''.join(self.client.get('/api/entries').streaming_content)
+        self.assertEqual(REGISTRY.histograms[('journal_request_peak_alloc_bytes', 'api_entries')].count, 1)
+
+
+class SiteConfigurationCacheTests(TestCase):
+    """SiteConfiguration.load: process copy, then shared cache, then the database."""
+
+    def setUp(self):
+        self.addCleanup(SiteConfiguration.invalidate)
+        SiteConfiguration.objects.create(pk=1, site_name='Cached')
+        SiteConfiguration.invalidate()  # save() primed both caches
+        self.clock = 1000.0
+        patcher = mock.patch('journal.models.time.monotonic', side_effect=lambda: self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_read_through(self):
+        with self.assertNumQueries(1):
+            config = SiteConfiguration.load()
+        self.assertEqual(config.site_name, 'Cached')
+        with self.assertNumQueries(0):
+            self.assertIs(SiteConfiguration.load(), config)
+        # Another worker (no process copy yet) is served by the shared cache.
+        SiteConfiguration._local = None
+        with self.assertNumQueries(0):
+            self.assertEqual(SiteConfiguration.load().site_name, 'Cached')
+
+    def test_save_and_invalidate(self):
+        stale = SiteConfiguration.load()
+        config = SiteConfiguration.load_for_update()
+        config.maintenance_mode = True
+        config.save()
+        self.assertIsNot(config, stale)
+        with self.assertNumQueries(0):
+            self.assertTrue(SiteConfiguration.load().maintenance_mode)
+
+        SiteConfiguration.objects.filter(pk=1).update(site_name='Edited in SQL')
+        SiteConfiguration.invalidate()
+        self.assertIsNone(cache.get(SiteConfiguration.CACHE_KEY))
+        with self.assertNumQueries(1):
+            self.assertEqual(SiteConfiguration.load().site_name, 'Edited in SQL')
+
+    @override_settings(SITE_CONFIG_LOCAL_TTL=5)
+    def test_process_copy_expires(self):
+        config = SiteConfiguration.load()
+        # A change saved by another worker reaches the shared cache only.
+        changed = SiteConfiguration.load_for_update()
+        changed.site_name = 'Renamed'
+        cache.set(SiteConfiguration.CACHE_KEY, changed, None)
+
+        self.clock += 4
+        self.assertIs(SiteConfiguration.load(), config)
+        self.clock += 2
+        with self.assertNumQueries(0):
+            self.assertEqual(SiteConfiguration.load().site_name, 'Renamed')
+
+    @override_settings(SITE_CONFIG_LOCAL_TTL=0)
+    def test_no_process_copy(self):
+        SiteConfiguration.load()
+        cache.set(SiteConfiguration.CACHE_KEY, SiteConfiguration(pk=1, site_name='Fresh'), None)
+        self.assertEqual(SiteConfiguration.load().site_name, 'Fresh')
+
+
+class ProfilingMiddlewareTests(TestCase):
+    """Opt-in cProfile runs, stored for the admin."""
+
+    def setUp(self):
+        cache.clear()
+        SiteConfiguration.invalidate()
+        self.addCleanup(SiteConfiguration.invalidate)
+        self.user = User.objects.create_user('profiled', 'profiled@example.com', 'pw')
+        Entry.objects.create(user=self.user, title='Profiled')
+        self.client.force_login(self.user)
+
+    def test_staff_flag(self):
+        b''.join(self.client.get('/api/entries', {'_profile': '1'}).streaming_content)
+        self.assertFalse(RequestProfile.objects.exists())
+
+        self.user.is_staff = self.user.is_superuser = True
+        self.user.save()
+        b''.join(self.client.get('/api/entries', HTTP_X_PROFILE='1').streaming_content)
+        profile = RequestProfile.objects.get()
+        self.assertEqual((profile.view_name, profile.trigger, profile.user), ('api_entries', 'flag', self.user))
+        self.assertIn('function calls', profile.summary)
+
+        response = self.client.get(f'/admin/profiles/{profile.pk}/download/')
+        self.assertIsInstance(marshal.loads(response.content), dict)
+        self.assertEqual(self.client.get(f'/admin/journal/requestprofile/{profile.pk}/change/').status_code, 200)
+
+        # Other staff need permission to view request profiles.
+        other = User.objects.create_user('staffer', 'staffer@example.com', 'pw', is_staff=True)
+        self.client.force_login(other)
+        self.assertEqual(self.client.get(f'/admin/profiles/{profile.pk}/download/').status_code, 403)
+        other.user_permissions.add(Permission.objects.get(codename='view_requestprofile'))
+        self.assertEqual(self.client.get(f'/admin/profiles/{profile.pk}/download/').status_code, 200)
+
+    @override_settings(PROFILE_MAX_STORED=2)
+    def test_sampling_and_retention(self):
+        config = SiteConfiguration.load_for_update()
+        config.profile_sample_rate = 1.0
+        config.profile_path_prefix = '/api/entries/'
+        config.save()
+        for _ in range(3):
+            self.client.get(f'/api/entries/{Entry.objects.get().pk}')
+        self.client.get('/api/translate')
+        self.assertEqual(RequestProfile.objects.count(), 2)
+        self.assertEqual(set(RequestProfile.objects.values_list('trigger', 'view_name')),
+                         {('sample', 'api_entry_detail')})
+
+
+@override_settings(RATE_LIMIT_ENABLED=False)
+class BenchmarkSuiteTests(TestCase):
+    """Smoke test: every benchmark scenario runs and regressions are caught."""
+
+    def test_scenarios_and_compare(self):
+        users = benchmarks.seed_users(2, 20, content_size=300)
+        admin = User.objects.create_superuser('bench-admin', 'bench-admin@example.com', 'pw')
+        ctx = benchmarks.make_context(users, admin)
+        results = {'client': {
+            scenario: benchmarks.run_client_scenario(ctx, scenario, repeat=2, warmup=1, memory_runs=1)
+            for scenario in benchmarks.SCENARIOS
+        }}
+        for metrics in results['client'].values():
+            self.assertEqual(metrics['requests'], 2)
+            self.assertGreater(metrics['queries'], 0)
+            self.assertLessEqual(metrics['p50_ms'], metrics['p99_ms'])
+        self.assertEqual(benchmarks.compare(results, results, 0.25), [])
+        # Only the cold scenario reads the entries table.
+        client = results['client']
+        self.assertGreater(client['api_entries']['queries'], client['api_entries_cached']['queries'])
+
+        baseline = {'client': {'api_entries': dict(results['client']['api_entries'], queries=1, p95_ms=0.001)}}
+        regressions = benchmarks.compare(results, baseline, 0.25)
+        self.assertEqual([line.split(':')[0] for line in regressions],
+                         ['client/api_entries p95_ms', 'client/api_entries queries'])
+        self.assertEqual(benchmarks.percentile([5, 1, 4, 2, 3], 50), 3)
+
+
+class EntryPaginationTests(TestCase):
+    """Keyset pagination and field selection on GET /api/entries."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('pager', 'pager@example.com', 'pw')
+        other = User.objects.create_user('someone', 'someone@example.com', 'pw')
+        Entry.objects.create(user=other, title='Not mine')
+        entries = [Entry.objects.create(user=self.user, title=f'Entry {i}', content=f'<p>{i}</p>') for i in range(5)]
+        # Three entries share a timestamp: the id breaks the tie.
+        tied = timezone.now() - timedelta(hours=1)
+        Entry.objects.filter(pk__in=[e.pk for e in entries[1:4]]).update(created_at=tied)
+        self.expected = list(Entry.objects.filter(user=self.user).order_by('-created_at', '-id')
+                             .values_list('pk', flat=True))
+        self.client.force_login(self.user)
+
+    def page(self, query=''):
+        response = self.client.get('/api/entries' + query)
+        body = b''.join(response.streaming_content) if response.streaming else response.content
+        return response, json.loads(body)
+
+    def test_cursor_walks_every_entry_once(self):
+        seen, cursor, pages = [], None, 0
+        while True:
+            _, data = self.page('?limit=2' + (f'&cursor={cursor}' if cursor else ''))
+            seen += [entry['id'] for entry in data['entries']]
+            pages += 1
+            cursor = data['next']
+            if cursor is None:
+                break
+        self.assertEqual((seen, pages), (self.expected, 3))
+        _, data = self.page()
+        self.assertEqual(([entry['id'] for entry in data['entries']], data['next']), (self.expected, None))
+
+    def test_fields(self):
+        _, data = self.page('?fields=id,title&limit=1')
+        self.assertEqual(data['entries'], [{'id': self.expected[0], 'title': 'Entry 4'}])
+        _, data = self.page('?fields=content,date')
+        self.assertEqual(data['entries'][0]['content'], '<p>4</p>')
+        self.assertEqual(set(data['entries'][0]), {'content', 'date'})
+        response, data = self.page('?fields=id,password')
+        self.assertEqual((response.status_code, data['message']), (400, 'Unknown field(s): password'))
+
+    def test_malformed_cursor(self):
+        for cursor in ('%%%', 'bm90IGEgY3Vyc29y', 'YXxifGM', 'eHx5', '__8'):
+            response, data = self.page(f'?cursor={cursor}')
+            self.assertEqual((response.status_code, data['status']), (400, 'error'), cursor)
+        self.assertEqual(self.page('?limit=many')[0].status_code, 400)
+
+
+class EntryListCachingTests(TestCase):
+    """ETag/304 and cached pages for GET /api/entries, keyed by journal version."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('cached', 'cached@example.com', 'pw')
+        self.entry = Entry.objects.create(user=self.user, title='First', content='<p>one</p>')
+        self.client.force_login(self.user)
+
+    def get(self, **headers):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/entries', headers=headers)
+            body = b''.join(response.streaming_content) if response.streaming else response.content
+        entry_queries = [q for q in queries if 'journal_entry' in q['sql']]
+        return response, body, entry_queries
+
+    def test_not_modified_and_cached(self):
+        response, body, entry_queries = self.get()
+        etag = response['ETag']
+        self.assertTrue(entry_queries)
+        self.assertIn('no-cache', response['Cache-Control'])
+
+        response, _, entry_queries = self.get(if_none_match=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(entry_queries, [])
+
+        response, cached_body, entry_queries = self.get()
+        self.assertFalse(response.streaming)
+        self.assertEqual((cached_body, entry_queries, response['ETag']), (body, [], etag))
+        self.assertNotEqual(self.client.get('/api/entries?limit=1')['ETag'], etag)
+
+    def test_writes_change_the_version(self):
+        etags = [self.get()[0]['ETag']]
+        self.client.post('/api/entries', {'id': self.entry.id, 'title': 'Edited'}, content_type='application/json')
+        etags.append(self.get()[0]['ETag'])
+        self.client.post('/api/entries/batch', {'ops': [{'op': 'create', 'title': 'Batched'}]},
+                         content_type='application/json')
+        etags.append(self.get()[0]['ETag'])
+        self.client.post(f'/api/entries/delete/{self.entry.id}')
+        response, body, _ = self.get(if_none_match=etags[-1])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([e['title'] for e in json.loads(body)['entries']], ['Batched'])
+        etags.append(response['ETag'])
+        self.assertEqual(len(set(etags)), 4)
+
+    def test_deleted_user_id_does_not_reuse_versions(self):
+        user_id = self.user.pk
+        before = versions.current(user_id)
+        self.user.delete()
+        self.assertGreater(versions.current(user_id), before)
+
+
+class SanitizeTests(TestCase):
+    """Entry HTML is cleaned on save and the plain text stored alongside it."""
+
+    def test_clean(self):
+        html, text = sanitize.clean(
+            '<p onclick="x()">Hi <b>there</b><script>alert(1)</script></p>'
+            '<a href=" javascript:alert(1)">link</a><a href="https://example.com">ok</a>'
+            '<section>Tom &amp; Jerry<img src=x onerror=y></section>')
+        self.assertEqual(html, '<p>Hi <b>there</b></p><a>link</a><a href="https://example.com">ok</a>'
+                               '<div>Tom &amp; Jerry</div>')
+        self.assertEqual(text, 'Hi there\nlinkok\nTom & Jerry')
+        self.assertEqual(sanitize.clean(html), (html, text))
+        self.assertEqual(sanitize.clean('<div style="color: red; background: url(x)">a</div></p>')[0],
+                         '<div style="color: red">a</div>')
+
+    def test_save_stores_derived_fields(self):
+        user = User.objects.create_user('clean', 'clean@example.com', 'pw')
+        entry = Entry.objects.create(user=user, title='T', content='<p>one two</p><style>p{}</style><div>three</div>')
+        self.assertEqual((entry.content, entry.plain_text, entry.word_count),
+                         ('<p>one two</p><div>three</div>', 'one two\n\nthree', 3))
+        self.assertEqual(len(entry.content_hash), 64)
+        self.assertEqual((entry.excerpt, entry.content_length), ('one two three', 30))
+        long_entry = Entry.objects.create(user=user, title='Long', content='<p>%s</p>' % ('word ' * 100))
+        self.assertEqual(len(long_entry.excerpt), 200)
+        self.assertTrue(long_entry.excerpt.endswith('…'))
+        self.assertIn('three', exports.entry_text(entry))
+
+        self.client.force_login(user)
+        response = self.client.post('/api/entries', {'id': entry.id, 'content': '<p>safe</p><script>x</script>'},
+                                    content_type='application/json').json()
+        self.assertEqual(response['content'], '<p>safe</p>')
+        response = self.client.post('/api/entries', {'id': entry.id, 'content': '<p>safe</p>'},
+                                    content_type='application/json').json()
+        self.assertNotIn('content', response)
+        entry.refresh_from_db()
+        self.assertEqual((entry.plain_text, entry.word_count), ('safe', 1))
+
+
+class ContentCompressionTests(TestCase):
+    """Entry.content is stored compressed above the threshold and decoded lazily."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('packed', 'packed@example.com', 'pw')
+        self.large = benchmarks.fake_html(4000)
+
+    def stored(self, entry):
+        return Entry.objects.filter(pk=entry.pk).values_list('content', flat=True).get()
+
+    def test_round_trip(self):
+        small = Entry.objects.create(user=self.user, title='Small', content='<p>short</p>')
+        large = Entry.objects.create(user=self.user, title='Large', content=self.large)
+        self.assertEqual(self.stored(small), b'<p>short</p>')
+        self.assertEqual(compression.codec_of(self.stored(large)), 'zlib')
+        self.assertLess(len(self.stored(large)), len(self.large) / 2)
+
+        entry = Entry.objects.get(pk=large.pk)
+        self.assertIsInstance(entry.__dict__['content'], bytes)
+        self.assertEqual(entry.content, self.large)
+        self.assertEqual(Entry.objects.defer('content').get(pk=large.pk).content, self.large)
+
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(f'/api/entries/{large.pk}').json()['content'], self.large)
+        self.assertEqual(compression.decode('<p>legacy text</p>'), '<p>legacy text</p>')
+
+    def test_non_string_content(self):
+        self.assertEqual(compression.decode(5), '5')
+        entry = Entry.objects.create(user=self.user, title='Number', content=5)
+        self.assertEqual((self.stored(entry), entry.plain_text), (b'5', '5'))
+
+        # The API itself only accepts strings.
+        self.client.force_login(self.user)
+        response = self.client.post('/api/entries', {'title': 'JSON', 'content': 12345},
+                                    content_type='application/json')
+        self.assertEqual((response.status_code, response.json()['message']), (400, 'content must be a string'))
+
+    def test_compress_entries_command(self):
+        with override_settings(ENTRY_CONTENT_CODEC='none'):
+            entry = Entry.objects.create(user=self.user, title='Old', content=self.large)
+        self.assertIsNone(compression.codec_of(self.stored(entry)))
+
+        out = StringIO()
+        call_command('compress_entries', batch_size=1, stdout=out)
+        self.assertIn('Rewrote 1 of 1', out.getvalue())
+        self.assertEqual(compression.codec_of(self.stored(entry)), 'zlib')
+        entry.refresh_from_db()
+        self.assertEqual((entry.content, entry.version), (self.large, 1))
+
+        call_command('compress_entries', after_id=entry.pk, stdout=out)
+        self.assertIn('Rewrote 0 of 0', out.getvalue())
+        call_command('compress_entries', codec='none', stdout=out)
+        self.assertEqual(self.stored(entry), self.large.encode())
+
+
+@override_settings(ENTRY_REVISION_COALESCE_SECONDS=0, ENTRY_REVISION_KEYFRAME_INTERVAL=4)
+class EntryRevisionTests(TestCase):
+    """Revision history: keyframes plus diffs, bounded rebuilds, retention and the API."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('history', 'history@example.com', 'pw')
+        self.entry = Entry.objects.create(user=self.user, title='Draft', content='<p>%s</p>' % ' '.join(benchmarks.WORDS))
+        self.states = [self.entry.content]
+
+    def edit(self, count):
+        rng = random.Random(count)
+        for _ in range(count):
+            words = self.entry.content[3:-4].split()
+            words.insert(rng.randint(0, len(words)), rng.choice(benchmarks.WORDS))
+            self.entry.content = '<p>%s</p>' % ' '.join(words)
+            self.entry.version += 1
+            self.entry.save()
+            self.states.append(self.entry.content)
+
+    def test_diff_round_trip(self):
+        cases = [('', '<p>new</p>'), ('<p>a b c</p>', ''), ('<p>keep 😀 this</p>', '<p>keep 😀 that <b>too</b></p>'),
+                 ('<p>1 < 2</p>', '<div>1 < 3</div>'), ('same', 'same')]
+        for old, new in cases:
+            self.assertEqual(revisions.patch(old, revisions.diff(old, new)), new)
+
+    def test_rebuilds_every_revision_from_its_keyframe(self):
+        self.edit(9)
+        history = EntryRevision.objects.filter(entry=self.entry).order_by('number')
+        self.assertEqual([r.number for r in history if r.is_keyframe], [1, 5, 9])
+        for number, content in enumerate(self.states, start=1):
+            with self.assertNumQueries(1):
+                revision = revisions.get_revision(self.entry.pk, number)
+            self.assertEqual(revision.content, content)
+        # Deltas store the change, not the document.
+        delta = history.get(number=10)
+        self.assertLess(len(delta.data), len(self.states[9]) / 2)
+        self.assertIsNone(revisions.get_revision(self.entry.pk, 99))
+
+    def test_unchanged_and_coalesced_saves(self):
+        self.entry.duration_str = '5m 0s'
+        self.entry.save()
+        self.entry.save(update_fields=['duration_str'])
+        self.assertEqual(self.entry.revisions.count(), 1)
+        with override_settings(ENTRY_REVISION_COALESCE_SECONDS=60):
+            self.edit(3)
+            self.assertEqual(self.entry.revisions.count(), 1)
+            self.assertEqual(revisions.get_revision(self.entry.pk, 1).content, self.states[-1])
+
+    @override_settings(ENTRY_REVISION_LIMIT=6)
+    def test_retention_keeps_whole_keyframe_groups(self):
+        self.edit(19)
+        numbers = list(self.entry.revisions.order_by('number').values_list('number', flat=True))
+        self.assertLessEqual(len(numbers), 6 + 3)
+        self.assertEqual(numbers[-1], 20)
+        self.assertTrue(self.entry.revisions.get(number=numbers[0]).is_keyframe)
+        for number in numbers:
+            self.assertEqual(revisions.get_revision(self.entry.pk, number).content, self.states[number - 1])
+
+    def test_api(self):
+        self.edit(2)
+        self.client.force_login(self.user)
+        listed = self.client.get(f'/api/entries/{self.entry.pk}/revisions').json()['revisions']
+        self.assertEqual([r['number'] for r in listed], [3, 2, 1])
+        first = self.client.get(f'/api/entries/{self.entry.pk}/revisions/1').json()
+        self.assertEqual((first['content'], first['version']), (self.states[0], 1))
+
+        url = f'/api/entries/{self.entry.pk}/revisions/1/restore'
+        conflict = self.client.post(url, {'version': 1}, content_type='application/json')
+        self.assertEqual(conflict.status_code, 409)
+        restored = self.client.post(url, {'version': 3}, content_type='application/json').json()
+        self.assertEqual((restored['status'], restored['version'], restored['content']), ('restored', 4, self.states[0]))
+        self.entry.refresh_from_db()
+        self.assertEqual(self.entry.content, self.states[0])
+        self.assertEqual(revisions.get_revision(self.entry.pk, 4).content, self.states[0])
+
+        other = User.objects.create_user('snoop', 'snoop@example.com', 'pw')
+        self.client.force_login(other)
+        self.assertEqual(self.client.get(f'/api/entries/{self.entry.pk}/revisions').status_code, 404)
+        self.assertEqual(self.client.post(url, {}, content_type='application/json').status_code, 404)
+
+    def test_batch_records_revisions(self):
+        self.client.force_login(self.user)
+        self.client.post('/api/entries/batch', {'ops': [
+            {'op': 'update', 'id': self.entry.pk, 'content': '<p>batched edit</p>'},
+            {'op': 'create', 'title': 'New', 'content': '<p>fresh</p>'},
+        ]}, content_type='application/json')
+        self.assertEqual(revisions.get_revision(self.entry.pk, 2).content, '<p>batched edit</p>')
+        created = Entry.objects.get(title='New')
+        self.assertEqual(revisions.get_revision(created.pk, 1).content, '<p>fresh</p>')
+
+
+class ExportFormatTests(TestCase):
+    """Streaming exports: the format registry, incremental (?since=) exports and ETags."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('formats', 'formats@example.com', 'pw')
+        self.first = Entry.objects.create(user=self.user, title='First', content='<p>older entry</p>')
+        self.client.force_login(self.user)
+
+    def get(self, url, **headers):
+        response = self.client.get(url, headers=headers)
+        body = b''.join(response.streaming_content) if response.streaming else response.content
+        return response, body
+
+    def test_registry(self):
+        self.assertEqual(set(exports.EXPORT_FORMATS), {'zip', 'jsonl', 'markdown', 'html'})
+        with self.assertRaisesMessage(ValueError, 'Available: html, jsonl, markdown, zip'):
+            exports.get_format('pdf')
+        for name, export_format in exports.EXPORT_FORMATS.items():
+            response, body = self.get(f'/export/{name}')
+            self.assertEqual((response.status_code, response['Content-Type']), (200, export_format.content_type))
+            self.assertIn(export_format.filename, response['Content-Disposition'])
+            self.assertTrue(body)
+        response, _ = self.get('/export/pdf')
+        self.assertEqual(response.status_code, 400)
+
+    def test_zip_archive(self):
+        for _ in range(2):
+            Entry.objects.create(user=self.user, title='First', content='<p>same title, same day</p>')
+        Entry.objects.create(user=self.user, title='Ünïcode/ok?', content='<p>%s</p>' % ('long ' * 2000))
+        response = self.client.get('/export/zip')
+        chunks = list(response.streaming_content)
+        self.assertGreater(len(chunks), 1)
+        with zipfile.ZipFile(BytesIO(b''.join(chunks))) as archive:
+            self.assertIsNone(archive.testzip())
+            infos = archive.infolist()
+            names = [info.filename for info in infos]
+            day = self.first.created_at.strftime('%Y-%m-%d')
+            self.assertEqual(sorted(names), sorted([
+                f'{day} - First.txt', f'{day} - First (2).txt', f'{day} - First (3).txt', f'{day} - Ünïcodeok.txt']))
+            # Written without seeking back: sizes follow each member in a data descriptor.
+            self.assertTrue(all(info.flag_bits & 0x08 for info in infos))
+            text = archive.read(f'{day} - Ünïcodeok.txt').decode()
+        self.assertTrue(text.startswith('Title: Ünïcode/ok?\n'))
+        self.assertIn('long long', text)
+        self.assertFalse(hasattr(exports.ZipStream(), 'seek') or hasattr(exports.ZipStream(), 'tell'))
+
+    def test_watermark(self):
+        moment = timezone.now()
+        self.assertEqual(exports.decode_watermark(exports.encode_watermark(moment)), moment)
+        self.assertEqual(exports.decode_watermark('W/' + exports.encode_watermark(moment)), moment)
+        self.assertIsNone(exports.decode_watermark(exports.encode_watermark(None)))
+        self.assertIsNone(exports.decode_watermark(''))
+        self.assertEqual(exports.decode_watermark('2026-01-02T03:04:05'),
+                         datetime(2026, 1, 2, 3, 4, 5, tzinfo=dt_timezone.utc))
+        for bad in ('yesterday', '9999999999999999999', '1' * 40):
+            with self.assertRaises(ValueError):
+                exports.decode_watermark(bad)
+            response, _ = self.get(f'/export/jsonl?since={bad}')
+            self.assertEqual(response.status_code, 400)
+
+    def test_incremental_export(self):
+        response, body = self.get('/export/jsonl')
+        etag = response['ETag']
+        self.assertEqual(len(body.splitlines()), 1)
+        self.assertEqual(self.get('/export/jsonl', if_none_match=etag)[0].status_code, 304)
+        self.assertEqual(self.get(f'/export/jsonl?since={etag}')[0].status_code, 304)
+
+        self.assertIn('no-store', response['Cache-Control'])
+        self.assertNotIn('X-Export-Since', response)
+
+        Entry.objects.create(user=self.user, title='Second', content='<p>newer entry</p>')
+        # Revalidating a full export gets the full export, never a delta.
+        response, body = self.get('/export/jsonl', if_none_match=etag)
+        lines = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual((response.status_code, [line['title'] for line in lines]), (200, ['Second', 'First']))
+        self.assertIn('journal_backup.jsonl', response['Content-Disposition'])
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(self.get('/export/jsonl', if_none_match=response['ETag'])[0].status_code, 304)
+
+        response, body = self.get(f'/export/jsonl?since={etag}')
+        lines = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual((response.status_code, [line['title'] for line in lines]), (200, ['Second']))
+        self.assertEqual(response['X-Export-Since'], exports.decode_watermark(etag).isoformat())
+        self.assertIn('journal_changes_since_', response['Content-Disposition'])
+        self.assertIn('private', response['Cache-Control'])
+        self.assertIn('no-store', response['Cache-Control'])
+        # A malformed validator is not an error, just not a match.
+        self.assertEqual(self.get('/export/jsonl', if_none_match='"junk"')[0].status_code, 200)
+
+    def test_api_exports_rejects_bad_bodies(self):
+        for body in ([1], 'zip', 3, {'format': ['x']}, {'format': None}, {'format': 'pdf'}):
+            response = self.client.post('/api/exports', body, content_type='application/json')
+            self.assertEqual(response.status_code, 400, body)
+            self.assertEqual(response.json()['status'], 'error')
+
+
+class ExportJobTests(TestCase):
+    """Background export jobs: reuse, re-queueing abandoned ones, and ranged downloads."""
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        override = override_settings(EXPORT_ROOT=self.root, EXPORT_BACKEND='command')
+        override.enable()
+        self.addCleanup(override.disable)
+        self.user = User.objects.create_user('exporter', 'exporter@example.com', 'pw')
+        Entry.objects.create(user=self.user, title='One', content='<p>first entry</p>')
+
+    def build(self, job):
+        ExportJob.objects.filter(pk=job.pk).update(status=ExportJob.STATUS_RUNNING, started_at=timezone.now())
+        exports.build_job(ExportJob.objects.select_related('user').get(pk=job.pk))
+        job.refresh_from_db()
+        return job
+
+    def test_job_lifecycle(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            job, created = exports.request_export(self.user, 'zip')
+        self.assertEqual((created, job.status, len(callbacks)), (True, ExportJob.STATUS_PENDING, 1))
+        self.assertEqual(exports.request_export(self.user, 'zip'), (job, False))
+
+        # A worker restart left it running: handed back as pending and queued again.
+        long_ago = timezone.now() - timedelta(hours=2)
+        ExportJob.objects.filter(pk=job.pk).update(status=ExportJob.STATUS_RUNNING, started_at=long_ago)
+        with self.captureOnCommitCallbacks() as callbacks:
+            again, created = exports.request_export(self.user, 'zip')
+        self.assertEqual((again.pk, created, again.status, len(callbacks)), (job.pk, False, ExportJob.STATUS_PENDING, 1))
+        job.refresh_from_db()
+        self.assertEqual(job.status, ExportJob.STATUS_PENDING)
+        # ...and so is one that sat in the queue past the cutoff.
+        ExportJob.objects.filter(pk=job.pk).update(created_at=long_ago)
+        with self.captureOnCommitCallbacks() as callbacks:
+            exports.request_export(self.user, 'zip')
+        self.assertEqual(len(callbacks), 1)
+
+        job = self.build(job)
+        self.assertEqual(job.status, ExportJob.STATUS_READY)
+        with zipfile.ZipFile(job.file_path) as archive:
+            self.assertIsNone(archive.testzip())
+        self.assertEqual(exports.request_export(self.user, 'zip'), (job, False))
+
+        os.unlink(job.file_path)
+        replacement, created = exports.request_export(self.user, 'zip')
+        self.assertTrue(created)
+        ExportJob.objects.filter(pk=replacement.pk).update(status=ExportJob.STATUS_FAILED)
+        self.assertTrue(exports.request_export(self.user, 'zip')[1])
+
+        Entry.objects.create(user=self.user, title='Two', content='<p>changes the fingerprint</p>')
+        self.assertTrue(exports.request_export(self.user, 'zip')[1])
+
+    def test_requeue_stale(self):
+        job, _ = exports.request_export(self.user, 'zip')
+        ExportJob.objects.filter(pk=job.pk).update(
+            status=ExportJob.STATUS_RUNNING, started_at=timezone.now() - timedelta(minutes=45))
+        self.assertEqual(exports.requeue_stale(60), 0)
+        self.assertEqual(exports.requeue_stale(), 1)
+        self.assertEqual(ExportJob.objects.get(pk=job.pk).status, ExportJob.STATUS_PENDING)
+
+    def test_ranged_download(self):
+        job = self.build(exports.request_export(self.user, 'jsonl')[0])
+        with open(job.file_path, 'rb') as f:
+            data = f.read()
+        size = len(data)
+        self.client.force_login(self.user)
+        url = f'/export/jobs/{job.pk}/download'
+
+        def get(**headers):
+            response = self.client.get(url, headers=headers)
+            body = b''.join(response.streaming_content) if response.streaming else response.content
+            return response, body
+
+        response, body = get()
+        self.assertEqual((response.status_code, body, response['Accept-Ranges']), (200, data, 'bytes'))
+        response, body = get(range='bytes=0-9')
+        self.assertEqual((response.status_code, body, response['Content-Range']), (206, data[:10], f'bytes 0-9/{size}'))
+        response, body = get(range='bytes=-5')
+        self.assertEqual((response.status_code, body), (206, data[-5:]))
+        response, body = get(range=f'bytes=5-{size + 100}')
+        self.assertEqual((body, response['Content-Range']), (data[5:], f'bytes 5-{size - 1}/{size}'))
+        response, _ = get(range=f'bytes={size}-')
+        self.assertEqual((response.status_code, response['Content-Range']), (416, f'bytes */{size}'))
+        # Multiple ranges aren't supported: the whole file, as RFC 9110 allows.
+        response, body = get(range='bytes=0-1,4-5')
+        self.assertEqual((response.status_code, body), (200, data))
+        # A stale If-Range validator also gets the whole file.
+        response, body = get(range='bytes=0-9', if_range='"something-else"')
+        self.assertEqual((response.status_code, body), (200, data))
+        response, body = get(range='bytes=0-9', if_range=response['ETag'])
+        self.assertEqual((response.status_code, body), (206, data[:10]))
+
+
+class DeployCheckTests(SimpleTestCase):
+    def test_locmem_cache_warns(self):
+        self.assertEqual([w.id for w in checks.check_shared_cache(None)], ['journal.W001'])
+        with override_settings(CACHES={'default': {
+                'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': tempfile.gettempdir()}}):
+            self.assertEqual(checks.check_shared_cache(None), [])
+
+
+class CacheURLTests(SimpleTestCase):
+
+    def test_locmem(self):
+        self.assertEqual(cache_url.parse('locmem://journal'), {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'journal',
+        })
+
+    def test_file(self):
+        config = cache_url.parse('file:///var/tmp/journal_cache?timeout=60')
+        self.assertEqual(config['BACKEND'], 'django.core.cache.backends.filebased.FileBasedCache')
+        self.assertEqual(config['LOCATION'], '/var/tmp/journal_cache')
+        self.assertEqual(config['TIMEOUT'], 60)
+
+    def test_db_defaults_table_name(self):
+        self.assertEqual(cache_url.parse('db://')['LOCATION'], 'django_cache')
+        self.assertEqual(cache_url.parse('db://my_cache')['LOCATION'], 'my_cache')
+
+    def test_redis_strips_query(self):
+        config = cache_url.parse('redis://:secret@cache:6380/2?key_prefix=journal&max_entries=500')
+        self.assertEqual(config['BACKEND'], 'django.core.cache.backends.redis.RedisCache')
+        self.assertEqual(config['LOCATION'], 'redis://:secret@cache:6380/2')
+        self.assertEqual(config['KEY_PREFIX'], 'journal')
+        self.assertEqual(config['OPTIONS'], {'MAX_ENTRIES': 500})
+
+    def test_rejects_unknown(self):
+        with self.assertRaises(ValueError):
+            cache_url.parse('memcached://localhost')
+        with self.assertRaises(ValueError):
+            cache_url.parse('locmem://?bogus=1')
+
+
+class RESPStandIn(socketserver.ThreadingTCPServer):
+    """Just enough of the Redis protocol for Django's RedisCache."""
+
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), RESPHandler)
+        self.data = {}  # key -> (value, expires_at or None)
+        self.lock = threading.Lock()
+
+    def live(self, key):
+        value = self.data.get(key)
+        if value and value[1] is not None and value[1] <= time.monotonic():
+            del self.data[key]
+            return None
+        return value
+
+
+class RESPHandler(socketserver.StreamRequestHandler):
+
+    def read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        args = []
+        for _ in range(int(line[1:])):
+            length = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(length + 2)[:-2])
+        return args
+
+    def reply(self, value):
+        if value is None:
+            out = b'$-1\r\n'
+        elif isinstance(value, int):
+            out = b':%d\r\n' % value
+        elif isinstance(value, list):
+            out = b'*%d\r\n' % len(value) + b''.join(
+                b'$-1\r\n' if v is None else b'$%d\r\n%s\r\n' % (len(v), v) for v in value)
+        elif value == 'OK':
+            out = b'+OK\r\n'
+        else:
+            out = b'$%d\r\n%s\r\n' % (len(value), value)
+        self.wfile.write(out)
+
+    def handle(self):
+        server = self.server
+        while (args := self.read_command()) is not None:
+            cmd, args = args[0].upper(), args[1:]
+            with server.lock:
+                if cmd in (b'PING', b'CLIENT', b'SELECT'):
+                    self.reply('OK')
+                elif cmd == b'GET':
+                    value = server.live(args[0])
+                    self.reply(value[0] if value else None)
+                elif cmd == b'MGET':
+                    self.reply([(server.live(k) or (None,))[0] for k in args])
+                elif cmd == b'SET':
+                    key, value, opts = args[0], args[1], [a.upper() for a in args[2:]]
+                    expires = None
+                    if b'EX' in opts:
+                        expires = time.monotonic() + int(args[2 + opts.index(b'EX') + 1])
+                    if b'NX' in opts and server.live(key):
+                        self.reply(None)
+                        continue
+                    server.data[key] = (value, expires)
+                    self.reply('OK')
+                elif cmd == b'DEL':
+                    self.reply(sum(server.data.pop(k, None) is not None for k in args))
+                elif cmd == b'EXISTS':
+                    self.reply(sum(server.live(k) is not None for k in args))
+                elif cmd == b'INCRBY':
+                    value = server.live(args[0])
+                    new = int(value[0] if value else 0) + int(args[1])
+                    server.data[args[0]] = (str(new).encode(), value[1] if value else None)
+                    self.reply(new)
+                elif cmd == b'FLUSHDB':
+                    server.data.clear()
+                    self.reply('OK')
+                else:
+                    self.wfile.write(b'-ERR unknown command\r\n')
+
+
+@skipUnless(redis, 'redis-py is not installed')
+class RedisCacheURLTests(SimpleTestCase):
+    """Drive a CACHE_URL-configured RedisCache against the local stand-in."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = RESPStandIn()
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def test_roundtrip(self):
+        host, port = self.server.server_address
+        config = cache_url.parse(f'redis://{host}:{port}/0?key_prefix=journal&timeout=30')
+        cache = RedisCache(config['LOCATION'], config)
+
+        cache.set('site_config', {'maintenance_mode': True})
+        self.assertEqual(cache.get('site_config'), {'maintenance_mode': True})
+        self.assertTrue(cache.add('counter', 1))
+        self.assertFalse(cache.add('counter', 5))
+        self.assertEqual(cache.incr('counter', 2), 3)
+        self.assertEqual(cache.get_many(['counter', 'missing']), {'counter': 3})
+        cache.delete('site_config')
+        self.assertIsNone(cache.get('site_config'))
+
+
+class StubTranslateHandler(BaseHTTPRequestHandler):
+    """Answers like translate_a/single: '<target>:<text>' as one segment."""
+
+    protocol_version = 'HTTP/1.1'  # keep-alive
+
+    def do_GET(self):
+        server = self.server
+        server.hits += 1
+        server.peers.add(self.client_address)
+        if server.delay:
+            time.sleep(server.delay)
+        query = parse_qs(urlsplit(self.path).query)
+        text, target = query['q'][0], query['tl'][0]
+        translated = '\n'.join(f'{target}:{line}' for line in text.split('\n'))
+        body = json.dumps([[[translated, text, None, None]], None, 'en']).encode()
+        try:
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except BrokenPipeError:
+            pass  # client gave up (timeout test)
+
+    def log_message(self, *args):
+        pass
+
+
+class TranslationProxyTests(SimpleTestCase):
+    # ProfilingMiddleware may read SiteConfiguration on a cold cache.
+    databases = {'default'}
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), StubTranslateHandler)
+        cls.server.daemon_threads = True
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        host, port = cls.server.server_address
+        cls.stub_url = f'http://{host}:{port}/translate_a/single'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.server.hits = 0
+        self.server.peers = set()
+        self.server.delay = 0
+        override = override_settings(TRANSLATE_URL=self.stub_url, TRANSLATE_READ_TIMEOUT=0.5)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def translate(self, text, target='es'):
+        return self.client.get('/api/translate', {'text': text, 'target': target})
+
+    def test_repeats_are_cached(self):
+        self.assertEqual(self.translate('good morning').json(), {'translatedText': 'es:good morning'})
+        self.assertEqual(self.translate(' good morning\n').json(), {'translatedText': 'es:good morning'})
+        self.assertEqual(self.translate('good morning', 'fr').json(), {'translatedText': 'fr:good morning'})
+        self.assertEqual(self.server.hits, 2)
+        # Line breaks change the result, so they are part of the key.
+        self.assertEqual(self.translate('good\nmorning').json(), {'translatedText': 'es:good\nes:morning'})
+        self.assertEqual(self.server.hits, 3)
+        # Composed and decomposed forms of the same text share an entry.
+        self.assertEqual(self.translate('caf\u00e9').json(), self.translate('cafe\u0301').json())
+        self.assertEqual(self.server.hits, 4)
+
+    def test_connections_are_reused(self):
+        for word in ('one', 'two', 'three'):
+            self.assertEqual(self.translate(word).status_code, 200)
+        self.assertEqual(self.server.hits, 3)
+        self.assertEqual(len(self.server.peers), 1)
+
+    def test_slow_upstream_times_out(self):
+        self.server.delay = 1
+        response = self.translate('slow')
+        self.assertEqual(response.status_code, 504)
+
+    def test_rejects_bad_input(self):
+        self.assertEqual(self.translate('').status_code, 400)
+        self.assertEqual(self.translate('hi', 'es&q=x').status_code, 400)
+        self.assertEqual(self.server.hits, 0)
+
+    async def test_async_coalesces_identical_requests(self):
+        self.server.delay = 0.2
+        results = await asyncio.gather(*(translation.translate_async(['hello'], 'de') for _ in range(5)))
+        self.assertEqual(results, [['de:hello']] * 5)
+        self.assertEqual(self.server.hits, 1)
+
+    async def test_async_batches_segments(self):
+        client = AsyncClient()
+        response = await client.post(
+            '/api/translate/batch', {'segments': ['one', 'two', 'three'], 'target': 'it'},
+            content_type='application/json')
+        self.assertEqual(response.json(), {'translations': ['it:one', 'it:two', 'it:three']})
+        self.assertEqual(self.server.hits, 1)
+
+    async def test_async_sheds_load_when_saturated(self):
+        self.server.delay = 0.2
+        with override_settings(TRANSLATE_MAX_PENDING=2, TRANSLATE_BATCH_SIZE=1):
+            results = await asyncio.gather(
+                *(translation.translate_async([f'word {i}'], 'es') for i in range(4)),
+                return_exceptions=True)
+        self.assertEqual(sum(isinstance(r, translation.TranslationBusy) for r in results), 2)
+        self.assertEqual(self.server.hits, 2)
+
+    def test_cache_evicts_lru_and_expired(self):
+        cache = translation.TranslationCache(max_entries=2, ttl=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual((cache.get('a'), cache.get('b'), cache.get('c')), (1, None, 3))
+
+        expired = translation.TranslationCache(max_entries=2, ttl=0)
+        expired.set('a', 1)
+        self.assertIsNone(expired.get('a'))
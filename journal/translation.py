@@ -0,0 +1,284 @@
+"""Translation proxy backend: result cache plus a pooled upstream client.
+
+Results are cached in-process, keyed on a hash of the normalized text and
+the target language, with a TTL and LRU eviction. Upstream calls reuse
+keep-alive connections from a small pool and use strict connect/read
+timeouts, so a slow upstream cannot hold a worker indefinitely.
+
+``AsyncTranslator`` serves the async view under ASGI. Identical in-flight
+requests share one upstream call, requests arriving within a short window
+are batched into one call, and a semaphore caps concurrent upstream calls.
+"""
+import asyncio
+import hashlib
+import threading
+import time
+import unicodedata
+import weakref
+from collections import OrderedDict
+
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+
+class TranslationError(Exception):
+    """The upstream translation service failed or returned garbage."""
+
+
+class TranslationTimeout(TranslationError):
+    """The upstream translation service did not answer in time."""
+
+
+class TranslationBusy(TranslationError):
+    """Too many translations are already waiting; shed load instead of queueing."""
+
+
+def normalize_text(text):
+    """Canonical form used for cache keys: NFC, trimmed at both ends.
+
+    Inner whitespace is kept: line breaks shape the translation, so text
+    that differs only in them must not share a cached result.
+    """
+    return unicodedata.normalize('NFC', text).strip()
+
+
+def cache_key(text, target):
+    digest = hashlib.sha256(normalize_text(text).encode()).hexdigest()
+    return digest, target.lower()
+
+
+class TranslationCache:
+    """Thread-safe LRU cache whose items also expire after ``ttl`` seconds."""
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at <= time.monotonic():
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._items[key] = (value, time.monotonic() + self.ttl)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def __len__(self):
+        return len(self._items)
+
+
+def parse_response(raw_json):
+    """Join the translated segments of a translate_a/single response."""
+    translated_text = ""
+    if raw_json and isinstance(raw_json, list):
+        for segment in raw_json[0] or []:
+            if segment:
+                translated_text += segment[0]
+    return translated_text
+
+
+class TranslationClient:
+    """Keep-alive HTTP client for the upstream translate endpoint."""
+
+    def __init__(self, url, connect_timeout, read_timeout, pool_size):
+        self.url = url
+        self.timeout = (connect_timeout, read_timeout)
+        self.session = requests.Session()
+        self.session.headers['User-Agent'] = 'Mozilla/5.0'
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def translate(self, text, target):
+        params = {'client': 'gtx', 'sl': 'auto', 'tl': target, 'dt': 't', 'q': text}
+        try:
+            response = self.session.get(self.url, params=params, timeout=self.timeout)
+            response.raise_for_status()
+            return parse_response(response.json())
+        except requests.Timeout as e:
+            raise TranslationTimeout(str(e)) from e
+        except (requests.RequestException, ValueError, TypeError, IndexError) as e:
+            raise TranslationError(str(e)) from e
+
+    def translate_many(self, texts, target):
+        """Translate several single-line segments with one upstream call.
+
+        Segments are sent newline-separated and split back apart; if the
+        upstream merges or splits lines, fall back to one call per segment.
+        """
+        if len(texts) == 1:
+            return [self.translate(texts[0], target)]
+        parts = self.translate('\n'.join(texts), target).split('\n')
+        if len(parts) != len(texts):
+            return [self.translate(text, target) for text in texts]
+        return parts
+
+
+_client = None
+_cache = None
+_init_lock = threading.Lock()
+
+
+def get_client():
+    global _client
+    if _client is None:
+        with _init_lock:
+            if _client is None:
+                _client = TranslationClient(
+                    settings.TRANSLATE_URL,
+                    settings.TRANSLATE_CONNECT_TIMEOUT,
+                    settings.TRANSLATE_READ_TIMEOUT,
+                    settings.TRANSLATE_POOL_SIZE,
+                )
+    return _client
+
+
+def get_cache():
+    global _cache
+    if _cache is None:
+        with _init_lock:
+            if _cache is None:
+                _cache = TranslationCache(settings.TRANSLATE_CACHE_SIZE, settings.TRANSLATE_CACHE_TTL)
+    return _cache
+
+
+def translate(text, target):
+    """Translate ``text`` into ``target``, served from cache when possible."""
+    key = cache_key(text, target)
+    cache = get_cache()
+    translated = cache.get(key)
+    if translated is None:
+        translated = get_client().translate(text, target)
+        cache.set(key, translated)
+    return translated
+
+
+class AsyncTranslator:
+    """Coalesces, batches and rate-limits translations on one event loop."""
+
+    def __init__(self, max_concurrency, max_pending, batch_window, batch_size, batch_chars):
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.max_pending = max_pending
+        self.batch_window = batch_window
+        self.batch_size = batch_size
+        self.batch_chars = batch_chars
+        self.inflight = {}  # cache key -> Future shared by identical requests
+        self.batches = {}   # target -> [(key, text, future)] waiting to be sent
+        self.timers = {}    # target -> TimerHandle flushing that batch
+        self.tasks = set()  # strong refs so running batches aren't GC'd
+
+    async def translate(self, text, target):
+        key = cache_key(text, target)
+        cached = get_cache().get(key)
+        if cached is not None:
+            return cached
+
+        future = self.inflight.get(key)
+        if future is None:
+            if len(self.inflight) >= self.max_pending:
+                raise TranslationBusy('Too many pending translations')
+            future = asyncio.get_running_loop().create_future()
+            self.inflight[key] = future
+            self.add_to_batch(key, text, target, future)
+        # Shield so one cancelled caller doesn't cancel everyone's result.
+        return await asyncio.shield(future)
+
+    def add_to_batch(self, key, text, target, future):
+        if '\n' in text:
+            # Can't be newline-joined with others; send on its own.
+            self.start(self.run_batch(target, [(key, text, future)]))
+            return
+        batch = self.batches.setdefault(target, [])
+        batch.append((key, text, future))
+        size = sum(len(t) for _, t, _ in batch)
+        if len(batch) >= self.batch_size or size >= self.batch_chars:
+            self.flush(target)
+        elif target not in self.timers:
+            loop = asyncio.get_running_loop()
+            self.timers[target] = loop.call_later(self.batch_window, self.flush, target)
+
+    def flush(self, target):
+        timer = self.timers.pop(target, None)
+        if timer is not None:
+            timer.cancel()
+        batch = self.batches.pop(target, None)
+        if batch:
+            self.start(self.run_batch(target, batch))
+
+    def start(self, coro):
+        task = asyncio.get_running_loop().create_task(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def run_batch(self, target, batch):
+        try:
+            async with self.semaphore:
+                results = await asyncio.to_thread(
+                    get_client().translate_many, [text for _, text, _ in batch], target)
+        except Exception as e:
+            for key, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+        else:
+            cache = get_cache()
+            for (key, _, future), translated in zip(batch, results):
+                cache.set(key, translated)
+                if not future.done():
+                    future.set_result(translated)
+        finally:
+            for key, _, _ in batch:
+                self.inflight.pop(key, None)
+
+
+# asyncio primitives are bound to a loop, so keep one translator per loop.
+_translators = weakref.WeakKeyDictionary()
+
+
+def get_async_translator():
+    loop = asyncio.get_running_loop()
+    translator = _translators.get(loop)
+    if translator is None:
+        translator = AsyncTranslator(
+            settings.TRANSLATE_MAX_CONCURRENCY,
+            settings.TRANSLATE_MAX_PENDING,
+            settings.TRANSLATE_BATCH_WINDOW,
+            settings.TRANSLATE_BATCH_SIZE,
+            settings.TRANSLATE_BATCH_CHARS,
+        )
+        _translators[loop] = translator
+    return translator
+
+
+async def translate_async(texts, target):
+    """Translate a list of segments concurrently through the loop's translator."""
+    translator = get_async_translator()
+    return await asyncio.gather(*(translator.translate(text, target) for text in texts))
+
+
+@receiver(setting_changed)
+def reset_on_setting_change(setting, **kwargs):
+    """Rebuild the client/cache when TRANSLATE_* settings change (tests)."""
+    global _client, _cache
+    if setting.startswith('TRANSLATE_'):
+        _client = None
+        _cache = None
+        _translators.clear()
@@ -1,10 +1,28 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
+# Under ASGI the async proxy coalesces and batches across requests; under
+# WSGI each request gets its own event loop, so keep the sync view there.
+translate_view = views.proxy_translate_async if settings.TRANSLATE_ASYNC else views.proxy_translate
+
 urlpatterns = [
     path('', views.index, name='index'),
     path('api/entries', views.api_entries, name='api_entries'),
+    path('api/entries/batch', views.api_entries_batch, name='api_entries_batch'),
+    path('api/entries/search', views.api_entries_search, name='api_entries_search'),
+    path('api/entries/<int:entry_id>', views.api_entry_detail, name='api_entry_detail'),
+    path('api/entries/<int:entry_id>/patch', views.api_entry_patch, name='api_entry_patch'),
+    path('api/entries/<int:entry_id>/revisions', views.api_entry_revisions, name='api_entry_revisions'),
+    path('api/entries/<int:entry_id>/revisions/<int:number>', views.api_entry_revision, name='api_entry_revision'),
+    path('api/entries/<int:entry_id>/revisions/<int:number>/restore', views.api_entry_revision_restore,
+         name='api_entry_revision_restore'),
     path('api/entries/delete/<int:entry_id>', views.delete_entry, name='delete_entry'),
-    path('api/translate', views.proxy_translate, name='proxy_translate'),
-    path('export/zip', views.export_zip, name='export_zip'),
+    path('api/translate', translate_view, name='proxy_translate'),
+    path('api/translate/batch', views.proxy_translate_async, name='proxy_translate_batch'),
+    path('export/zip', views.export_entries, {'format': 'zip'}, name='export_zip'),
+    path('export/<str:format>', views.export_entries, name='export_entries'),
+    path('api/exports', views.api_exports, name='api_exports'),
+    path('api/exports/<int:job_id>', views.api_export_status, name='api_export_status'),
+    path('export/jobs/<int:job_id>/download', views.export_download, name='export_download'),
 ]
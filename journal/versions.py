@@ -0,0 +1,54 @@
+"""Per-user journal versions for conditional GETs and page caching.
+
+Every create, update or delete of a user's entries bumps their
+JournalVersion inside the same transaction: the signal handlers below
+cover ``save``/``delete``, and code that bypasses signals
+(``bulk_create``/``bulk_update``) calls ``bump`` itself. GET /api/entries
+derives a strong ETag from the version, so an unchanged journal answers
+304 after one primary-key lookup, and caches serialized pages under it.
+
+The version is read from the database on every request rather than from
+the cache: with the per-process locmem default a cached copy could not be
+invalidated in the other workers.
+"""
+from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Entry, JournalVersion
+
+
+def current(user_id):
+    """The user's journal version (0 if they've never written)."""
+    version = JournalVersion.objects.filter(user_id=user_id).values_list('version', flat=True).first()
+    return version or 0
+
+
+def bump(user_id):
+    if JournalVersion.objects.filter(user_id=user_id).update(version=F('version') + 1):
+        return
+    try:
+        with transaction.atomic():
+            JournalVersion.objects.create(user_id=user_id, version=1)
+    except IntegrityError:  # created concurrently
+        JournalVersion.objects.filter(user_id=user_id).update(version=F('version') + 1)
+
+
+@receiver(post_save, sender=Entry)
+def entry_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        bump(instance.user_id)
+
+
+@receiver(post_delete, sender=Entry)
+def entry_deleted(sender, instance, **kwargs):
+    bump(instance.user_id)
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    # Keep the row and move past the last version: if the database reuses
+    # the id, the new user must not match the old user's ETags or pages.
+    bump(instance.pk)
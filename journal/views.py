@@ -1,13 +1,29 @@
+import base64
+import binascii
+import hashlib
 import json
-import urllib.request
-import urllib.parse
+import os
+import re
+from datetime import datetime
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Q
 from django.shortcuts import render
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import parse_etags
+from django.views.decorators.http import condition
 from django.views.decorators.csrf import csrf_exempt, ensure_csrf_cookie
 from django.contrib.auth.decorators import login_required
-from .models import Entry
-import zipfile
-import io
+from . import compression, ratelimit, revisions, search, stats, translation, versions
+from .exports import (
+    decode_watermark, encode_watermark, export_queryset, get_format, latest_change, request_export,
+)
+from .models import Entry, EntryRevision, ExportJob
 
 def get_client_ip(request):
     x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
@@ -17,6 +33,14 @@ def get_client_ip(request):
         ip = request.META.get('REMOTE_ADDR')
     return ip
 
+
+def entries_write_limit(request):
+    return {'entries_write': request.user.pk}
+
+
+def translate_limit(request):
+    return {'translate_user': request.user.pk, 'translate_ip': get_client_ip(request)}
+
 @ensure_csrf_cookie
 def index(request):
     """Renders the main SPA."""
@@ -28,113 +52,781 @@ def index(request):
 
     return render(request, 'journal/index.html', {'config': config})
 
+# Public JSON field name -> Entry model field, used by the ``fields=`` selector.
+ENTRY_FIELDS = {
+    'id': 'id',
+    'title': 'title',
+    'content': 'content',
+    'date': 'created_at',
+    'durationStr': 'duration_str',
+    'version': 'version',
+    'excerpt': 'excerpt',
+    'contentLength': 'content_length',
+}
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def encode_cursor(created_at, entry_id):
+    """Opaque keyset cursor pointing just past the given (created_at, id)."""
+    raw = f"{created_at.isoformat()}|{entry_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor. Raises ValueError on a malformed cursor."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, entry_id = base64.urlsafe_b64decode(padded).decode().split('|')
+        return datetime.fromisoformat(created_at), int(entry_id)
+    except (TypeError, UnicodeDecodeError, binascii.Error) as e:
+        raise ValueError('Invalid cursor') from e
+
+
+def parse_fields(raw):
+    """Parse a ``fields=a,b,c`` selector into public field names."""
+    if not raw:
+        return list(ENTRY_FIELDS)
+    fields = [f.strip() for f in raw.split(',') if f.strip()]
+    unknown = [f for f in fields if f not in ENTRY_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown field(s): {', '.join(unknown)}")
+    return fields
+
+
+def entries_page_queryset(user, cursor=None):
+    """User's entries newest first, keyset-ordered on (created_at, id)."""
+    entries = Entry.objects.filter(user=user).order_by('-created_at', '-id')
+    if cursor:
+        created_at, entry_id = cursor
+        entries = entries.filter(
+            Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=entry_id)
+        )
+    return entries
+
+
+def serialize_entry(row, fields):
+    """Map a values() row onto the public JSON shape."""
+    data = {}
+    for name in fields:
+        value = row[ENTRY_FIELDS[name]]
+        if name == 'date':
+            value = value.isoformat()
+        elif name == 'content':
+            value = compression.decode(value)  # values() skips the model's lazy decoding
+        data[name] = value
+    return data
+
+
+def stream_entries_page(entries, fields, limit):
+    """Yield a ``{"entries": [...], "next": cursor}`` document row by row.
+
+    One extra row is fetched to know whether another page exists, so the
+    full page is never materialized as a list.
+    """
+    columns = {'id', 'created_at'} | {ENTRY_FIELDS[f] for f in fields}
+    rows = entries.values(*columns)[:limit + 1].iterator(chunk_size=limit + 1)
+
+    yield '{"entries":['
+    last = None
+    has_more = False
+    for i, row in enumerate(rows):
+        if i == limit:
+            has_more = True
+            break
+        yield ('' if i == 0 else ',') + json.dumps(serialize_entry(row, fields), cls=DjangoJSONEncoder)
+        last = row
+    next_cursor = encode_cursor(last['created_at'], last['id']) if has_more else None
+    yield '],"next":' + json.dumps(next_cursor) + '}'
+
+
+def entries_page_etag(request):
+    """Strong ETag for a GET page: the journal version plus the query string."""
+    if request.method != 'GET':
+        return None
+    if not hasattr(request, '_entries_etag'):
+        params = hashlib.sha256(request.META.get('QUERY_STRING', '').encode()).hexdigest()[:16]
+        request._entries_etag = f'"{versions.current(request.user.pk)}-{params}"'
+    return request._entries_etag
+
+
+def caching_stream(chunks, key):
+    """Pass ``chunks`` through, then cache the joined body if it was small enough."""
+    parts, size = [], 0
+    for chunk in chunks:
+        if parts is not None:
+            size += len(chunk)
+            if size <= settings.ENTRIES_PAGE_CACHE_MAX_BYTES:
+                parts.append(chunk)
+            else:
+                parts = None
+        yield chunk
+    if parts is not None:
+        cache.set(key, ''.join(parts), settings.ENTRIES_PAGE_CACHE_TTL)
+
+
 @login_required
+@ratelimit.ratelimit(entries_write_limit, methods=('POST',))
+@condition(etag_func=entries_page_etag)
 def api_entries(request):
-    """API to handle Journal Entries (Load / Save)."""
+    """API to handle Journal Entries (Load / Save).
+
+    GET is keyset-paginated: ``?limit=`` (default 50, max 200), ``?cursor=``
+    taken from the previous page's ``next``, and ``?fields=`` to restrict
+    the serialized columns (e.g. ``fields=id,title,date,durationStr``).
+    Pages carry a strong ETag from the user's journal version; a matching
+    ``If-None-Match`` gets 304, and a page already serialized at this
+    version is served from the cache without querying entries.
+    """
     if request.method == 'GET':
-        entries = Entry.objects.filter(user=request.user)
-        data = [{
-            'id': entry.id,
-            'title': entry.title,
-            'content': entry.content,
-            'date': entry.created_at.isoformat(),
-            'durationStr': entry.duration_str
-        } for entry in entries]
-        return JsonResponse(data, safe=False)
+        try:
+            fields = parse_fields(request.GET.get('fields'))
+            limit = min(max(int(request.GET.get('limit', DEFAULT_PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+            cursor = request.GET.get('cursor')
+            cursor = decode_cursor(cursor) if cursor else None
+        except ValueError as e:
+            return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+
+        # The ETag names the version and the parameters exactly.
+        key = f"entries_page:{request.user.pk}:{entries_page_etag(request)}"
+        body = cache.get(key)
+        if body is not None:
+            response = HttpResponse(body, content_type='application/json')
+        else:
+            entries = entries_page_queryset(request.user, cursor)
+            response = StreamingHttpResponse(
+                caching_stream(stream_entries_page(entries, fields, limit), key),
+                content_type='application/json',
+            )
+        # Browsers keep the page but revalidate it on every load.
+        patch_cache_control(response, private=True, no_cache=True)
+        patch_vary_headers(response, ['Cookie'])
+        return response
 
     elif request.method == 'POST':
         try:
             data = json.loads(request.body)
+            if not isinstance(data, dict):
+                raise ValueError('Request body must be a JSON object')
+            invalid = invalid_entry_fields(data)
+            if invalid:
+                raise ValueError(invalid)
             ip = get_client_ip(request)
             
             entry_id = data.get('id')
-            if entry_id:
-                # Update existing
-                try:
-                    entry = Entry.objects.get(id=entry_id, user=request.user)
-                    entry.title = data.get('title', entry.title)
-                    entry.content = data.get('content', entry.content)
-                    entry.duration_str = data.get('durationStr', entry.duration_str)
-                    # Don't update IP on edit? Or do? Let's update it.
-                    entry.ip_address = ip
-                    entry.save()
-                    return JsonResponse({'status': 'updated', 'id': entry.id})
-                except Entry.DoesNotExist:
-                    pass # Fall through to create if ID is invalid (unlikely)
-
-            # Create new
-            entry = Entry.objects.create(
-                user=request.user,
-                title=data.get('title', 'Untitled'),
-                content=data.get('content', ''),
-                duration_str=data.get('durationStr', '0s'),
-                ip_address=ip
-            )
+            # One transaction with the signal-driven writes (search index,
+            # revisions), so a failure leaves nothing half-saved.
+            with transaction.atomic():
+                if entry_id:
+                    # Update existing
+                    try:
+                        entry = Entry.objects.select_for_update().get(id=entry_id, user=request.user)
+                        entry.title = data.get('title', entry.title)
+                        entry.content = data.get('content', entry.content)
+                        entry.duration_str = data.get('durationStr', entry.duration_str)
+                        # Don't update IP on edit? Or do? Let's update it.
+                        entry.ip_address = ip
+                        entry.version += 1
+                        entry.save()
+                        return JsonResponse(saved_entry_json('updated', entry, data.get('content')))
+                    except Entry.DoesNotExist:
+                        pass # Fall through to create if ID is invalid (unlikely)
+
+                # Create new
+                entry = Entry.objects.create(
+                    user=request.user,
+                    title=data.get('title', 'Untitled'),
+                    content=data.get('content', ''),
+                    duration_str=data.get('durationStr', '0s'),
+                    ip_address=ip
+                )
             
-            return JsonResponse({'status': 'created', 'id': entry.id})
+            return JsonResponse(saved_entry_json('created', entry, data.get('content', '')))
         except Exception as e:
             return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
 
+
+def saved_entry_json(status, entry, submitted):
+    """Save response; includes the stored content if sanitizing changed what was sent.
+
+    Clients computing deltas must use that content as their new base.
+    """
+    data = {'status': status, 'id': entry.id, 'version': entry.version}
+    if submitted is not None and submitted != entry.content:
+        data['content'] = entry.content
+    return data
+
+
+def apply_delta(content, ops):
+    """Apply splice ops ``{"start", "end", "text"}`` to ``content`` in order.
+
+    Offsets are UTF-16 code units, matching JavaScript string indices, so
+    text with astral characters (emoji) lines up with what the editor saw.
+    Raises ValueError for malformed or out-of-range ops.
+    """
+    units = content.encode('utf-16-le')
+    for op in ops:
+        if not isinstance(op, dict):
+            raise ValueError('Each op must be an object')
+        start, end, text = op.get('start'), op.get('end'), op.get('text', '')
+        if (not isinstance(start, int) or not isinstance(end, int) or not isinstance(text, str)
+                or not 0 <= start <= end <= len(units) // 2):
+            raise ValueError(f'Invalid op {op!r}')
+        units = units[:start * 2] + text.encode('utf-16-le') + units[end * 2:]
+    try:
+        return units.decode('utf-16-le')
+    except UnicodeDecodeError as e:
+        raise ValueError('Op splits a surrogate pair') from e
+
+
 @login_required
-def export_zip(request):
-    """Exports user entries as a ZIP file of text files."""
-    from django.utils.html import strip_tags
-    import zipfile
-    import io
-    
-    entries = Entry.objects.filter(user=request.user)
-    
-    if not entries.exists():
+@ratelimit.ratelimit(entries_write_limit, methods=('PATCH', 'POST'))
+def api_entry_patch(request, entry_id):
+    """Apply a content delta to an entry with optimistic concurrency.
+
+    Body: ``{"version": n, "ops": [{"start", "end", "text"}], "title"?,
+    "durationStr"?}``. If ``version`` is not the stored version, nothing
+    is written and 409 returns the current version. Only changed columns
+    are written.
+    """
+    if request.method not in ('PATCH', 'POST'):
+        return JsonResponse({'status': 'error', 'message': 'Invalid request method'}, status=400)
+
+    try:
+        data = json.loads(request.body)
+        version = data['version']
+        ops = data.get('ops') or []
+        if not isinstance(version, int) or not isinstance(ops, list):
+            raise ValueError('version must be an integer and ops a list')
+    except (ValueError, KeyError, TypeError) as e:
+        return JsonResponse({'status': 'error', 'message': f'Invalid delta: {e}'}, status=400)
+    invalid = invalid_entry_fields({key: data[key] for key in ('title', 'durationStr') if key in data})
+    if invalid:
+        return JsonResponse({'status': 'error', 'message': invalid}, status=400)
+
+    with transaction.atomic():
+        try:
+            entry = Entry.objects.select_for_update().get(id=entry_id, user=request.user)
+        except Entry.DoesNotExist:
+            return JsonResponse({'status': 'error', 'message': 'Entry not found or you do not have permission'}, status=404)
+
+        if entry.version != version:
+            return JsonResponse({'status': 'conflict', 'id': entry.id, 'version': entry.version}, status=409)
+
+        changed = []
+        if ops:
+            try:
+                content = apply_delta(entry.content, ops)
+            except ValueError as e:
+                return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+            if content != entry.content:
+                entry.content = content
+                changed.append('content')
+        for key, field in (('title', 'title'), ('durationStr', 'duration_str')):
+            if key in data and data[key] != getattr(entry, field):
+                setattr(entry, field, data[key])
+                changed.append(field)
+
+        submitted = entry.content
+        if changed:
+            entry.ip_address = get_client_ip(request)
+            entry.version += 1
+            entry.save(update_fields=changed + ['ip_address', 'version', 'updated_at'])
+
+    return JsonResponse(saved_entry_json('updated', entry, submitted))
+
+MAX_BATCH_OPS = 500
+
+
+def invalid_entry_fields(data):
+    """Why ``title``/``content``/``durationStr`` in ``data`` can't be saved, or None.
+
+    Checked before writing so a bad value gets a 400 (or a per-op error)
+    instead of a database error that would abort the transaction.
+    """
+    for key, field in (('title', 'title'), ('content', 'content'), ('durationStr', 'duration_str')):
+        if key not in data:
+            continue
+        if not isinstance(data[key], str):
+            return f'{key} must be a string'
+        max_length = Entry._meta.get_field(field).max_length
+        if max_length and len(data[key]) > max_length:
+            return f'{key} must be at most {max_length} characters'
+    return None
+
+
+def batch_error(index, op, message, status='error'):
+    return {'index': index, 'op': op, 'status': status, 'message': message}
+
+
+@login_required
+@ratelimit.ratelimit(entries_write_limit, methods=('POST',))
+def api_entries_batch(request):
+    """Apply many create/update/delete operations in one transaction.
+
+    Body: ``{"ops": [...], "atomic": false}`` where each op is one of
+    ``{"op": "create", "ref"?, "title"?, "content"?, "durationStr"?}``,
+    ``{"op": "update", "id", "version"?, "title"?, "content"?, "durationStr"?}``
+    or ``{"op": "delete", "id"}``. Updates and deletes are limited to the
+    caller's entries, as in api_entries and delete_entry. A given
+    ``version`` is checked like a delta save. Each op gets a result in
+    request order. With ``atomic`` true, any failed op rolls back the
+    whole batch.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'status': 'error', 'message': 'Invalid request method'}, status=400)
+
+    try:
+        data = json.loads(request.body)
+        ops = data['ops']
+        if not isinstance(ops, list):
+            raise ValueError('ops must be a list')
+    except (ValueError, KeyError, TypeError) as e:
+        return JsonResponse({'status': 'error', 'message': f'Invalid batch: {e}'}, status=400)
+    if len(ops) > MAX_BATCH_OPS:
+        return JsonResponse({'status': 'error', 'message': f'At most {MAX_BATCH_OPS} ops per batch'}, status=400)
+
+    ip = get_client_ip(request)
+    now = timezone.now()
+    results = [None] * len(ops)
+    creates, updates, deletes = [], [], []
+    seen_ids = set()
+
+    for index, op in enumerate(ops):
+        kind = op.get('op') if isinstance(op, dict) else None
+        invalid = invalid_entry_fields(op) if kind in ('create', 'update') else None
+        if invalid:
+            results[index] = batch_error(index, kind, invalid)
+        elif kind == 'create':
+            creates.append((index, op))
+        elif kind in ('update', 'delete'):
+            entry_id = op.get('id')
+            if not isinstance(entry_id, int):
+                results[index] = batch_error(index, kind, 'id must be an integer')
+            elif entry_id in seen_ids:
+                results[index] = batch_error(index, kind, 'Entry already modified earlier in this batch')
+            else:
+                seen_ids.add(entry_id)
+                (updates if kind == 'update' else deletes).append((index, op))
+        else:
+            results[index] = batch_error(index, kind, 'op must be create, update or delete')
+
+    with transaction.atomic():
+        # One query for every referenced row, scoped to the caller.
+        owned = Entry.objects.select_for_update().filter(
+            user=request.user, id__in=seen_ids).order_by().in_bulk()
+        not_found = 'Entry not found or you do not have permission'
+
+        to_update, update_fields = [], {'ip_address', 'version', 'updated_at'}
+        for index, op in updates:
+            entry = owned.get(op['id'])
+            if entry is None:
+                results[index] = batch_error(index, 'update', not_found, 'not_found')
+                continue
+            if 'version' in op and op['version'] != entry.version:
+                results[index] = dict(batch_error(index, 'update', 'Version mismatch', 'conflict'),
+                                      id=entry.id, version=entry.version)
+                continue
+            for key, field in (('title', 'title'), ('content', 'content'), ('durationStr', 'duration_str')):
+                if key in op:
+                    setattr(entry, field, op[key])
+                    update_fields.add(field)
+            if 'content' in op:
+                # bulk_update bypasses save(), which would do this.
+                entry.prepare_content()
+                update_fields.update(Entry.DERIVED_FIELDS)
+            entry.ip_address = ip
+            entry.version += 1
+            entry.updated_at = now
+            to_update.append(entry)
+            results[index] = dict(saved_entry_json('updated', entry, op.get('content')), index=index, op='update')
+
+        delete_ids = []
+        for index, op in deletes:
+            if op['id'] not in owned:
+                results[index] = batch_error(index, 'delete', not_found, 'not_found')
+                continue
+            delete_ids.append(op['id'])
+            results[index] = {'index': index, 'op': 'delete', 'status': 'deleted', 'id': op['id']}
+
+        new_entries = [
+            Entry(
+                user=request.user,
+                title=op.get('title', 'Untitled'),
+                content=op.get('content', ''),
+                duration_str=op.get('durationStr', '0s'),
+                ip_address=ip,
+            )
+            for index, op in creates
+        ]
+        for entry in new_entries:
+            entry.prepare_content()
+
+        failed = any(r is not None and r['status'] not in ('updated', 'deleted') for r in results)
+        if failed and data.get('atomic'):
+            transaction.set_rollback(True)
+            for index, op in creates:
+                results[index] = batch_error(index, 'create', 'Batch rolled back', 'skipped')
+            for r in results:
+                if r['status'] in ('updated', 'deleted'):
+                    r.update(status='skipped', message='Batch rolled back')
+            return JsonResponse({'status': 'rolled_back', 'results': results}, status=409)
+
+        if to_update:
+            Entry.objects.bulk_update(to_update, sorted(update_fields), batch_size=200)
+            search.index_entries(to_update)
+        if delete_ids:
+            Entry.objects.filter(user=request.user, id__in=delete_ids).delete()
+        if new_entries:
+            Entry.objects.bulk_create(new_entries, batch_size=200)
+            # bulk_create skips post_save; deletes above still send post_delete.
+            stats.record_entries_created(new_entries)
+            search.index_entries(new_entries)
+        if to_update or new_entries:
+            # bulk_update/bulk_create send no signals to bump it or record revisions.
+            versions.bump(request.user.pk)
+            revisions.record_entries(to_update + new_entries)
+        for (index, op), entry in zip(creates, new_entries):
+            results[index] = dict(saved_entry_json('created', entry, op.get('content', '')),
+                                  index=index, op='create', ref=op.get('ref'))
+
+    return JsonResponse({'status': 'ok', 'results': results})
+
+
+@login_required
+def api_entry_detail(request, entry_id):
+    """Return a single entry in full (the list endpoint may omit content)."""
+    fields = list(ENTRY_FIELDS)
+    row = Entry.objects.filter(id=entry_id, user=request.user).values(
+        *{ENTRY_FIELDS[f] for f in fields}).first()
+    if row is None:
+        return JsonResponse({'status': 'error', 'message': 'Entry not found or you do not have permission'}, status=404)
+    return JsonResponse(serialize_entry(row, fields))
+
+
+def revision_json(revision):
+    return {
+        'number': revision.number, 'version': revision.version, 'title': revision.title,
+        'date': revision.saved_at.isoformat(),
+    }
+
+
+@login_required
+def api_entry_revisions(request, entry_id):
+    """List an entry's saved revisions, newest first (no content)."""
+    if not Entry.objects.filter(id=entry_id, user=request.user).exists():
+        return JsonResponse({'status': 'error', 'message': 'Entry not found or you do not have permission'}, status=404)
+    history = EntryRevision.objects.filter(entry_id=entry_id).order_by('-number').only(
+        'number', 'version', 'title', 'saved_at')
+    return JsonResponse({'revisions': [revision_json(revision) for revision in history]})
+
+
+@login_required
+def api_entry_revision(request, entry_id, number):
+    """One revision in full, rebuilt from its keyframe."""
+    if not Entry.objects.filter(id=entry_id, user=request.user).exists():
+        return JsonResponse({'status': 'error', 'message': 'Entry not found or you do not have permission'}, status=404)
+    revision = revisions.get_revision(entry_id, number)
+    if revision is None:
+        return JsonResponse({'status': 'error', 'message': 'Revision not found'}, status=404)
+    return JsonResponse(dict(revision_json(revision), content=revision.content))
+
+
+@login_required
+@ratelimit.ratelimit(entries_write_limit, methods=('POST',))
+def api_entry_revision_restore(request, entry_id, number):
+    """Make a revision's title and content current again.
+
+    Body (optional): ``{"version": n}``; if it isn't the stored version
+    nothing is written and 409 returns the current one. The restore is
+    saved as a new revision, so it can be undone the same way.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'status': 'error', 'message': 'Invalid request method'}, status=400)
+    try:
+        data = json.loads(request.body or '{}')
+        version = data.get('version')
+        if version is not None and not isinstance(version, int):
+            raise ValueError('version must be an integer')
+    except (ValueError, AttributeError) as e:
+        return JsonResponse({'status': 'error', 'message': f'Invalid request: {e}'}, status=400)
+
+    with transaction.atomic():
+        try:
+            entry = Entry.objects.select_for_update().get(id=entry_id, user=request.user)
+        except Entry.DoesNotExist:
+            return JsonResponse({'status': 'error', 'message': 'Entry not found or you do not have permission'}, status=404)
+        if version is not None and entry.version != version:
+            return JsonResponse({'status': 'conflict', 'id': entry.id, 'version': entry.version}, status=409)
+        revision = revisions.get_revision(entry.pk, number)
+        if revision is None:
+            return JsonResponse({'status': 'error', 'message': 'Revision not found'}, status=404)
+
+        entry.title = revision.title
+        entry.content = revision.content
+        entry.ip_address = get_client_ip(request)
+        entry.version += 1
+        # Keep the state being replaced as its own revision.
+        entry.coalesce_revisions = False
+        entry.save()
+
+    return JsonResponse(dict(saved_entry_json('restored', entry, None), title=entry.title, content=entry.content))
+
+@login_required
+def api_entries_search(request):
+    """Full-text search over the user's entries, ranked, with highlighted snippets.
+
+    ``?q=`` takes web-search syntax ("exact phrase", -exclude, OR);
+    ``?limit=`` caps the results (default 20, max 100).
+    """
+    query = request.GET.get('q', '').strip()
+    if not query:
+        return JsonResponse({'status': 'error', 'message': 'q is required'}, status=400)
+    try:
+        limit = min(max(int(request.GET.get('limit', search.DEFAULT_LIMIT)), 1), search.MAX_LIMIT)
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'limit must be an integer'}, status=400)
+
+    results = [
+        {
+            'id': row['id'],
+            'title': row['title'],
+            'date': row['created_at'],
+            'durationStr': row['duration_str'],
+            'rank': row['rank'],
+            'snippet': row['snippet'],
+        }
+        for row in search.search_entries(request.user, query, limit)
+    ]
+    return JsonResponse({'query': query, 'results': results})
+
+
+@login_required
+def export_entries(request, format='zip'):
+    """Stream the user's entries in any registered export format.
+
+    ``?since=`` takes the ETag of a previous export, or an ISO datetime,
+    and limits the export to entries edited after it; such a partial
+    export is named differently and carries ``X-Export-Since``. Nothing
+    changed since then answers 304. ``If-None-Match`` is only ever
+    answered with 304 or the full export, never a partial one.
+    """
+    try:
+        export_format = get_format(format)
+        since = decode_watermark(request.GET.get('since'))
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+
+    # Taken before streaming starts: anything saved meanwhile is newer than
+    # the watermark and simply lands in the next incremental export too.
+    watermark = latest_change(request.user)
+    if watermark is None:
         return JsonResponse({'error': 'No entries to export'}, status=404)
+    etag = encode_watermark(watermark)
+    if (since is not None and watermark <= since) or (
+            since is None and etag in parse_etags(request.headers.get('If-None-Match', ''))):
+        response = HttpResponse(status=304)
+    else:
+        response = StreamingHttpResponse(
+            export_format.stream(export_queryset(request.user, since)),
+            content_type=export_format.content_type,
+        )
+        filename = export_format.filename
+        if since is not None:
+            filename = export_format.incremental_filename(since)
+            response['X-Export-Since'] = since.isoformat()
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response['ETag'] = etag
+    # Backups are personal and a partial one must never stand in for a full one.
+    patch_cache_control(response, private=True, no_store=True)
+    return response
 
-    # Create zip buffer
-    buffer = io.BytesIO()
-    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-        for entry in entries:
-            # Format: 'Title - Date.txt'
-            date_str = entry.created_at.strftime('%Y-%m-%d')
-            # Safe filename: replace non-alphanumeric chars (keep spaces/dashes)
-            safe_title = "".join([c for c in entry.title if c.isalnum() or c in (' ', '-', '_')]).strip()
-            filename = f"{date_str} - {safe_title}.txt"
-            
-            # Content: Title, Date, Content
-            clean_content = strip_tags(entry.content)
-            file_content = f"Title: {entry.title}\nDate: {entry.created_at.strftime('%Y-%m-%d %H:%M')}\nDuration: {entry.duration_str}\n\n{clean_content}"
-            
-            zip_file.writestr(filename, file_content)
-    
-    buffer.seek(0)
-    response = HttpResponse(buffer, content_type='application/zip')
-    response['Content-Disposition'] = 'attachment; filename="journal_backup.zip"'
+def export_job_json(job):
+    """Public status document for an ExportJob."""
+    ready = job.status == ExportJob.STATUS_READY
+    return {
+        'id': job.id,
+        'format': job.format,
+        'status': job.status,
+        'size': job.size if ready else None,
+        'createdAt': job.created_at.isoformat(),
+        'finishedAt': job.finished_at.isoformat() if job.finished_at else None,
+        'downloadUrl': reverse('export_download', args=[job.id]) if ready else None,
+        'error': job.error or None,
+    }
+
+
+@login_required
+def api_exports(request):
+    """POST queues a background export (or returns an up-to-date one).
+
+    The body may name a format: ``{"format": "jsonl"}`` (default zip).
+    """
+    if request.method != 'POST':
+        return JsonResponse({'status': 'error', 'message': 'Invalid request method'}, status=400)
+
+    try:
+        data = json.loads(request.body) if request.body else {}
+        if not isinstance(data, dict):
+            raise ValueError('Request body must be a JSON object')
+        name = data.get('format', 'zip')
+        if not isinstance(name, str):
+            raise ValueError('format must be a string')
+        export_format = get_format(name)
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+
+    if not Entry.objects.filter(user=request.user).exists():
+        return JsonResponse({'error': 'No entries to export'}, status=404)
+
+    job, created = request_export(request.user, export_format.name)
+    return JsonResponse(export_job_json(job), status=202 if created else 200)
+
+
+@login_required
+def api_export_status(request, job_id):
+    """Poll a background export."""
+    try:
+        job = ExportJob.objects.get(id=job_id, user=request.user)
+    except ExportJob.DoesNotExist:
+        return JsonResponse({'status': 'error', 'message': 'Export not found'}, status=404)
+    return JsonResponse(export_job_json(job))
+
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def read_range(f, start, length, block_size=64 * 1024):
+    """Yield ``length`` bytes of ``f`` from ``start``, closing it afterwards."""
+    try:
+        f.seek(start)
+        while length > 0:
+            data = f.read(min(block_size, length))
+            if not data:
+                break
+            length -= len(data)
+            yield data
+    finally:
+        f.close()
+
+
+def ranged_file_response(request, path, content_type, filename, etag):
+    """Serve a file, honouring a single ``Range: bytes=`` request so downloads can resume."""
+    size = os.path.getsize(path)
+    match = RANGE_RE.match(request.headers.get('Range', ''))
+    if_range = request.headers.get('If-Range')
+
+    if match and any(match.groups()) and (if_range is None or if_range == etag):
+        first, last = match.groups()
+        if first:
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+        else:
+            # Suffix range: the final N bytes.
+            start = max(size - int(last), 0)
+            end = size - 1
+        if start > end or start >= size:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+        response = StreamingHttpResponse(
+            read_range(open(path, 'rb'), start, end - start + 1),
+            status=206, content_type=content_type,
+        )
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = str(end - start + 1)
+    else:
+        response = StreamingHttpResponse(read_range(open(path, 'rb'), 0, size), content_type=content_type)
+        response['Content-Length'] = str(size)
+
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
     return response
 
+
+@login_required
+def export_download(request, job_id):
+    """Download a finished background export, with HTTP Range support."""
+    try:
+        job = ExportJob.objects.get(id=job_id, user=request.user, status=ExportJob.STATUS_READY)
+    except ExportJob.DoesNotExist:
+        return JsonResponse({'status': 'error', 'message': 'Export not found or not ready'}, status=404)
+    if not os.path.exists(job.file_path):
+        return JsonResponse({'status': 'error', 'message': 'Export expired, please request a new one'}, status=410)
+
+    export_format = get_format(job.format)
+    return ranged_file_response(
+        request, job.file_path, export_format.content_type, export_format.filename, f'"{job.fingerprint}"')
+
+
+LANGUAGE_RE = re.compile(r'^[A-Za-z]{2,3}(-[A-Za-z]{2,4})?$')
+MAX_TRANSLATE_SEGMENTS = 50
+
+
+def translation_error_response(error):
+    """Map a TranslationError onto the proxy's JSON error responses."""
+    if isinstance(error, translation.TranslationTimeout):
+        return JsonResponse({'error': 'Translation service timed out'}, status=504)
+    if isinstance(error, translation.TranslationBusy):
+        return JsonResponse({'error': 'Translation service busy, try again shortly'}, status=503)
+    return JsonResponse({'error': str(error)}, status=502)
+
+
+@ratelimit.ratelimit(translate_limit)
 def proxy_translate(request):
-    """Proxy for Google Translate (from original server.py)."""
+    """Proxy for Google Translate (from original server.py), cached and pooled."""
     text = request.GET.get('text', '')
     target = request.GET.get('target', 'es')
-    
+
     if not text:
         return JsonResponse({'error': 'No text provided'}, status=400)
-    
+    if not LANGUAGE_RE.match(target):
+        return JsonResponse({'error': 'Invalid target language'}, status=400)
+
     try:
-        url = f"https://translate.googleapis.com/translate_a/single?client=gtx&sl=auto&tl={target}&dt=t&q={urllib.parse.quote(text)}"
-        req = urllib.request.Request(url)
-        req.add_header('User-Agent', 'Mozilla/5.0')
-        
-        with urllib.request.urlopen(req) as response:
-            data = response.read()
-            raw_json = json.loads(data.decode('utf-8'))
-            
-            translated_text = ""
-            if raw_json and isinstance(raw_json, list):
-                for segment in raw_json[0]:
-                    if segment:
-                        translated_text += segment[0]
-            
-            return JsonResponse({'translatedText': translated_text})
-            
-    except Exception as e:
-        return JsonResponse({'error': str(e)}, status=500)
+        return JsonResponse({'translatedText': translation.translate(text, target)})
+    except translation.TranslationError as e:
+        return translation_error_response(e)
+
+
+@ratelimit.ratelimit(translate_limit)
+async def proxy_translate_async(request):
+    """Async translate proxy for the ASGI app.
+
+    GET takes ``text``/``target`` like proxy_translate. POST takes
+    ``{"segments": [...], "target": "es"}`` and returns
+    ``{"translations": [...]}`` in the same order. Identical concurrent
+    requests share one upstream call and nearby segments are batched.
+    """
+    if request.method == 'POST':
+        try:
+            data = json.loads(request.body)
+            segments = data.get('segments')
+            target = data.get('target', 'es')
+        except (ValueError, AttributeError):
+            return JsonResponse({'error': 'Invalid JSON body'}, status=400)
+        if (not isinstance(segments, list) or not segments or len(segments) > MAX_TRANSLATE_SEGMENTS
+                or not all(isinstance(s, str) and s for s in segments)):
+            return JsonResponse(
+                {'error': f'segments must be 1-{MAX_TRANSLATE_SEGMENTS} non-empty strings'}, status=400)
+    else:
+        segments = [request.GET.get('text', '')]
+        target = request.GET.get('target', 'es')
+        if not segments[0]:
+            return JsonResponse({'error': 'No text provided'}, status=400)
+
+    if not isinstance(target, str) or not LANGUAGE_RE.match(target):
+        return JsonResponse({'error': 'Invalid target language'}, status=400)
+
+    try:
+        results = await translation.translate_async(segments, target)
+    except translation.TranslationError as e:
+        return translation_error_response(e)
+
+    if request.method == 'POST':
+        return JsonResponse({'translations': results})
+    return JsonResponse({'translatedText': results[0]})
 
 
 @login_required
@@ -142,7 +834,7 @@ def delete_entry(request, entry_id):
     """Delete a journal entry (only owner can delete)."""
     if request.method == 'DELETE' or request.method == 'POST':
         try:
-            entry = Entry.objects.get(id=entry_id, user=request.user)
+            entry = Entry.objects.summary().get(id=entry_id, user=request.user)
             entry.delete()
             return JsonResponse({'status': 'deleted', 'message': 'Entry deleted successfully'})
         except Entry.DoesNotExist:
@@ -150,12 +842,18 @@ def delete_entry(request, entry_id):
     return JsonResponse({'status': 'error', 'message': 'Invalid request method'}, status=400)
 
 
-from allauth.account.views import PasswordResetView
+from allauth.account.views import LoginView, PasswordResetView
 from django.contrib import messages
 from django.shortcuts import redirect
 
+
+def wait_message(seconds):
+    hours, rest = divmod(seconds, 3600)
+    return f"{hours}h {rest // 60}m" if hours else f"{max(rest // 60, 1)}m"
+
+
 class RateLimitedPasswordResetView(PasswordResetView):
-    """Custom password reset view with rate limiting (once per 24 hours)"""
+    """Custom password reset view with rate limiting (per email and per IP)"""
     
     def form_valid(self, form):
         from .models import PasswordResetRequest
@@ -163,23 +861,34 @@ class RateLimitedPasswordResetView(PasswordResetView):
         email = form.cleaned_data.get('email')
         ip_address = get_client_ip(self.request)
         
-        # Check rate limiting
-        can_request, hours_remaining = PasswordResetRequest.can_request_reset(email)
+        # Check rate limiting (settings.RATE_LIMITS, counted in the cache)
+        wait = ratelimit.hit({'password_reset_email': email, 'password_reset_ip': ip_address})
         
-        if not can_request:
-            # User has already requested a reset within 24 hours
-            hours = int(hours_remaining)
-            minutes = int((hours_remaining - hours) * 60)
-            
+        if wait:
             messages.error(
                 self.request,
-                f"You can only request a password reset once per 24 hours. "
-                f"Please try again in {hours}h {minutes}m."
+                f"Too many password reset requests. "
+                f"Please try again in {wait_message(wait)}."
             )
             return redirect('account_reset_password')
         
-        # Create reset request record
+        # Keep an audit record (pruned by manage.py prune_password_resets)
         PasswordResetRequest.create_request(email, ip_address)
         
         # Proceed with normal password reset
         return super().form_valid(form)
+
+
+class RateLimitedLoginView(LoginView):
+    """Login view that limits attempts per email and per IP."""
+
+    def post(self, request, *args, **kwargs):
+        # Counted before authenticating, so failed guesses count too.
+        wait = ratelimit.hit({
+            'login_email': request.POST.get('login', '').strip(),
+            'login_ip': get_client_ip(request),
+        })
+        if wait:
+            messages.error(request, f"Too many login attempts. Please try again in {wait_message(wait)}.")
+            return redirect('account_login')
+        return super().post(request, *args, **kwargs)
@@ -3,6 +3,11 @@ ASGI config for journal_core project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Run it with an ASGI server (e.g. ``gunicorn journal_core.asgi:application
+-k uvicorn.workers.UvicornWorker``) and set TRANSLATE_ASYNC=True so that
+/api/translate is served by the async proxy, which shares upstream calls
+between concurrent requests instead of tying up a worker per translation.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/6.0/howto/deployment/asgi/
 """
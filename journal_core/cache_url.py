@@ -0,0 +1,80 @@
+"""
+Build a Django ``CACHES`` entry from a single URL, in the style of
+dj_database_url.
+
+Supported URLs:
+
+    locmem://[name]                 per-process memory (Django's default)
+    file:///absolute/path           FileBasedCache, shared by workers on one box
+    db://[table_name]               DatabaseCache (run ``createcachetable``)
+    redis://[:password@]host:port/db
+    rediss://...                    RedisCache over TLS
+    dummy://                        caching disabled
+
+Query parameters ``timeout``, ``key_prefix``, ``version``, ``max_entries``
+and ``cull_frequency`` map onto the matching cache settings, e.g.
+``redis://localhost:6379/0?timeout=600&key_prefix=journal``.
+"""
+
+import os
+from urllib.parse import parse_qs, urlsplit, urlunsplit
+
+DEFAULT_ENV = 'CACHE_URL'
+
+BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+    'db': 'django.core.cache.backends.db.DatabaseCache',
+    'redis': 'django.core.cache.backends.redis.RedisCache',
+    'rediss': 'django.core.cache.backends.redis.RedisCache',
+    'dummy': 'django.core.cache.backends.dummy.DummyCache',
+}
+
+# Query parameters that become OPTIONS rather than top-level settings.
+OPTION_PARAMS = {
+    'max_entries': 'MAX_ENTRIES',
+    'cull_frequency': 'CULL_FREQUENCY',
+}
+
+
+def parse(url):
+    """Parse a cache URL into a dict suitable for ``CACHES['default']``."""
+    parts = urlsplit(url)
+    scheme = parts.scheme
+    if scheme not in BACKENDS:
+        raise ValueError(f"Unsupported cache scheme '{scheme}' in CACHE_URL")
+
+    config = {'BACKEND': BACKENDS[scheme]}
+
+    if scheme == 'locmem':
+        config['LOCATION'] = parts.netloc or parts.path.lstrip('/')
+    elif scheme == 'file':
+        config['LOCATION'] = parts.netloc + parts.path
+    elif scheme == 'db':
+        config['LOCATION'] = parts.netloc or parts.path.lstrip('/') or 'django_cache'
+    elif scheme in ('redis', 'rediss'):
+        # RedisCache takes the server URL itself, minus our query parameters.
+        config['LOCATION'] = urlunsplit((scheme, parts.netloc, parts.path, '', ''))
+
+    options = {}
+    for key, values in parse_qs(parts.query).items():
+        value = values[-1]
+        if key == 'timeout':
+            config['TIMEOUT'] = None if value.lower() == 'none' else int(value)
+        elif key == 'key_prefix':
+            config['KEY_PREFIX'] = value
+        elif key == 'version':
+            config['VERSION'] = int(value)
+        elif key in OPTION_PARAMS:
+            options[OPTION_PARAMS[key]] = int(value)
+        else:
+            raise ValueError(f"Unsupported CACHE_URL parameter '{key}'")
+    if options:
+        config['OPTIONS'] = options
+
+    return config
+
+
+def config(env=DEFAULT_ENV, default='locmem://'):
+    """Return the cache config from the ``env`` variable, or ``default``."""
+    return parse(os.environ.get(env) or default)
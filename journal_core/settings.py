@@ -27,6 +27,7 @@ ALLOWED_HOSTS = os.getenv('ALLOWED_HOSTS', '*').split(',') if os.getenv('ALLOWED
 # Application definition
 
 import dj_database_url
+from journal_core import cache_url
 
 # Application definition
 
@@ -53,10 +54,12 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',  # Serve static files in production
+    'journal.middleware.PerformanceMiddleware',  # Per-view latency/SQL histograms
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'journal.middleware.ProfilingMiddleware',  # Opt-in cProfile runs (staff flag / sampling)
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'allauth.account.middleware.AccountMiddleware',
@@ -95,6 +98,125 @@ DATABASES = {
     )
 }
 
+# Cache
+# CACHE_URL picks the backend (see journal_core/cache_url.py), e.g.
+# redis://localhost:6379/0, file:///var/tmp/journal_cache or db://django_cache.
+# The locmem default is per-process: with several gunicorn workers, anything
+# that must be visible to all of them (site config, rate limits) needs a
+# shared backend; `manage.py check --deploy` warns while it is locmem.
+CACHES = {
+    'default': cache_url.config(default='locmem://'),
+}
+
+# Sessions: 'db' (default), 'cached_db' (cache in front of the table, reads
+# skip django_session on a hit) or 'cache' (cache only, requires a persistent
+# shared CACHE_URL or sessions are lost on restart).
+SESSION_BACKEND = os.getenv('SESSION_BACKEND', 'db')
+if SESSION_BACKEND not in ('db', 'cached_db', 'cache'):
+    raise ValueError(f"Unsupported SESSION_BACKEND '{SESSION_BACKEND}'")
+SESSION_ENGINE = f'django.contrib.sessions.backends.{SESSION_BACKEND}'
+
+# Entry's covering index uses INCLUDE columns, which only Postgres honours;
+# other backends create it as a plain composite index.
+SILENCED_SYSTEM_CHECKS = ['models.W040']
+
+# Seconds each worker may serve SiteConfiguration from its own memory before
+# re-reading the shared cache (bounds how long a maintenance toggle takes to
+# reach every worker).
+SITE_CONFIG_LOCAL_TTL = int(os.getenv('SITE_CONFIG_LOCAL_TTL', '5'))
+
+# Admin dashboard numbers come from counters kept up to date by signals
+# (journal/stats.py); the assembled snapshot is cached this many seconds.
+STATS_CACHE_TTL = int(os.getenv('STATS_CACHE_TTL', '30'))
+
+# GET /api/entries pages are cached per (user, journal version, query) for
+# this long; pages larger than the byte cap are streamed but not cached.
+ENTRIES_PAGE_CACHE_TTL = int(os.getenv('ENTRIES_PAGE_CACHE_TTL', '300'))
+ENTRIES_PAGE_CACHE_MAX_BYTES = int(os.getenv('ENTRIES_PAGE_CACHE_MAX_BYTES', str(1024 * 1024)))
+
+# Entry content of at least ENTRY_CONTENT_COMPRESS_MIN_BYTES is stored
+# compressed (journal/compression.py): 'zlib', 'zstd' (needs the zstandard
+# package) or 'none'. Existing rows: `python manage.py compress_entries`.
+ENTRY_CONTENT_CODEC = os.getenv('ENTRY_CONTENT_CODEC', 'zlib')
+ENTRY_CONTENT_COMPRESS_MIN_BYTES = int(os.getenv('ENTRY_CONTENT_COMPRESS_MIN_BYTES', '1024'))
+
+# Entry revision history (journal/revisions.py): a full keyframe every
+# KEYFRAME_INTERVAL revisions and diffs in between; saves within
+# COALESCE_SECONDS of the newest revision are folded into it; each entry
+# keeps about ENTRY_REVISION_LIMIT revisions.
+ENTRY_REVISION_KEYFRAME_INTERVAL = int(os.getenv('ENTRY_REVISION_KEYFRAME_INTERVAL', '20'))
+ENTRY_REVISION_COALESCE_SECONDS = int(os.getenv('ENTRY_REVISION_COALESCE_SECONDS', '120'))
+ENTRY_REVISION_LIMIT = int(os.getenv('ENTRY_REVISION_LIMIT', '200'))
+
+# Request instrumentation (journal/middleware.py). Histograms are served to
+# admins at /admin/metrics/ in Prometheus format; requests slower than
+# PERF_SLOW_REQUEST_MS (0 = never) are logged to 'journal.perf'.
+# PERF_TRACE_MEMORY records peak allocations with tracemalloc, which slows
+# every request noticeably, so only turn it on while investigating.
+PERF_METRICS_ENABLED = os.getenv('PERF_METRICS_ENABLED', 'True') == 'True'
+PERF_SLOW_REQUEST_MS = int(os.getenv('PERF_SLOW_REQUEST_MS', '1000'))
+PERF_TRACE_MEMORY = os.getenv('PERF_TRACE_MEMORY', 'False') == 'True'
+
+# Request profiling (journal.middleware.ProfilingMiddleware): staff can add
+# ?_profile=1 or an X-Profile: 1 header, and SiteConfiguration sets a sample
+# rate. Profiles are kept in the database (newest PROFILE_MAX_STORED) and
+# browsed under Request Profiles in the admin. False removes the middleware.
+PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', 'True') == 'True'
+PROFILE_MAX_STORED = int(os.getenv('PROFILE_MAX_STORED', '200'))
+
+# Rate limits (journal/ratelimit.py) as "<count>/<period>", period in s/m/h/d.
+# Counters live in the default cache when it counts atomically (Redis,
+# locmem), else in the RateLimitCounter table. Point CACHE_URL at a shared
+# backend when running several workers; locmem counts per worker.
+RATE_LIMIT_ENABLED = os.getenv('RATE_LIMIT_ENABLED', 'True') == 'True'
+RATE_LIMITS = {
+    'password_reset_email': os.getenv('RATE_LIMIT_PASSWORD_RESET_EMAIL', '1/24h'),
+    'password_reset_ip': os.getenv('RATE_LIMIT_PASSWORD_RESET_IP', '10/1h'),
+    'login_email': os.getenv('RATE_LIMIT_LOGIN_EMAIL', '10/15m'),
+    'login_ip': os.getenv('RATE_LIMIT_LOGIN_IP', '30/15m'),
+    'entries_write': os.getenv('RATE_LIMIT_ENTRIES_WRITE', '120/1m'),
+    'translate_user': os.getenv('RATE_LIMIT_TRANSLATE_USER', '120/1m'),
+    'translate_ip': os.getenv('RATE_LIMIT_TRANSLATE_IP', '300/1m'),
+}
+
+# Full-text search (journal/search.py). 'auto' uses the database's own engine
+# (Postgres tsvector, SQLite FTS5, else icontains); 'inverted' uses the
+# pure-Python index in journal/invindex.py, stored under SEARCH_INDEX_DIR and
+# compacted once its update log exceeds SEARCH_INDEX_LOG_MAX bytes.
+SEARCH_BACKEND = os.getenv('SEARCH_BACKEND', 'auto')
+if SEARCH_BACKEND not in ('auto', 'inverted', 'basic'):
+    raise ValueError(f"Unsupported SEARCH_BACKEND '{SEARCH_BACKEND}'")
+SEARCH_INDEX_DIR = os.getenv('SEARCH_INDEX_DIR', str(BASE_DIR / 'search_index'))
+SEARCH_INDEX_LOG_MAX = int(os.getenv('SEARCH_INDEX_LOG_MAX', str(16 * 1024 * 1024)))
+
+# Background exports
+# Finished archives are written under EXPORT_ROOT. EXPORT_BACKEND 'thread'
+# builds them in a small in-process pool; 'command' leaves jobs pending for
+# `python manage.py run_export_jobs` (e.g. a cron or worker service).
+EXPORT_ROOT = os.getenv('EXPORT_ROOT', str(BASE_DIR / 'exports'))
+EXPORT_BACKEND = os.getenv('EXPORT_BACKEND', 'thread')
+EXPORT_THREADS = int(os.getenv('EXPORT_THREADS', '1'))
+# Pending/running jobs untouched for this long are treated as abandoned (a
+# worker restart loses the thread pool's queue) and queued again.
+EXPORT_STALE_MINUTES = int(os.getenv('EXPORT_STALE_MINUTES', '30'))
+
+# Translation proxy (/api/translate)
+TRANSLATE_URL = os.getenv('TRANSLATE_URL', 'https://translate.googleapis.com/translate_a/single')
+TRANSLATE_CONNECT_TIMEOUT = float(os.getenv('TRANSLATE_CONNECT_TIMEOUT', '3'))
+TRANSLATE_READ_TIMEOUT = float(os.getenv('TRANSLATE_READ_TIMEOUT', '8'))
+TRANSLATE_POOL_SIZE = int(os.getenv('TRANSLATE_POOL_SIZE', '4'))
+TRANSLATE_CACHE_SIZE = int(os.getenv('TRANSLATE_CACHE_SIZE', '5000'))
+TRANSLATE_CACHE_TTL = int(os.getenv('TRANSLATE_CACHE_TTL', '86400'))
+# Async proxy (ASGI): serve /api/translate from the async view, cap
+# concurrent upstream calls per process, shed load past MAX_PENDING, and
+# batch segments arriving within BATCH_WINDOW seconds into one call.
+TRANSLATE_ASYNC = os.getenv('TRANSLATE_ASYNC', 'False') == 'True'
+TRANSLATE_MAX_CONCURRENCY = int(os.getenv('TRANSLATE_MAX_CONCURRENCY', '4'))
+TRANSLATE_MAX_PENDING = int(os.getenv('TRANSLATE_MAX_PENDING', '200'))
+TRANSLATE_BATCH_WINDOW = float(os.getenv('TRANSLATE_BATCH_WINDOW', '0.02'))
+TRANSLATE_BATCH_SIZE = int(os.getenv('TRANSLATE_BATCH_SIZE', '16'))
+TRANSLATE_BATCH_CHARS = int(os.getenv('TRANSLATE_BATCH_CHARS', '1500'))
+
 # Jazzmin UI Settings
 JAZZMIN_SETTINGS = {
     "site_title": "Journal Admin",
@@ -106,6 +228,7 @@ JAZZMIN_SETTINGS = {
     "topmenu_links": [
         {"name": "Home",  "url": "admin:index", "permissions": ["auth.view_user"]},
         {"name": "View Site", "url": "/", "new_window": True},
+        {"name": "Activity", "url": "admin:activity", "permissions": ["auth.view_user"]},
     ],
     "show_ui_builder": False,
 }
@@ -245,6 +368,11 @@ LOGGING = {
             'level': 'ERROR',
             'propagate': False,
         },
+        'journal.perf': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
     },
 }
 
@@ -1,11 +1,12 @@
 from django.contrib import admin
 from django.urls import path, include
-from journal.views import RateLimitedPasswordResetView
+from journal.views import RateLimitedLoginView, RateLimitedPasswordResetView
 from journal.admin import admin_site  # Import custom admin site
 
 urlpatterns = [
     path('admin/', admin_site.urls),  # Use custom admin site
-    # Custom password reset with rate limiting (must be before allauth urls)
+    # Custom login and password reset with rate limiting (must be before allauth urls)
+    path('accounts/login/', RateLimitedLoginView.as_view(), name='account_login'),
     path('accounts/password/reset/', RateLimitedPasswordResetView.as_view(), name='account_reset_password'),
     path('accounts/', include('allauth.urls')), # Google Login
     path('', include('journal.urls')), # Main App